@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import inc, set_gauge
+
+# Per worker process: with 4 workers the server-wide figures are 4x these
+LLM_MAX_CONCURRENT = int(os.getenv('LLM_MAX_CONCURRENT', '8'))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '16'))
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '10'))
+CHAT_SESSION_PER_MINUTE = float(os.getenv('CHAT_SESSION_PER_MINUTE', '20'))
+CHAT_SESSION_BURST = int(os.getenv('CHAT_SESSION_BURST', '8'))
+# Whole schools can sit behind one NAT address, so the IP limit is much looser
+CHAT_IP_PER_MINUTE = float(os.getenv('CHAT_IP_PER_MINUTE', '240'))
+CHAT_IP_BURST = int(os.getenv('CHAT_IP_BURST', '60'))
+
+
+class ConcurrencyGate:
+    """Caps concurrent calls; extra callers wait in a bounded queue or are shed"""
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _report(self):
+        set_gauge('davgpt_gate_in_flight', self.in_flight, gate=self.name)
+        set_gauge('davgpt_gate_queue_depth', self.waiting, gate=self.name)
+
+    def acquire(self):
+        """Take a slot; returns False (and counts a shed) if the queue is full or the wait times out"""
+        with self.condition:
+            if self.in_flight >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    inc('davgpt_gate_shed_total', gate=self.name, reason='queue_full')
+                    return False
+                self.waiting += 1
+                self._report()
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.in_flight >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            inc('davgpt_gate_shed_total', gate=self.name, reason='queue_timeout')
+                            return False
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self._report()
+            return True
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self._report()
+            self.condition.notify()
+
+    @contextmanager
+    def slot(self):
+        """with gate.slot() as admitted: ... -- admitted is False when the call was shed"""
+        admitted = self.acquire()
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+
+class RateLimiter:
+    """Token buckets per key (session id or client IP); idle buckets are evicted oldest-first"""
+
+    def __init__(self, name, per_minute, burst, max_keys=10000):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        if not allowed:
+            inc('davgpt_rate_limited_total', limiter=self.name)
+        return allowed
+
+    def retry_after(self, key):
+        """Seconds until the key has a token again"""
+        with self.lock:
+            tokens, _ = self.buckets.get(key, (self.burst, 0))
+        return max(1, int((1 - tokens) / self.rate + 0.999)) if self.rate else 60
+
+
+llm_gate = ConcurrencyGate('llm', LLM_MAX_CONCURRENT, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT)
+session_limiter = RateLimiter('session', CHAT_SESSION_PER_MINUTE, CHAT_SESSION_BURST)
+ip_limiter = RateLimiter('ip', CHAT_IP_PER_MINUTE, CHAT_IP_BURST)
@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from faq_store import faq_key
+from file_lock import file_lock
+from metrics import inc
+from models import db, Conversation, ConversationRollup, UnansweredQuery, AnalyticsWatermark
+
+# Seconds between rollup runs in each worker; only one worker runs at a time (file lock)
+ANALYTICS_INTERVAL = int(os.getenv('ANALYTICS_INTERVAL', '300'))
+ANALYTICS_LOCK = os.getenv('ANALYTICS_LOCK', 'analytics.lock')
+# Conversations folded in per transaction
+ROLLUP_BATCH = 5000
+# Conversations newer than this are left for the next run, so rows still being committed are not skipped
+ROLLUP_LAG = timedelta(seconds=60)
+# Top retrieval score below which a knowledge base answer counts as unanswered (see SimpleRAG.score_documents)
+LOW_SCORE = int(os.getenv('ANALYTICS_LOW_SCORE', '6'))
+# Overlap (Dice: twice the shared content words over both counts) two questions need to be clustered;
+# "have kids pool swimming" and "children pool swimming" score 4/7. Questions are too short for SimHash
+CLUSTER_OVERLAP = 0.5
+LATENCY_BOUNDS_MS = (250, 500, 1000, 2500, 5000, 10000, 20000, 60000)
+
+CACHE_PATHS = {'faq', 'cached'}
+# Answered without the LLM that should have answered (see davgpt_fallbacks_total)
+FALLBACK_PATHS = {'cached', 'retrieval_only', 'canned', 'error'}
+# Answered without searching the knowledge base, so their scores say nothing
+NO_SEARCH_PATHS = {'human', 'holidays', 'contact', 'timings', 'faq'}
+
+
+def is_unanswered(row):
+    """Failed, or searched the knowledge base and its best match scored low.
+
+    Questions the router calls general are included: "is there a swimming pool?" has no school
+    keyword but is exactly the kind of gap admins fill with a manual entry.
+    """
+    if row.path == 'error':
+        return True
+    if row.path is None or row.path in NO_SEARCH_PATHS:
+        return False
+    return (row.score or 0) < LOW_SCORE
+
+
+def latency_percentile(histogram, fraction):
+    """Upper bound (ms) of the bucket holding the given fraction of requests, or None"""
+    total = sum(histogram)
+    if not total:
+        return None
+    seen = 0
+    for bound, count in zip(LATENCY_BOUNDS_MS + (None,), histogram):
+        seen += count
+        if seen >= fraction * total:
+            return bound or LATENCY_BOUNDS_MS[-1]
+    return LATENCY_BOUNDS_MS[-1]
+
+
+class QueryClusters:
+    """Cluster heads of one site, found by word overlap through an inverted index"""
+
+    def __init__(self):
+        self.heads = {}
+        self.by_word = {}
+
+    def find(self, words):
+        """id of the head overlapping words the most, if by at least CLUSTER_OVERLAP"""
+        shared = Counter(head for word in words for head in self.by_word.get(word, ()))
+        best, best_overlap = None, 0
+        for head, count in shared.items():
+            overlap = 2 * count / (len(words) + len(self.heads[head]))
+            if overlap > best_overlap:
+                best, best_overlap = head, overlap
+        return best if best_overlap >= CLUSTER_OVERLAP else None
+
+    def add(self, head, words):
+        self.heads[head] = words
+        for word in words:
+            self.by_word.setdefault(word, []).append(head)
+
+
+class Totals:
+    """Counts for one (period, bucket, site), merged into its ConversationRollup row"""
+
+    def __init__(self):
+        self.conversations = 0
+        self.cache_hits = 0
+        self.fallbacks = 0
+        self.unanswered = 0
+        self.latency_count = 0
+        self.latency_ms_total = 0
+        self.latency_histogram = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+        self.languages = Counter()
+        self.intents = Counter()
+
+    def add(self, row, unanswered):
+        self.conversations += 1
+        self.cache_hits += row.path in CACHE_PATHS
+        self.fallbacks += row.path in FALLBACK_PATHS
+        self.unanswered += unanswered
+        self.languages[row.language or 'en'] += 1
+        self.intents[row.intent or 'unknown'] += 1
+        if row.latency_ms is not None:
+            self.latency_count += 1
+            self.latency_ms_total += row.latency_ms
+            bucket = next((i for i, bound in enumerate(LATENCY_BOUNDS_MS) if row.latency_ms <= bound),
+                          len(LATENCY_BOUNDS_MS))
+            self.latency_histogram[bucket] += 1
+
+    def merge_into(self, rollup):
+        for name in ('conversations', 'cache_hits', 'fallbacks', 'unanswered', 'latency_count', 'latency_ms_total'):
+            setattr(rollup, name, (getattr(rollup, name) or 0) + getattr(self, name))
+        histogram = json.loads(rollup.latency_histogram or 'null') or [0] * len(self.latency_histogram)
+        rollup.latency_histogram = json.dumps([a + b for a, b in zip(histogram, self.latency_histogram)])
+        for name in ('languages', 'intents'):
+            counts = Counter(json.loads(getattr(rollup, name) or '{}'))
+            counts.update(getattr(self, name))
+            setattr(rollup, name, json.dumps(dict(counts)))
+
+
+class RollupJob:
+    """Folds new conversations into hourly/daily rollups and unanswered-question clusters.
+
+    Incremental: a watermark (last conversation id) is committed with each batch, so every
+    conversation is counted once and the dashboard never reads the raw log.
+    """
+
+    def __init__(self, default_site):
+        # Conversations from before multi-site support have no site
+        self.default_site = default_site
+        self.clusters = {}
+
+    def run(self, lock_path=ANALYTICS_LOCK):
+        """Fold in everything up to ROLLUP_LAG ago; returns the number of conversations processed"""
+        with file_lock(lock_path, blocking=False) as acquired:
+            if not acquired:
+                return 0
+            # Another worker may have added clusters since the last run
+            self.clusters = {}
+            processed = 0
+            while True:
+                count = self.run_batch()
+                processed += count
+                # A short batch means nothing older than the cutoff is left
+                if count < ROLLUP_BATCH:
+                    break
+            return processed
+
+    def run_batch(self):
+        watermark = db.session.get(AnalyticsWatermark, 'conversations')
+        if watermark is None:
+            watermark = AnalyticsWatermark(name='conversations', last_id=0)
+            db.session.add(watermark)
+
+        cutoff = datetime.utcnow() - ROLLUP_LAG
+        rows = (Conversation.query.with_entities(
+                    Conversation.id, Conversation.timestamp, Conversation.site, Conversation.language,
+                    Conversation.path, Conversation.intent, Conversation.score, Conversation.latency_ms,
+                    Conversation.user_message)
+                .filter(Conversation.id > watermark.last_id)
+                .order_by(Conversation.id).limit(ROLLUP_BATCH).all())
+
+        totals, last_id, processed = {}, watermark.last_id, 0
+        for row in rows:
+            if row.timestamp is not None and row.timestamp >= cutoff:
+                break
+            timestamp = row.timestamp or watermark.updated_at or cutoff
+            site = row.site or self.default_site
+            unanswered = is_unanswered(row)
+            hour = timestamp.replace(minute=0, second=0, microsecond=0)
+            for period, bucket in (('hour', hour), ('day', hour.replace(hour=0))):
+                totals.setdefault((period, bucket, site), Totals()).add(row, unanswered)
+            if unanswered:
+                self.record_unanswered(site, row.user_message, timestamp)
+            last_id = row.id
+            processed += 1
+
+        if not processed:
+            db.session.rollback()
+            return 0
+
+        for (period, bucket, site), counts in totals.items():
+            rollup = ConversationRollup.query.filter_by(period=period, bucket=bucket, site=site).first()
+            if rollup is None:
+                rollup = ConversationRollup(period=period, bucket=bucket, site=site)
+                db.session.add(rollup)
+            counts.merge_into(rollup)
+        watermark.last_id = last_id
+        watermark.updated_at = datetime.utcnow()
+        db.session.commit()
+        inc('davgpt_analytics_rows_total', processed)
+        return processed
+
+    def record_unanswered(self, site, message, timestamp):
+        key = faq_key(message or '')
+        if key is None:
+            return
+        key = key[:255]
+        entry = UnansweredQuery.query.filter_by(site=site, key=key).first()
+        if entry is not None:
+            entry.count += 1
+            entry.last_seen = max(entry.last_seen or timestamp, timestamp)
+            return
+
+        words = set(key.split())
+        clusters = self.site_clusters(site)
+        head = clusters.find(words)
+        entry = UnansweredQuery(site=site, key=key, example=message[:500], count=1, first_seen=timestamp,
+                                last_seen=timestamp)
+        db.session.add(entry)
+        db.session.flush()
+        entry.cluster_id = head if head is not None else entry.id
+        if head is None:
+            clusters.add(entry.id, words)
+
+    def site_clusters(self, site):
+        if site not in self.clusters:
+            clusters = QueryClusters()
+            heads = (UnansweredQuery.query.with_entities(UnansweredQuery.id, UnansweredQuery.key)
+                     .filter(UnansweredQuery.site == site, UnansweredQuery.cluster_id == UnansweredQuery.id).all())
+            for head_id, key in heads:
+                clusters.add(head_id, set(key.split()))
+            self.clusters[site] = clusters
+        return self.clusters[site]
+
+
+def start_rollups(app, default_site, interval=ANALYTICS_INTERVAL):
+    """Run the rollup job every interval seconds in a daemon thread of this worker"""
+    job = RollupJob(default_site)
+
+    def rollup_loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    processed = job.run()
+                if processed:
+                    print(f"📈 Analytics: folded in {processed} conversations")
+            except Exception as e:
+                print(f"Analytics rollup error: {e}")
+                inc('davgpt_stage_errors_total', stage='analytics')
+
+    thread = threading.Thread(target=rollup_loop, daemon=True)
+    thread.start()
+    return job
+
+
+def summary(site, days=7, hours=24, top_unanswered=10):
+    """Dashboard numbers for a site, read from the rollup tables only"""
+    now = datetime.utcnow()
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    hour_start = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+
+    def rows(period, start):
+        rollups = (ConversationRollup.query.filter(ConversationRollup.period == period,
+                                                   ConversationRollup.site == site,
+                                                   ConversationRollup.bucket >= start)
+                   .order_by(ConversationRollup.bucket).all())
+        return [describe(rollup) for rollup in rollups]
+
+    clusters = (db.session.query(UnansweredQuery.cluster_id, db.func.sum(UnansweredQuery.count).label('total'),
+                                 db.func.max(UnansweredQuery.last_seen).label('last_seen'))
+                .filter(UnansweredQuery.site == site)
+                .group_by(UnansweredQuery.cluster_id)
+                .order_by(db.desc('total')).limit(top_unanswered).all())
+    examples = {}
+    if clusters:
+        members = (UnansweredQuery.query.filter(UnansweredQuery.cluster_id.in_([c.cluster_id for c in clusters]))
+                   .order_by(UnansweredQuery.count.desc()).all())
+        for member in members:
+            examples.setdefault(member.cluster_id, []).append(member.example)
+
+    watermark = db.session.get(AnalyticsWatermark, 'conversations')
+    return {
+        'daily': rows('day', day_start),
+        'hourly': rows('hour', hour_start),
+        'unanswered': [{'count': cluster.total, 'last_seen': cluster.last_seen,
+                        'examples': examples.get(cluster.cluster_id, [])[:3]} for cluster in clusters],
+        'updated_at': watermark.updated_at if watermark else None
+    }
+
+
+def total_conversations(site):
+    """Conversations of a site up to the last rollup run, from the daily rollups"""
+    total = (db.session.query(db.func.sum(ConversationRollup.conversations))
+             .filter(ConversationRollup.period == 'day', ConversationRollup.site == site).scalar())
+    return total or 0
+
+
+def describe(rollup):
+    """A rollup row as rates and percentiles"""
+    histogram = json.loads(rollup.latency_histogram) if rollup.latency_histogram else []
+    count = rollup.conversations or 0
+    languages = json.loads(rollup.languages or '{}')
+    intents = Counter(json.loads(rollup.intents or '{}'))
+    return {
+        'bucket': rollup.bucket,
+        'conversations': count,
+        'hindi_rate': languages.get('hi', 0) / count if count else 0,
+        'cache_hit_rate': rollup.cache_hits / count if count else 0,
+        'fallback_rate': rollup.fallbacks / count if count else 0,
+        'unanswered': rollup.unanswered,
+        'latency_avg_ms': rollup.latency_ms_total / rollup.latency_count if rollup.latency_count else None,
+        'latency_p95_ms': latency_percentile(histogram, 0.95),
+        'top_intents': intents.most_common(3)
+    }
+
+
+if __name__ == '__main__':
+    from app import app, tenants
+    with app.app_context():
+        processed = RollupJob(tenants.default).run()
+    print(f"📈 Analytics: folded in {processed} conversations")
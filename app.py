@@ -1,18 +1,33 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, Response, stream_with_context
 from flask_mail import Mail, Message
 from flask_sqlalchemy import SQLAlchemy
-from scraper import DAVScraper
-from simple_rag import SimpleRAG
-from models import db, Conversation, UploadedFile, Lead, ManualData, Event
+from simple_rag import SimpleRAG, CONTEXT_CANDIDATES
+from search_index import SOURCES
+from tenants import TenantRegistry, load_sites, current_site
+from models import db, upgrade_schema, Conversation, UploadedFile, Lead, ManualData, Event, UploadJob, UploadLink
+from upload_jobs import UploadJobRunner, iter_chunks, MAX_CHARS as UPLOAD_MAX_CHARS
+from metrics import timed, inc, start_trace, end_trace, render_prometheus, count_response, collect_details, detail
+from profiler import profiler
+from admission import session_limiter, ip_limiter
+from singleflight import SingleFlight
+from faq_store import mine_questions, FAQ_MINE_MESSAGES
+from conversation_log import setup_search, filtered, page, iter_export, import_legacy_log
+from analytics import start_rollups, summary, total_conversations
+from intents import router, is_hindi
+from werkzeug.local import LocalProxy
 import os
 from dotenv import load_dotenv
 import json
 from datetime import datetime, timedelta
-from googletrans import Translator
+from translation import TranslatorPool
 from gtts import gTTS
 import tempfile
 import uuid
 import secrets
+import hashlib
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Load environment variables
 load_dotenv()
@@ -24,6 +39,13 @@ app.secret_key = 'dav_admin_secret_key_2024'
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///davgpt.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Reject oversized uploads before they are read into memory
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+
+# Batch chat (/chat/batch and chat_batch.py): questions per request and LLM calls in flight per batch
+BATCH_MAX_MESSAGES = int(os.getenv('BATCH_MAX_MESSAGES', '500'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+
 # Email configuration
 app.config['MAIL_SERVER'] = 'smtp.gmail.com'
 app.config['MAIL_PORT'] = 587
@@ -37,9 +59,20 @@ db.init_app(app)
 mail = Mail(app)
 
 # Initialize systems
-scraper = DAVScraper()
-rag = SimpleRAG()
-translator = Translator()
+def open_site(site):
+    """Load one site's knowledge base and hook it up to the app (see TenantRegistry)"""
+    site_rag = SimpleRAG(site)
+    # Chat answers query the calendar directly instead of calling back into this server over HTTP
+    site_rag.holiday_lookup = lambda month, year: find_holidays(month, year, site.key)
+    site_rag.after_refresh = lambda: start_faq_rebuild(site_rag)
+    return site_rag
+
+tenants = TenantRegistry(*load_sites(), open_site)
+# The knowledge base of the site being served (see resolve_site); loaded on first use
+rag = LocalProxy(tenants.get)
+translators = TranslatorPool()
+translate_flights = SingleFlight('translate')
+upload_runner = UploadJobRunner(app)
 
 # Default admin
 DEFAULT_ADMIN = {"username": "admin", "password": "dav2024", "email": "admin@davkoylanagar.com"}
@@ -49,57 +82,204 @@ def get_session_id():
         session['session_id'] = str(uuid.uuid4())
     return session['session_id']
 
-def detect_and_translate(text):
-    try:
+def _detect_and_translate(text):
+    with translators.borrow() as translator:
         detection = translator.detect(text)
         if detection.lang == 'hi':
             translated = translator.translate(text, src='hi', dest='en')
             return translated.text, 'hi'
-        return text, 'en'
+    return text, 'en'
+
+def _translate_to_hindi(text):
+    with translators.borrow() as translator:
+        return translator.translate(text, src='en', dest='hi').text
+
+@timed('translate_detect')
+def detect_and_translate(text):
+    try:
+        return translate_flights.do(('detect', text), lambda: _detect_and_translate(text))
     except:
+        inc('davgpt_stage_errors_total', stage='translate_detect')
+        inc('davgpt_fallbacks_total', reason='untranslated_query')
         return text, 'en'
 
+@timed('translate_hindi')
 def translate_to_hindi(text):
     try:
-        translated = translator.translate(text, src='en', dest='hi')
-        return translated.text
+        return translate_flights.do(('hi', text), lambda: _translate_to_hindi(text))
     except:
+        inc('davgpt_stage_errors_total', stage='translate_hindi')
+        inc('davgpt_fallbacks_total', reason='untranslated_answer')
         return text
 
 def check_for_human_request(message):
-    human_keywords = ['human', 'person', 'staff', 'talk to someone', 'contact', 'call', 'meet', 'व्यक्ति', 'इंसान', 'स्टाफ', 'संपर्क']
-    return any(keyword in message.lower() for keyword in human_keywords)
+    # Explicit handoff phrases only: "contact number" or "phone call" are questions for the fast paths
+    return router.classify(message).kind == 'human'
 
-def get_chatbot_response(message, user_lang='en'):
+def fast_path_response(message, user_lang='en'):
+    """Handoff, holidays, contact and timings, answered in the message's language without translation"""
+    intent = router.classify(message)
+    detail(intent=intent.label)
+    if intent.kind is None:
+        return None
+    lang = 'hi' if user_lang == 'hi' or is_hindi(message) else 'en'
+    response = rag.fast_paths.answer(intent, lang)
+    if not response:
+        return None
+    count_response(intent.kind)
+    return response, lang, intent.kind == 'human'
+
+def answer_translated(english_message, detected_lang, results=None, categories=None, sources=None):
+    """Answer the English form of a message and return it in the detected language"""
+    if detected_lang == 'hi' and not (categories or sources):
+        # The stored Hindi answer skips both Gemini and the back-translation
+        faq_answer = rag.faq_store.lookup(english_message, 'hi')
+        if faq_answer:
+            count_response('faq')
+            return faq_answer, 'hi', False
+    
+    response = rag.generate_response(english_message, results, categories, sources)
+    
+    if detected_lang == 'hi':
+        response = translate_to_hindi(response)
+    
+    return response, detected_lang, False
+
+CHAT_ERROR_RESPONSE = ("I'm having trouble processing your request. Please try again.", 'en', False)
+
+@timed('chat')
+def get_chatbot_response(message, user_lang='en', categories=None, sources=None):
+    trace = start_trace()
+    started = time.perf_counter()
     try:
-        if check_for_human_request(message):
-            if user_lang == 'hi':
-                return "मैं आपको स्कूल के स्टाफ से जोड़ सकता हूं। कृपया अपना नाम और संपर्क नंबर बताएं।", 'hi', True
-            else:
-                return "I can connect you with our school staff. Please provide your name and contact number.", 'en', True
+        fast = fast_path_response(message, user_lang)
+        if fast:
+            return fast
         
         english_message, detected_lang = detect_and_translate(message)
-        response = rag.generate_response(english_message)
-        
         if detected_lang == 'hi':
-            response = translate_to_hindi(response)
-        
-        return response, detected_lang, False
+            detail(english=english_message)
+        return answer_translated(english_message, detected_lang, categories=categories, sources=sources)
     except Exception as e:
         print(f"Error in chatbot response: {e}")
-        return "I'm having trouble processing your request. Please try again.", 'en', False
+        inc('davgpt_stage_errors_total', stage='chat')
+        detail(path='error')
+        return CHAT_ERROR_RESPONSE
+    finally:
+        end_trace(trace, 'chat', time.perf_counter() - started)
+
+def iter_batch_responses(messages, concurrency=BATCH_CONCURRENCY, categories=None, sources=None, site=None):
+    """Answer many messages like get_chatbot_response, yielding one result dict per message as it finishes.
+    
+    Translation and LLM calls run on at most `concurrency` threads; retrieval runs once for the whole batch.
+    """
+    def in_app_context(func, *args):
+        with app.app_context():
+            current_site.set(site)
+            return func(*args)
+    
+    def result(index, answer, started):
+        response, lang, needs_human = answer
+        return {'index': index, 'message': messages[index], 'response': response, 'language': lang,
+                'needs_human': needs_human, 'seconds': round(time.perf_counter() - started, 3)}
+    
+    def prepare(index):
+        started = time.perf_counter()
+        try:
+            fast = fast_path_response(messages[index])
+            if fast:
+                return result(index, fast, started)
+            return detect_and_translate(messages[index])
+        except Exception as e:
+            print(f"Error in batch chat: {e}")
+            inc('davgpt_stage_errors_total', stage='chat')
+            return result(index, CHAT_ERROR_RESPONSE, started)
+    
+    def answer(index, english_message, detected_lang, results):
+        started = time.perf_counter()
+        try:
+            return result(index, answer_translated(english_message, detected_lang, results, categories, sources),
+                          started)
+        except Exception as e:
+            print(f"Error in batch chat: {e}")
+            inc('davgpt_stage_errors_total', stage='chat')
+            return result(index, CHAT_ERROR_RESPONSE, started)
+    
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='chat-batch')
+    try:
+        translated = {}
+        for index, prepared in enumerate(pool.map(lambda i: in_app_context(prepare, i), range(len(messages)))):
+            if isinstance(prepared, dict):
+                inc('davgpt_batch_messages_total')
+                yield prepared
+            else:
+                translated[index] = prepared
+        
+        indexes = list(translated)
+        batch_results = tenants.get(site).search_batch([translated[i][0] for i in indexes], CONTEXT_CANDIDATES,
+                                                       categories, sources)
+        futures = [pool.submit(in_app_context, answer, i, *translated[i], results)
+                   for i, results in zip(indexes, batch_results)]
+        for future in as_completed(futures):
+            inc('davgpt_batch_messages_total')
+            yield future.result()
+    finally:
+        # A client that disconnects mid-stream should not keep the LLM busy
+        pool.shutdown(wait=False, cancel_futures=True)
+
+@app.before_request
+def resolve_site():
+    """Serve the site named by an embed key (?site=, X-Site-Key or "site" in the JSON body), else by the host"""
+    embed_key = request.args.get('site') or request.headers.get('X-Site-Key')
+    if not embed_key and request.is_json:
+        data = request.get_json(silent=True)
+        embed_key = data.get('site') if isinstance(data, dict) else None
+    if tenants.is_embed_key(embed_key):
+        # Remembered, so the chat and admin requests that follow stay on the same site
+        session['site'] = embed_key
+    current_site.set(tenants.resolve(request.host, session.get('site')))
 
 @app.route('/')
 def index():
     return render_template('chat.html')
 
+def search_scope(data):
+    """(categories, sources) from a request's "categories"/"sources" lists or comma-separated strings"""
+    def names(value):
+        if isinstance(value, str):
+            value = [value]
+        return [name.strip().lower() for item in value or [] if isinstance(item, str)
+                for name in item.split(',') if name.strip()]
+    
+    categories = names(data.get('categories'))
+    sources = [source for source in names(data.get('sources')) if source in SOURCES]
+    return categories or None, sources or None
+
 @app.route('/chat', methods=['POST'])
 def chat():
     user_message = request.json.get('message', '')
     if not user_message.strip():
-        return jsonify({'response': 'Please ask me something about DAV Koyla Nagar school.'})
+        return jsonify({'response': f'Please ask me something about {tenants.site().name} school.'})
     
-    bot_response, user_lang, needs_human = get_chatbot_response(user_message)
+    # Shed floods early, before they reach translation or Gemini
+    session_id = get_session_id()
+    client_ip = request.remote_addr or 'unknown'
+    for limiter, key in ((session_limiter, session_id), (ip_limiter, client_ip)):
+        if not limiter.allow(key):
+            retry_after = limiter.retry_after(key)
+            return jsonify({
+                'response': f"You're sending messages very quickly. Please wait {retry_after} seconds and try again.",
+                'rate_limited': True,
+                'retry_after': retry_after
+            }), 429, {'Retry-After': str(retry_after)}
+    
+    details = collect_details()
+    started = time.perf_counter()
+    with profiler.profile_request():
+        bot_response, user_lang, needs_human = get_chatbot_response(user_message, 'en', *search_scope(request.json))
+    
+    log_conversation(user_message, bot_response, user_lang, session_id, details,
+                     int((time.perf_counter() - started) * 1000))
     
     # Store in session for 48 hours
     if 'chat_history' not in session:
@@ -125,6 +305,41 @@ def chat():
         'needs_human': needs_human
     })
 
+def read_batch_messages(body, content_type):
+    """Questions from {"messages": [...]} JSON or JSONL lines (strings or {"message": ...} objects)"""
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        items = json.loads(body or '{}').get('messages', [])
+    messages = [item.get('message', '') if isinstance(item, dict) else item for item in items]
+    return [message.strip() for message in messages if isinstance(message, str) and message.strip()]
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer many questions (evaluation, cache warming); streams one JSON line per answer as it finishes"""
+    if 'admin_logged_in' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        messages = read_batch_messages(request.get_data(as_text=True), request.content_type or '')
+    except (ValueError, AttributeError) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid batch: {e}'}), 400
+    if not messages:
+        return jsonify({'status': 'error', 'message': 'No messages'}), 400
+    if len(messages) > BATCH_MAX_MESSAGES:
+        return jsonify({'status': 'error', 'message': f'At most {BATCH_MAX_MESSAGES} messages per batch'}), 413
+    
+    concurrency = min(BATCH_CONCURRENCY, max(1, request.args.get('concurrency', BATCH_CONCURRENCY, type=int)))
+    categories, sources = search_scope(request.args)
+    batch = iter_batch_responses(messages, concurrency, categories, sources, current_site.get())
+    lines = (json.dumps(result, ensure_ascii=False) + '\n' for result in batch)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint, aggregated across all workers"""
+    return render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/get_chat_history', methods=['GET'])
 def get_chat_history():
     return jsonify({'history': session.get('chat_history', [])})
@@ -191,108 +406,244 @@ def upload_file():
         
         # Create uploads directory if it doesn't exist
         os.makedirs('uploads', exist_ok=True)
-        file.save(filepath)
-        
-        # Extract text from file
-        text_content = extract_text_from_file(filepath, file_ext)
-        
-        if text_content:
-            # Save to database
-            uploaded_file = UploadedFile(
-                filename=filename,
-                original_name=file.filename,
-                file_type=file_ext,
-                content=text_content,
-                session_id=get_session_id()
-            )
-            db.session.add(uploaded_file)
-            db.session.commit()
-            
-            # Add to RAG system
-            file_entry = {
-                'id': str(uploaded_file.id),
-                'title': f"Uploaded File: {file.filename}",
-                'content': text_content,
-                'category': 'uploaded_file',
-                'timestamp': datetime.now().isoformat(),
-                'url': 'uploaded_file',
-                'filename': file.filename
-            }
-            
-            rag.add_manual_entry(file_entry)
-            
-            # Clean up temporary file
+        file_hash = save_and_hash(file, filepath)
+        
+        job = UploadJob(
+            id=str(uuid.uuid4()),
+            original_name=file.filename,
+            file_type=file_ext,
+            status='queued',
+            session_id=get_session_id(),
+            site=current_site.get()
+        )
+        
+        # Same bytes seen before on this site: answer from the existing record without re-processing
+        # Only fully indexed files (text_hash set) count
+        existing = UploadedFile.query.filter(UploadedFile.file_hash == file_hash,
+                                             UploadedFile.text_hash.isnot(None),
+                                             site_filter(UploadedFile.site, job.site)).first()
+        if existing:
             os.remove(filepath)
-            
+            link_existing_upload(job, existing)
+            db.session.add(job)
+            db.session.commit()
             return jsonify({
-                'status': 'success', 
-                'message': f'File "{file.filename}" uploaded and processed successfully!',
-                'content_preview': text_content[:200] + '...' if len(text_content) > 200 else text_content
+                'status': 'done',
+                'job_id': job.id,
+                'message': job.message,
+                'content_preview': job.content_preview
             })
-        else:
-            os.remove(filepath)
-            return jsonify({'status': 'error', 'message': 'Could not extract text from file'})
+        
+        # Accept now, extract and index in the background
+        db.session.add(job)
+        db.session.commit()
+        
+        upload_runner.submit(job.id, process_upload, filepath, filename, file_hash)
+        
+        return jsonify({
+            'status': 'queued',
+            'job_id': job.id,
+            'message': f'File "{file.filename}" received, processing...'
+        }), 202
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
-def extract_text_from_file(filepath, file_ext):
-    """Extract text from different file types"""
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'status': 'error', 'message': f'File is too large (limit {limit_mb} MB)'}), 413
+
+@app.route('/upload_status/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """Poll the state of a background upload job"""
+    job = db.session.get(UploadJob, job_id)
+    if not job or job.session_id != get_session_id():
+        return jsonify({'status': 'error', 'message': 'Upload not found'}), 404
+    
+    return jsonify({
+        'status': job.status,
+        'message': job.message,
+        'content_preview': job.content_preview
+    })
+
+def save_and_hash(file, filepath, block_size=64 * 1024):
+    """Write the upload to disk while computing the sha256 of its raw bytes"""
+    digest = hashlib.sha256()
+    with open(filepath, 'wb') as out:
+        for block in iter(lambda: file.stream.read(block_size), b''):
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+def link_existing_upload(job, uploaded_file):
+    """Complete a job by pointing it (and its session) at an already-processed file"""
+    db.session.add(UploadLink(uploaded_file_id=uploaded_file.id, session_id=job.session_id))
+    job.uploaded_file_id = uploaded_file.id
+    job.status = 'done'
+    job.finished_at = datetime.utcnow()
+    job.content_preview = uploaded_file.content[:200] + '...' if len(uploaded_file.content) > 200 else uploaded_file.content
+    job.message = f'File "{job.original_name}" was already uploaded as "{uploaded_file.original_name}"; using the existing copy.'
+    return job.message
+
+def site_filter(column, site):
+    """Rows belonging to a site; rows from before multi-site support belong to the default site"""
+    if site in (None, tenants.default):
+        return db.or_(column == tenants.default, column.is_(None))
+    return column == site
+
+def process_upload(job, filepath, filename, file_hash):
+    """Background job: stream the document into RAG chunks, storing the text only once"""
+    # Index into the knowledge base of the site the file was uploaded to
+    current_site.set(job.site)
     try:
-        if file_ext == '.pdf':
-            import PyPDF2
-            with open(filepath, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-                return text.strip()
-        
-        elif file_ext == '.docx':
-            from docx import Document
-            doc = Document(filepath)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text.strip()
-        
-        elif file_ext == '.txt':
-            with open(filepath, 'r', encoding='utf-8') as file:
-                return file.read().strip()
+        # No file_hash until the text is indexed, so a failed or unfinished upload is never reused
+        uploaded_file = UploadedFile(
+            filename=filename,
+            original_name=job.original_name,
+            file_type=job.file_type,
+            content='',
+            session_id=job.session_id,
+            site=job.site
+        )
+        db.session.add(uploaded_file)
+        db.session.commit()
+        
+        try:
+            return index_upload(job, uploaded_file, filepath, file_hash)
+        except Exception:
+            # Drop the chunks indexed so far and the row, so the same file can be uploaded again
+            db.session.rollback()
+            rag.remove_upload(uploaded_file.id)
+            failed = db.session.get(UploadedFile, uploaded_file.id)
+            if failed:
+                db.session.delete(failed)
+                db.session.commit()
+            raise
+    finally:
+        # Clean up temporary file
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+def index_upload(job, uploaded_file, filepath, file_hash):
+    stats = {'pages': 0, 'truncated': False}
+    pieces = upload_runner.iter_document_text(filepath, job.file_type, stats)
+    chunk_count = char_count = duplicate_count = 0
+    preview = ''
+    text_digest = hashlib.sha256()
     
-    except Exception as e:
-        print(f"Error extracting text: {e}")
-        return None
+    for chunk in iter_chunks(pieces):
+        if char_count + len(chunk) > UPLOAD_MAX_CHARS:
+            stats['truncated'] = True
+            break
+        
+        # Each chunk goes straight into the RAG index; nothing accumulates the full text
+        duplicate_id = rag.add_manual_entry({
+            'id': f"{uploaded_file.id}-{chunk_count}",
+            'title': f"Uploaded File: {job.original_name}",
+            'content': chunk,
+            'category': 'uploaded_file',
+            'timestamp': datetime.now().isoformat(),
+            'url': 'uploaded_file',
+            'filename': job.original_name,
+            'upload_id': uploaded_file.id
+        }, save=False)
+        
+        if duplicate_id is not None:
+            duplicate_count += 1
+        text_digest.update(' '.join(chunk.lower().split()).encode('utf-8') + b' ')
+        if not preview:
+            preview = chunk[:500]
+        chunk_count += 1
+        char_count += len(chunk)
+    
+    if not chunk_count:
+        raise ValueError('Could not extract text from file')
+    
+    # Same text in a different file (e.g. a re-saved PDF): keep the original, drop this copy
+    text_hash = text_digest.hexdigest()
+    existing = UploadedFile.query.filter(UploadedFile.text_hash == text_hash,
+                                         UploadedFile.id != uploaded_file.id,
+                                         site_filter(UploadedFile.site, job.site)).first()
+    if existing:
+        rag.remove_upload(uploaded_file.id)
+        db.session.delete(uploaded_file)
+        return link_existing_upload(job, existing)
+    
+    rag.save_manual_data()
+    
+    # The full text lives in the indexed chunks; the table keeps a preview
+    uploaded_file.content = preview
+    uploaded_file.file_hash = file_hash
+    uploaded_file.text_hash = text_hash
+    job.uploaded_file_id = uploaded_file.id
+    job.content_preview = preview[:200] + '...' if char_count > 200 else preview
+    
+    message = f'File "{job.original_name}" uploaded and processed successfully!'
+    if duplicate_count == chunk_count:
+        message = f'File "{job.original_name}" matches an existing document, which has been updated.'
+    if stats['truncated']:
+        message += f' Only the first {stats["pages"] or chunk_count} pages/sections were indexed because the document exceeds the size limit.'
+    return message
+
 @app.route('/get_holidays', methods=['POST'])
 def get_holidays_for_chat():
     """Get holidays for chat queries"""
     try:
         data = request.json
-        month = data.get('month')
-        year = data.get('year', datetime.now().year)
-        
-        query = Event.query.filter_by(is_public_holiday=True)
-        
-        if month:
-            query = query.filter(db.extract('month', Event.date) == month)
-        
-        query = query.filter(db.extract('year', Event.date) == year)
-        
-        holidays = query.all()
-        
-        holiday_list = []
-        for holiday in holidays:
-            holiday_list.append({
-                'title': holiday.title,
-                'date': holiday.date.strftime('%B %d, %Y'),
-                'description': holiday.description or ''
-            })
-        
+        holiday_list = find_holidays(data.get('month'), data.get('year'))
         return jsonify({'status': 'success', 'holidays': holiday_list})
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+def find_holidays(month=None, year=None, site=None):
+    """A site's public holidays for a year (and optionally a month), formatted for chat answers"""
+    year = year or datetime.now().year
+    query = Event.query.filter(Event.is_public_holiday.is_(True),
+                               site_filter(Event.site, site or current_site.get()))
+    
+    if month:
+        query = query.filter(db.extract('month', Event.date) == month)
+    
+    query = query.filter(db.extract('year', Event.date) == year)
+    
+    return [{
+        'title': holiday.title,
+        'date': holiday.date.strftime('%B %d, %Y'),
+        'description': holiday.description or ''
+    } for holiday in query.all()]
+
+def rebuild_faqs(site_rag):
+    """Regenerate precomputed answers for the most frequent questions (runs after each refresh)"""
+    def skip(question):
+        # Fast-path intents never reach the LLM; general chat is not answered from the knowledge base
+        intent = router.classify(question)
+        return intent.kind is not None or not intent.school
+    
+    try:
+        # Every worker refreshes, so only one (across processes) mines and rebuilds at a time
+        with site_rag.faq_store.exclusive() as acquired:
+            if not acquired:
+                print("📚 FAQ rebuild already running")
+                return
+            
+            with app.app_context():
+                # The most recent questions asked on this site, in the English form logged with Hindi ones
+                rows = (db.session.query(Conversation.user_message, Conversation.english_message)
+                        .filter(site_filter(Conversation.site, site_rag.site.key))
+                        .order_by(Conversation.id.desc()).limit(FAQ_MINE_MESSAGES).all())
+                messages = [row.english_message or row.user_message for row in rows]
+            
+            questions = mine_questions(messages, skip=skip)
+            site_rag.faq_store.rebuild(site_rag, questions, translate_to_hindi)
+    except Exception as e:
+        print(f"FAQ rebuild error: {e}")
+        inc('davgpt_stage_errors_total', stage='faq_rebuild')
+
+def start_faq_rebuild(site_rag):
+    threading.Thread(target=rebuild_faqs, args=(site_rag,), daemon=True).start()
+
 def text_to_speech():
     try:
         data = request.json
@@ -340,7 +691,23 @@ def admin_dashboard():
         return redirect(url_for('admin_login'))
     
     stats = get_system_stats()
-    return render_template('admin_dashboard.html', stats=stats)
+    try:
+        analytics = summary(current_site.get())
+    except Exception as e:
+        print(f"Error reading analytics: {e}")
+        analytics = None
+    return render_template('admin_dashboard.html', stats=stats, analytics=analytics)
+
+@app.route('/admin/analytics')
+def admin_analytics():
+    """Rollups and unanswered-question clusters for the current site, as JSON"""
+    if 'admin_logged_in' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    days = min(90, max(1, request.args.get('days', 7, type=int)))
+    hours = min(24 * 7, max(1, request.args.get('hours', 24, type=int)))
+    analytics = summary(current_site.get(), days, hours, request.args.get('top', 10, type=int))
+    return jsonify({'status': 'success', 'site': current_site.get(), **analytics})
 
 @app.route('/admin/admins')
 def admin_manage():
@@ -429,8 +796,10 @@ def admin_add_data():
             'added_by': session.get('admin_username')
         }
         
-        rag.add_manual_entry(new_entry)
+        duplicate_id = rag.add_manual_entry(new_entry)
         
+        if duplicate_id is not None:
+            return jsonify({'status': 'success', 'message': 'Similar entry already existed and was updated'})
         return jsonify({'status': 'success', 'message': 'Data added successfully'})
     
     except Exception as e:
@@ -466,9 +835,17 @@ def admin_refresh():
         return jsonify({'status': 'error', 'message': 'Unauthorized'})
     
     try:
+        site_rag = tenants.get()
+        scraper = site_rag.new_scraper()
         scraper.scrape_all()
-        rag.refresh_knowledge_base()
-        return jsonify({'status': 'success', 'message': 'Knowledge base updated successfully'})
+        changes = scraper.changes
+        site_rag.refresh_knowledge_base(scraper)
+        start_faq_rebuild(site_rag)
+        return jsonify({
+            'status': 'success',
+            'message': 'Knowledge base updated successfully',
+            'changes': {key: len(value) for key, value in changes.items()}
+        })
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
@@ -491,7 +868,8 @@ def get_events():
         # Get events for the month
         events = Event.query.filter(
             db.extract('month', Event.date) == month,
-            db.extract('year', Event.date) == year
+            db.extract('year', Event.date) == year,
+            site_filter(Event.site, current_site.get())
         ).all()
         
         events_data = []
@@ -537,7 +915,8 @@ def add_event():
             date=event_date,
             category=category,
             tags=tags,
-            created_by=session.get('admin_username', 'admin')
+            created_by=session.get('admin_username', 'admin'),
+            site=current_site.get()
         )
         
         db.session.add(event)
@@ -575,7 +954,8 @@ def fetch_holidays():
             event_date = datetime.strptime(holiday['date'], '%Y-%m-%d').date()
             
             # Check if holiday already exists
-            existing = Event.query.filter_by(date=event_date, is_public_holiday=True).first()
+            existing = Event.query.filter(Event.date == event_date, Event.is_public_holiday.is_(True),
+                                          site_filter(Event.site, current_site.get())).first()
             if not existing:
                 event = Event(
                     title=holiday['title'],
@@ -584,7 +964,8 @@ def fetch_holidays():
                     category='holiday',
                     tags='public,national',
                     created_by='system',
-                    is_public_holiday=True
+                    is_public_holiday=True,
+                    site=current_site.get()
                 )
                 db.session.add(event)
                 added_count += 1
@@ -598,12 +979,84 @@ def fetch_holidays():
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
+@app.route('/admin/logs')
 def admin_logs():
     if 'admin_logged_in' not in session:
         return redirect(url_for('admin_login'))
     
-    logs = get_conversation_logs()
-    return render_template('admin_logs.html', logs=logs)
+    filters = log_filters()
+    logs, newer, older = page(conversation_query(filters), request.args.get('before'), request.args.get('after'))
+    query_args = {name: value for name, value in filters.items() if value}
+    return render_template('admin_logs.html', logs=logs, filters=filters, query_args=query_args, newer=newer,
+                           older=older)
+
+@app.route('/admin/logs/export')
+def admin_logs_export():
+    """Stream every conversation matching the viewer's filters as CSV (default) or JSONL"""
+    if 'admin_logged_in' not in session:
+        return redirect(url_for('admin_login'))
+    
+    fmt = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    lines = iter_export(conversation_query(log_filters()), fmt)
+    return Response(stream_with_context(lines), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=davgpt-conversations.{fmt}'
+    })
+
+def log_filters():
+    """The log viewer's search box, language and session filters from the query string"""
+    return {name: request.args.get(name, '').strip() for name in ('q', 'language', 'session_id')}
+
+def conversation_query(filters):
+    return filtered([site_filter(Conversation.site, current_site.get())], filters['q'], filters['language'],
+                    filters['session_id'])
+
+@app.route('/admin/profiler', methods=['GET'])
+def admin_profiler_status():
+    if 'admin_logged_in' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'})
+    
+    return jsonify({
+        'status': 'success',
+        'profiler': profiler.status(),
+        'top_functions': profiler.top_functions()
+    })
+
+@app.route('/admin/profiler/start', methods=['POST'])
+def admin_profiler_start():
+    if 'admin_logged_in' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'})
+    
+    try:
+        data = request.json or {}
+        control = profiler.start(data.get('seconds', 60), data.get('percent', 100))
+        return jsonify({
+            'status': 'success',
+            'message': f"Profiling {control['percent']:g}% of chat requests for {int(control['until'] - control['started_at'])}s"
+        })
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Seconds and percent must be numbers'})
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/admin/profiler/stop', methods=['POST'])
+def admin_profiler_stop():
+    if 'admin_logged_in' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'})
+    
+    profiler.stop()
+    return jsonify({'status': 'success', 'message': 'Profiling stopped'})
+
+@app.route('/admin/profiler/download')
+def admin_profiler_download():
+    if 'admin_logged_in' not in session:
+        return redirect(url_for('admin_login'))
+    
+    # Folded stacks: feed to flamegraph.pl or open in speedscope
+    return profiler.folded(), 200, {
+        'Content-Type': 'text/plain; charset=utf-8',
+        'Content-Disposition': 'attachment; filename=davgpt-profile.folded'
+    }
 
 @app.route('/admin/logout')
 def admin_logout():
@@ -653,48 +1106,43 @@ def save_admins(admins):
 def load_manual_data():
     return rag.manual_data
 
+def leads_file():
+    """Each site's leads sit in its data directory (leads.json in the current directory for a single site)"""
+    return os.path.join(tenants.site().data_dir, 'leads.json')
+
 def load_leads():
     try:
-        with open('leads.json', 'r') as f:
+        with open(leads_file(), 'r') as f:
             return json.load(f)
     except FileNotFoundError:
         return []
 
 def save_leads(leads):
-    with open('leads.json', 'w') as f:
+    with open(leads_file(), 'w') as f:
         json.dump(leads, f, indent=2)
 
-def log_conversation(user_message, bot_response):
-    log_entry = {
-        'timestamp': datetime.now().isoformat(),
-        'user_message': user_message,
-        'bot_response': bot_response
-    }
-    
+@timed('log_conversation')
+def log_conversation(user_message, bot_response, language='en', session_id=None, details=None, latency_ms=None):
+    """Store one exchange; details (path, intent, score from collect_details) feed the analytics rollups"""
+    details = details or {}
     try:
-        if os.path.exists('conversation_logs.json'):
-            with open('conversation_logs.json', 'r') as f:
-                logs = json.load(f)
-        else:
-            logs = []
-        
-        logs.append(log_entry)
-        
-        if len(logs) > 1000:
-            logs = logs[-1000:]
-        
-        with open('conversation_logs.json', 'w') as f:
-            json.dump(logs, f, indent=2)
+        db.session.add(Conversation(
+            user_message=user_message,
+            bot_response=bot_response,
+            language=language,
+            session_id=session_id,
+            site=current_site.get(),
+            english_message=details.get('english'),
+            path=details.get('path'),
+            intent=details.get('intent'),
+            score=details.get('score'),
+            latency_ms=latency_ms
+        ))
+        db.session.commit()
     except Exception as e:
+        db.session.rollback()
         print(f"Error logging conversation: {e}")
-
-def get_conversation_logs():
-    try:
-        with open('conversation_logs.json', 'r') as f:
-            logs = json.load(f)
-        return logs[-50:]
-    except FileNotFoundError:
-        return []
+        inc('davgpt_stage_errors_total', stage='log_conversation')
 
 def get_system_stats():
     stats = {
@@ -708,17 +1156,17 @@ def get_system_stats():
     }
     
     try:
-        if os.path.exists('conversation_logs.json'):
-            with open('conversation_logs.json', 'r') as f:
-                logs = json.load(f)
-                stats['total_conversations'] = len(logs)
-        
-        if os.path.exists('knowledge_base.json'):
-            with open('knowledge_base.json', 'r') as f:
-                kb = json.load(f)
-                stats['knowledge_base_size'] = len(kb)
-            
-            mod_time = os.path.getmtime('knowledge_base.json')
+        # From the rollups: counting the raw log scans the whole table on every dashboard load
+        stats['total_conversations'] = total_conversations(current_site.get())
+        
+        manifest = rag.published()
+        if manifest:
+            stats['knowledge_base_size'] = manifest['count']
+            published_at = datetime.fromisoformat(manifest['published_at'])
+            stats['last_update'] = published_at.strftime('%Y-%m-%d %H:%M:%S')
+        elif os.path.exists(rag.legacy_file):
+            stats['knowledge_base_size'] = len(rag.knowledge_base)
+            mod_time = os.path.getmtime(rag.legacy_file)
             stats['last_update'] = datetime.fromtimestamp(mod_time).strftime('%Y-%m-%d %H:%M:%S')
         
         manual_data = load_manual_data()
@@ -739,13 +1187,20 @@ def get_system_stats():
 # Initialize database on startup
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+    setup_search()
+    import_legacy_log(lambda message: 'hi' if is_hindi(message) else 'en')
     print("📊 Database initialized")
 
+# Conversation analytics are folded into rollup tables in the background (see analytics.py)
+start_rollups(app, tenants.default)
+
 if __name__ == '__main__':
-    if not os.path.exists('knowledge_base.json'):
+    site_rag = tenants.get()
+    if not site_rag.published() and not os.path.exists(site_rag.legacy_file):
         print("Running initial scrape...")
-        scraper.scrape_all()
-        rag.load_data()
+        site_rag.new_scraper().scrape_all()
+        site_rag.load_data()
     
     print("🚀 D.A.V GPT starting on http://localhost:5000")
     app.run(debug=True, host='0.0.0.0', port=5000)
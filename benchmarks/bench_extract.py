@@ -0,0 +1,135 @@
+"""Parse-throughput benchmark: legacy multi-pass extraction vs the single-pass extractor.
+
+Usage:
+    python benchmarks/bench_extract.py saved_pages/ [--repeat 5]
+    python benchmarks/bench_extract.py --archive crawl_archive.warc.gz
+
+Pass a directory of saved .html pages or a crawl archive recorded with
+`python scraper.py --record`. Without either, synthetic pages with deeply
+nested divs are generated so the quadratic case is visible.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from extractor import extract_page, format_blocks, clean_text, HAS_LXML, _walk_lxml, _walk_soup
+from http_archive import read_archive
+
+
+def legacy_extract(content):
+    """The pre-extractor scrape_page_comprehensive logic, kept here as a baseline"""
+    soup = BeautifulSoup(content, 'html.parser')
+    for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'noscript', 'iframe']):
+        element.decompose()
+    content_parts = []
+    for heading in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+        text = heading.get_text(strip=True)
+        if text and len(text) > 3:
+            content_parts.append(f"HEADING: {clean_text(text)}")
+    for p in soup.find_all('p'):
+        text = p.get_text(strip=True)
+        if text and len(text) > 20:
+            content_parts.append(clean_text(text))
+    for li in soup.find_all('li'):
+        text = li.get_text(strip=True)
+        if text and len(text) > 10:
+            content_parts.append(f"• {clean_text(text)}")
+    for table in soup.find_all('table'):
+        for row in table.find_all('tr'):
+            cells = [cell.get_text(strip=True) for cell in row.find_all(['td', 'th'])]
+            if any(cell for cell in cells):
+                content_parts.append(" | ".join(cells))
+    for div in soup.find_all('div'):
+        text = div.get_text(strip=True)
+        if text and len(text) > 30 and len(text) < 500:
+            content_parts.append(clean_text(text))
+    return ' '.join(content_parts)
+
+
+def single_pass_extract(content):
+    _, blocks, _ = extract_page(content, 'http://localhost/')
+    return format_blocks(blocks)
+
+
+def synthetic_pages(count=20, depth=60):
+    pages = []
+    for n in range(count):
+        body = ''.join(f'<div><p>Notice {n}.{d}: school remains open for classes on schedule.</p>' for d in range(depth))
+        body += '</div>' * depth
+        rows = ''.join(f'<tr><td>Class {d}</td><td>Rs {d * 100}</td></tr>' for d in range(30))
+        pages.append(f'<html><head><title>Page {n}</title></head><body><h1>Heading {n}</h1>'
+                     f'{body}<table>{rows}</table><ul><li>Admission forms available now</li></ul>'
+                     f'<p>Call the school office on<!-- phone --> 0326-2345678<?php echo 1; ?> or visit.</p>'
+                     f'</body></html>'.encode())
+    return pages
+
+
+def load_pages(directory):
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(directory, name), 'rb') as f:
+                pages.append(f.read())
+    return pages
+
+
+def load_archive(path):
+    pages = []
+    for status, headers, body in read_archive(path).values():
+        content_type = dict((name.lower(), value) for name, value in headers).get('content-type', '')
+        if status == 200 and 'html' in content_type:
+            pages.append(body)
+    return pages
+
+
+def check_equivalence(pages):
+    """Pages where the lxml walk and the BeautifulSoup fallback extract different text"""
+    if not HAS_LXML:
+        return []
+    return [n for n, page in enumerate(pages)
+            if format_blocks(_walk_lxml(page, 'http://localhost/')[1])
+            != format_blocks(_walk_soup(page, 'http://localhost/')[1])]
+
+
+def run(name, func, pages, repeat):
+    total_bytes = sum(len(page) for page in pages) * repeat
+    output_chars = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            output_chars += len(func(page))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<14} {len(pages) * repeat / elapsed:>10.1f} pages/s "
+          f"{total_bytes / elapsed / 1e6:>8.2f} MB/s   avg output {output_chars // (len(pages) * repeat)} chars")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages_dir', nargs='?', help='directory of saved .html pages')
+    parser.add_argument('--archive', help='crawl archive recorded with scraper.py --record')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.archive:
+        pages = load_archive(args.archive)
+    elif args.pages_dir:
+        pages = load_pages(args.pages_dir)
+    else:
+        pages = synthetic_pages()
+    if not pages:
+        sys.exit('No pages to benchmark')
+
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / 1024:.0f} KiB, lxml={'yes' if HAS_LXML else 'no'}")
+    mismatched = check_equivalence(pages)
+    if mismatched:
+        print(f"⚠️ lxml and BeautifulSoup extraction differ on {len(mismatched)} pages, e.g. page {mismatched[0]}")
+    run('legacy', legacy_extract, pages, args.repeat)
+    run('single-pass', single_pass_extract, pages, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Per-worker memory of the knowledge base: plain dicts vs the compact Document store.
+
+Usage:
+    python benchmarks/bench_memory.py                      # synthetic site: 2000 pages, 20000 upload chunks
+    python benchmarks/bench_memory.py --pages 500 --chunks 5000
+    python benchmarks/bench_memory.py --real               # knowledge_base/ and manual_data.json in the cwd
+
+Three layouts are measured with tracemalloc, each loaded from the same JSON text:
+  dicts          - the records as loaded (scraped_at, internal_links and all), searched by
+                   lowercasing every document on every query
+  dicts+lowered  - the same plus (item, lowered content, lowered title, category) tuples per entry
+  compact        - Documents (lowercased text plus capital spans, interned fields) in the sharded index
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import Document, ShardedIndex, manual_document
+
+WORDS = ('admission fee event holiday notice exam library sports bus principal timing contact address '
+         'class result students teachers annual function syllabus uniform transport hostel computer lab').split()
+CATEGORIES = ('home', 'admissions', 'fees', 'notices', 'events', 'contact', 'academics', 'about', 'facilities',
+              'general')
+
+
+def sentence(length):
+    words = random.choices(WORDS, k=length)
+    return ' '.join(words).capitalize() + '.'
+
+
+def synthetic(pages, chunks):
+    base = 'https://davkoylanagar.example.org'
+    knowledge_base = [{
+        'url': f"{base}/{random.choice(CATEGORIES)}/page-{i}.html",
+        'title': f"DAV Koyla Nagar - Page {i}",
+        'content': ' '.join(sentence(random.randint(8, 20)) for _ in range(random.randint(10, 30)))[:3000],
+        'category': random.choice(CATEGORIES),
+        'scraped_at': '2026-10-19T10:00:00',
+        'internal_links': [f"{base}/{random.choice(CATEGORIES)}/page-{random.randrange(pages)}.html"
+                           for _ in range(random.randint(20, 60))]
+    } for i in range(pages)]
+    manual_data = [{
+        'id': f"{i // 40}-{i % 40}",
+        'title': f"Uploaded File: circular-{i // 40}.pdf",
+        'content': ' '.join(sentence(random.randint(8, 20)) for _ in range(8)),
+        'category': 'uploaded_file',
+        'timestamp': '2026-10-19T10:00:00',
+        'url': 'uploaded_file',
+        'filename': f"circular-{i // 40}.pdf",
+        'upload_id': i // 40
+    } for i in range(chunks)]
+    # Round-trip through JSON so strings are not shared, as when loading from disk
+    return json.dumps(knowledge_base), json.dumps(manual_data)
+
+
+def real():
+    from kb_store import iter_records
+    try:
+        with open('manual_data.json', 'r', encoding='utf-8') as f:
+            manual_data = json.load(f)
+    except FileNotFoundError:
+        manual_data = []
+    return json.dumps(list(iter_records())), json.dumps(manual_data)
+
+
+def load_dicts(kb_text, manual_text):
+    return json.loads(kb_text), json.loads(manual_text)
+
+
+def load_lowered(kb_text, manual_text):
+    knowledge_base, manual_data = load_dicts(kb_text, manual_text)
+    lowered = [(item, item['content'].lower(), item.get('title', '').lower(), item.get('category', 'general').lower())
+               for item in knowledge_base + manual_data]
+    return knowledge_base, manual_data, lowered
+
+
+def load_compact(kb_text, manual_text):
+    knowledge_base = [Document(record, 'scraped') for record in json.loads(kb_text)]
+    manual_data = [manual_document(entry) for entry in json.loads(manual_text)]
+    index = ShardedIndex()
+    index.documents(knowledge_base, manual_data)
+    return knowledge_base, manual_data, index
+
+
+def measure(loader, kb_text, manual_text):
+    gc.collect()
+    tracemalloc.start()
+    kept = loader(kb_text, manual_text)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return kept, current, peak
+
+
+def legacy_query_seconds(knowledge_base, manual_data, queries):
+    started = time.perf_counter()
+    for query in queries:
+        all_data = knowledge_base + manual_data
+        for item in all_data:
+            content_lower = item['content'].lower()
+            item.get('title', '').lower()
+            query in content_lower
+    return (time.perf_counter() - started) / len(queries)
+
+
+def compact_query_seconds(knowledge_base, manual_data, index, queries):
+    started = time.perf_counter()
+    for query in queries:
+        for shard in index.documents(knowledge_base, manual_data):
+            for document in shard:
+                query in document.lower
+    return (time.perf_counter() - started) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--real', action='store_true', help='Measure the knowledge base in the current directory')
+    args = parser.parse_args()
+
+    random.seed(7)
+    kb_text, manual_text = real() if args.real else synthetic(args.pages, args.chunks)
+    print(f"📚 {len(json.loads(kb_text))} scraped pages, {len(json.loads(manual_text))} manual/upload entries, "
+          f"{(len(kb_text) + len(manual_text)) / 1e6:.1f} MB of JSON")
+
+    rows = []
+    for name, loader in (('dicts', load_dicts), ('dicts+lowered', load_lowered), ('compact', load_compact)):
+        kept, current, peak = measure(loader, kb_text, manual_text)
+        rows.append((name, current, peak))
+        if name == 'dicts':
+            dicts = kept
+        elif name == 'compact':
+            compact = kept
+        del kept
+
+    print(f"\n{'layout':<15}{'retained MB':>13}{'peak MB':>10}")
+    for name, current, peak in rows:
+        print(f"{name:<15}{current / 1e6:>13.1f}{peak / 1e6:>10.1f}")
+    print(f"\ncompact vs dicts: {rows[2][1] / rows[0][1]:.0%} of the memory, "
+          f"{(rows[0][1] - rows[2][1]) / 1e6:.1f} MB saved per worker")
+
+    queries = ['admission process', 'fee structure', 'holiday list', 'library timings', 'bus route']
+    print(f"\nper-query scan: dicts {legacy_query_seconds(*dicts, queries) * 1000:.1f}ms, "
+          f"compact {compact_query_seconds(*compact, queries) * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
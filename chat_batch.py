@@ -0,0 +1,85 @@
+"""Run many questions through the chatbot and write one JSON line per answer.
+
+Questions come from a text file (one per line) or a JSONL file ({"message": ...} per line).
+By default the app runs in this process; --url sends the batch to a running server's /chat/batch.
+
+    python chat_batch.py questions.txt --output answers.jsonl
+    python chat_batch.py questions.txt --url http://localhost:5000 --username admin --password ...
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+
+def read_questions(path):
+    questions = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                line = json.loads(line).get('message', '')
+            questions.append(line)
+    return questions
+
+
+def run_local(questions, concurrency, site):
+    from app import iter_batch_responses, BATCH_CONCURRENCY, tenants
+    yield from iter_batch_responses(questions, concurrency or BATCH_CONCURRENCY,
+                                    site=tenants.resolve(embed_key=site))
+
+
+def run_remote(questions, url, username, password, concurrency, site):
+    session = requests.Session()
+    login = session.post(f"{url.rstrip('/')}/admin/login", data={'username': username, 'password': password})
+    login.raise_for_status()
+    params = {'concurrency': concurrency} if concurrency else {}
+    if site:
+        params['site'] = site
+    with session.post(f"{url.rstrip('/')}/chat/batch", json={'messages': questions}, params=params,
+                      stream=True) as response:
+        if response.status_code != 200:
+            raise SystemExit(f"Batch failed ({response.status_code}): {response.text[:300]}")
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('questions', help='Text file (one question per line) or JSONL file')
+    parser.add_argument('--output', help='JSONL file for the answers (default: stdout)')
+    parser.add_argument('--concurrency', type=int, help='LLM calls in flight (default: BATCH_CONCURRENCY)')
+    parser.add_argument('--site', help='Embed key of the site to answer for (see sites.json; default: the default site)')
+    parser.add_argument('--url', help='Send the batch to this running server instead')
+    parser.add_argument('--username', default=os.getenv('DAVGPT_ADMIN_USER', 'admin'))
+    parser.add_argument('--password', default=os.getenv('DAVGPT_ADMIN_PASSWORD'))
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    if args.url:
+        results = run_remote(questions, args.url, args.username, args.password, args.concurrency, args.site)
+    else:
+        results = run_local(questions, args.concurrency, args.site)
+
+    started = time.perf_counter()
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    count = 0
+    try:
+        for result in results:
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"✅ {count}/{len(questions)} answers in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
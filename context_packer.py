@@ -0,0 +1,110 @@
+import os
+import re
+
+from dedup import normalize, shingles
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '500'))
+# Spans sharing this much of their word shingles with a chosen span add nothing new
+OVERLAP_THRESHOLD = 0.6
+# Knowledge base text is sentences plus the "HEADING:" / "•" markers written by the scraper
+_span_re = re.compile(r'(?<=[.!?|])\s+|\s+(?=HEADING:|•)')
+_stopwords = {
+    'the', 'and', 'for', 'are', 'what', 'when', 'where', 'which', 'who', 'how', 'is', 'of', 'to', 'in',
+    'tell', 'about', 'there', 'any', 'you', 'your', 'does', 'can', 'with', 'this', 'that', 'school'
+}
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token); no tokenizer download needed"""
+    return max(1, (len(text) + 3) // 4)
+
+
+def query_terms(query):
+    return {word for word in normalize(query) if len(word) > 2 and word not in _stopwords}
+
+
+def split_spans(text):
+    return [span.strip() for span in _span_re.split(text) if span and span.strip()]
+
+
+class PackedContext:
+    """Prompt context plus the sources it quotes and the token accounting"""
+
+    def __init__(self, text, sources, tokens_used, tokens_available):
+        self.text = text
+        self.sources = sources
+        self.tokens_used = tokens_used
+        self.tokens_available = tokens_available
+
+    @property
+    def tokens_saved(self):
+        return max(0, self.tokens_available - self.tokens_used)
+
+
+def _overlaps(span_shingles, chosen):
+    if not span_shingles:
+        return True
+    for other in chosen:
+        if len(span_shingles & other) / len(span_shingles) >= OVERLAP_THRESHOLD:
+            return True
+    return False
+
+
+def pack_context(query, passages, budget=None):
+    """Greedily fill the token budget with the most relevant, non-overlapping spans of ranked passages.
+
+    passages are knowledge base entries (content, title, url) in rank order. Spans are scored by
+    query-term matches weighted by passage rank, chosen by score per token, then emitted in their
+    original order grouped under numbered source labels.
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    terms = query_terms(query)
+    candidates = []
+    tokens_available = 0
+
+    for rank, passage in enumerate(passages):
+        tokens_available += estimate_tokens(passage['content'])
+        rank_weight = 1.0 / (1 + rank)
+        for position, span in enumerate(split_spans(passage['content'])):
+            words = normalize(span)
+            matches = len(terms.intersection(words))
+            # A passage's opening usually says what it is about, even without a direct match
+            prior = 0.3 if position == 0 else 0.0
+            score = (matches + prior) * rank_weight
+            candidates.append((score, rank, position, span, set(shingles(words))))
+
+    chosen, chosen_shingles = [], []
+    tokens_used = 0  # span text only; labels are small and counted in the final total
+    for score, rank, position, span, span_shingles in sorted(
+            candidates, key=lambda item: (-item[0] / estimate_tokens(item[3]), item[1], item[2])):
+        if score <= 0 and chosen:
+            break
+        cost = estimate_tokens(span)
+        if tokens_used + cost > budget or _overlaps(span_shingles, chosen_shingles):
+            continue
+        chosen.append((rank, position, span))
+        chosen_shingles.append(span_shingles)
+        tokens_used += cost
+
+    if not chosen and candidates:
+        # Even the best span is over budget: keep its beginning
+        best = min(candidates, key=lambda item: (-item[0], item[1], item[2]))
+        chosen.append((best[1], best[2], best[3][:budget * 4]))
+
+    by_passage = {}
+    for rank, position, span in sorted(chosen):
+        by_passage.setdefault(rank, []).append(span)
+
+    sections, sources = [], []
+    for rank, spans in sorted(by_passage.items()):
+        passage = passages[rank]
+        number = len(sources) + 1
+        sources.append({'number': number, 'rank': rank, 'title': passage.get('title', ''),
+                        'url': passage.get('url', '')})
+        label = f"[{number}] {passage.get('title', '')}".rstrip()
+        if passage.get('url') and passage['url'] != 'manual_entry':
+            label += f" ({passage['url']})"
+        sections.append(label + '\n' + ' '.join(spans))
+
+    text = '\n\n'.join(sections)
+    return PackedContext(text, sources, estimate_tokens(text) if text else 0, tokens_available)
@@ -0,0 +1,204 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import text, literal_column
+
+from models import db, Conversation
+
+# Written by older versions, capped at 1000 entries; imported into the conversation table once
+LEGACY_LOG_FILE = 'conversation_logs.json'
+LOG_PAGE_SIZE = int(os.getenv('LOG_PAGE_SIZE', '50'))
+# Rows fetched per query while streaming an export
+EXPORT_BATCH = 1000
+EXPORT_COLUMNS = ('id', 'timestamp', 'session_id', 'language', 'site', 'user_message', 'bot_response')
+
+# fts5 (SQLite), postgres (tsvector GIN index) or like (no index; scans)
+_search_backend = 'like'
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS conversation_fts USING fts5("
+    "user_message, bot_response, content='conversation', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS conversation_fts_insert AFTER INSERT ON conversation BEGIN "
+    "INSERT INTO conversation_fts(rowid, user_message, bot_response) "
+    "VALUES (new.id, new.user_message, new.bot_response); END",
+    "CREATE TRIGGER IF NOT EXISTS conversation_fts_delete AFTER DELETE ON conversation BEGIN "
+    "INSERT INTO conversation_fts(conversation_fts, rowid, user_message, bot_response) "
+    "VALUES ('delete', old.id, old.user_message, old.bot_response); END",
+    "CREATE TRIGGER IF NOT EXISTS conversation_fts_update AFTER UPDATE ON conversation BEGIN "
+    "INSERT INTO conversation_fts(conversation_fts, rowid, user_message, bot_response) "
+    "VALUES ('delete', old.id, old.user_message, old.bot_response); "
+    "INSERT INTO conversation_fts(rowid, user_message, bot_response) "
+    "VALUES (new.id, new.user_message, new.bot_response); END",
+]
+POSTGRES_FTS = ("CREATE INDEX IF NOT EXISTS ix_conversation_fts ON conversation "
+                "USING gin (to_tsvector('simple', user_message || ' ' || bot_response))")
+
+
+def setup_search():
+    """Create the full-text index over user and bot messages; call in an app context after create_all()"""
+    global _search_backend
+    dialect = db.engine.dialect.name
+    try:
+        with db.engine.begin() as connection:
+            if dialect == 'sqlite':
+                exists = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = 'conversation_fts'")).first()
+                for statement in SQLITE_FTS:
+                    connection.execute(text(statement))
+                if not exists:
+                    # Index the rows logged before the index existed
+                    connection.execute(text("INSERT INTO conversation_fts(conversation_fts) VALUES ('rebuild')"))
+                _search_backend = 'fts5'
+            elif dialect == 'postgresql':
+                connection.execute(text(POSTGRES_FTS))
+                _search_backend = 'postgres'
+    except Exception as e:
+        print(f"⚠️ Full-text log search unavailable, filtering with LIKE: {e}")
+        _search_backend = 'like'
+
+
+def text_filter(query):
+    """Clause matching conversations whose user or bot message contains every word of query"""
+    if _search_backend == 'fts5':
+        # Each word quoted, so punctuation in the search box is not read as FTS syntax
+        terms = ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+        matches = text("SELECT rowid FROM conversation_fts WHERE conversation_fts MATCH :terms")
+        return Conversation.id.in_(matches.bindparams(terms=terms).columns(rowid=db.Integer))
+    if _search_backend == 'postgres':
+        # Same expression as the index, so the planner can use it
+        document = Conversation.user_message.op('||')(literal_column("' '")).op('||')(Conversation.bot_response)
+        return db.func.to_tsvector('simple', document).op('@@')(db.func.plainto_tsquery('simple', query))
+    return db.and_(*[db.or_(Conversation.user_message.ilike(f"%{word}%"), Conversation.bot_response.ilike(f"%{word}%"))
+                     for word in query.split()])
+
+
+def filtered(clauses=(), q=None, language=None, session_id=None):
+    """Conversation query narrowed by the log viewer's filters"""
+    query = Conversation.query.filter(*clauses)
+    if q and q.strip():
+        query = query.filter(text_filter(q.strip()))
+    if language:
+        query = query.filter(Conversation.language == language)
+    if session_id:
+        query = query.filter(Conversation.session_id == session_id)
+    return query
+
+
+def encode_cursor(row):
+    return f"{row.timestamp.isoformat()},{row.id}"
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from a cursor, or None when missing or malformed"""
+    try:
+        timestamp, row_id = cursor.rsplit(',', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def page(query, before=None, after=None, limit=LOG_PAGE_SIZE):
+    """One page, newest first, by keyset on (timestamp, id): no OFFSET, so deep pages cost the same.
+
+    before/after are cursors of the last/first row of the page being left. Returns
+    (rows, newer cursor or None, older cursor or None).
+    """
+    key = db.tuple_(Conversation.timestamp, Conversation.id)
+    before, after = decode_cursor(before), decode_cursor(after)
+    if after:
+        rows = (query.filter(key > after).order_by(Conversation.timestamp.asc(), Conversation.id.asc())
+                .limit(limit + 1).all())
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return rows, encode_cursor(rows[0]) if has_newer else None, encode_cursor(rows[-1]) if rows else None
+
+    if before:
+        query = query.filter(key < before)
+    rows = query.order_by(Conversation.timestamp.desc(), Conversation.id.desc()).limit(limit + 1).all()
+    has_older = len(rows) > limit
+    rows = rows[:limit]
+    newer = encode_cursor(rows[0]) if before and rows else None
+    return rows, newer, encode_cursor(rows[-1]) if has_older else None
+
+
+def iter_export(query, fmt='csv'):
+    """Every matching conversation as CSV or JSONL lines, oldest first, read in keyset batches"""
+    columns = [getattr(Conversation, name) for name in EXPORT_COLUMNS]
+    key = db.tuple_(Conversation.timestamp, Conversation.id)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(EXPORT_COLUMNS)
+
+    last = None
+    while True:
+        batch = query.filter(key > last) if last else query
+        # Plain tuples rather than ORM objects, so the session does not fill up during long exports
+        rows = (batch.with_entities(*columns).order_by(Conversation.timestamp.asc(), Conversation.id.asc())
+                .limit(EXPORT_BATCH).all())
+        if not rows:
+            break
+        for row in rows:
+            values = dict(zip(EXPORT_COLUMNS, row))
+            values['timestamp'] = values['timestamp'].isoformat() if values['timestamp'] else None
+            if fmt == 'csv':
+                writer.writerow([values[name] for name in EXPORT_COLUMNS])
+            else:
+                buffer.write(json.dumps(values, ensure_ascii=False) + '\n')
+        last = (rows[-1].timestamp, rows[-1].id)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def to_utc(timestamp):
+    """Naive UTC (as datetime.utcnow stamps rows) from an ISO timestamp; naive values are local time"""
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    # astimezone() reads a naive datetime as local time
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def import_legacy_log(detect_language=None, path=LEGACY_LOG_FILE):
+    """Move conversation_logs.json into the conversation table, once.
+
+    The file is renamed before reading, so only one worker imports it, and kept as <path>.imported.
+    """
+    claimed = path + '.importing'
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return 0
+
+    try:
+        with open(claimed, 'r', encoding='utf-8') as f:
+            logs = json.load(f)
+        rows = []
+        for log in logs:
+            user_message = log.get('user_message') or ''
+            # Older versions logged datetime.now(), the server's local time
+            timestamp = to_utc(log.get('timestamp'))
+            rows.append(Conversation(
+                user_message=user_message,
+                bot_response=log.get('bot_response') or '',
+                language=detect_language(user_message) if detect_language else 'en',
+                timestamp=timestamp or datetime.utcnow()
+            ))
+        db.session.add_all(rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        os.rename(claimed, path)
+        print(f"⚠️ Could not import {path}: {e}")
+        return 0
+
+    os.rename(claimed, path + '.imported')
+    print(f"📥 Imported {len(rows)} conversations from {path}")
+    return len(rows)
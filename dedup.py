@@ -0,0 +1,95 @@
+import hashlib
+import re
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+# 8 bands of 8 bits: any pair within 7 differing bits shares at least one band exactly
+LSH_BANDS = 8
+MAX_DISTANCE = 7
+
+_word_re = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Lowercase word tokens with punctuation removed"""
+    return _word_re.findall(text.lower())
+
+
+def _hash64(value):
+    # blake2b instead of hash(): stable across processes and runs
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def shingles(words, size=SHINGLE_SIZE):
+    if len(words) <= size:
+        return [' '.join(words)] if words else []
+    return [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def simhash(text):
+    """64-bit SimHash over word shingles of the whole passage"""
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles(normalize(text)):
+        value = _hash64(shingle)
+        for bit in range(FINGERPRINT_BITS):
+            if value >> bit & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class NearDuplicateIndex:
+    """LSH index over SimHash fingerprints for finding near-duplicate passages"""
+
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.band_bits = FINGERPRINT_BITS // LSH_BANDS
+        self.band_mask = (1 << self.band_bits) - 1
+        self.buckets = {}
+        self.fingerprints = {}
+
+    def _band_keys(self, fingerprint):
+        return [(band, fingerprint >> (band * self.band_bits) & self.band_mask) for band in range(LSH_BANDS)]
+
+    def find(self, fingerprint):
+        """Return the key of an indexed near-duplicate, or None"""
+        for band_key in self._band_keys(fingerprint):
+            for key in self.buckets.get(band_key, ()):
+                if hamming_distance(fingerprint, self.fingerprints[key]) <= self.max_distance:
+                    return key
+        return None
+
+    def add(self, key, fingerprint):
+        self.fingerprints[key] = fingerprint
+        for band_key in self._band_keys(fingerprint):
+            self.buckets.setdefault(band_key, []).append(key)
+
+    def remove(self, key):
+        fingerprint = self.fingerprints.pop(key, None)
+        if fingerprint is None:
+            return
+        for band_key in self._band_keys(fingerprint):
+            bucket = self.buckets.get(band_key)
+            if bucket and key in bucket:
+                bucket.remove(key)
+
+    def add_if_new(self, key, text):
+        """Index text under key unless a near-duplicate exists; return the duplicate's key or None"""
+        fingerprint = simhash(text)
+        duplicate = self.find(fingerprint)
+        if duplicate is None:
+            self.add(key, fingerprint)
+        return duplicate
+
+    def __len__(self):
+        return len(self.fingerprints)
@@ -17,7 +17,7 @@ if [ ! -f .env ]; then
 fi
 
 # Run initial scraping if knowledge base doesn't exist
-if [ ! -f knowledge_base.json ]; then
+if [ ! -f knowledge_base/manifest.json ] && [ ! -f knowledge_base.json ]; then
     echo "🕷️ Running initial data scraping..."
     source venv/bin/activate 2>/dev/null || python3 -m venv venv && source venv/bin/activate
     pip install -r requirements.txt
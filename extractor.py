@@ -0,0 +1,178 @@
+import re
+from urllib.parse import urljoin
+
+try:
+    import lxml.html
+    from lxml import etree
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+from bs4 import BeautifulSoup, NavigableString
+from bs4.element import PreformattedString
+
+SKIP_TAGS = {'script', 'style', 'nav', 'footer', 'header', 'aside', 'noscript', 'iframe', 'head', 'template', 'svg'}
+BLOCK_ROLES = {
+    'h1': 'heading', 'h2': 'heading', 'h3': 'heading', 'h4': 'heading', 'h5': 'heading', 'h6': 'heading',
+    'p': 'paragraph', 'li': 'list', 'tr': 'table', 'dt': 'list', 'dd': 'list',
+    'div': 'text', 'section': 'text', 'article': 'text', 'main': 'text', 'blockquote': 'paragraph',
+    'body': 'text', 'form': 'text', 'center': 'text'
+}
+CELL_TAGS = {'td', 'th'}
+# Minimum text length per role, mirroring the old per-tag filters
+MIN_LENGTH = {'heading': 3, 'paragraph': 20, 'list': 10, 'table': 0, 'text': 30}
+_CELL_BREAK = object()
+
+
+def clean_text(text):
+    text = re.sub(r'\s+', ' ', text.strip())
+    text = re.sub(r'[^\w\s.,!?()-]', '', text)
+    return text
+
+
+class _BlockCollector:
+    """Assigns every text node to its innermost block exactly once, in document order"""
+
+    def __init__(self):
+        self.blocks = []
+        # Each stack entry is [role, open text run]; the root catches text outside any block
+        self.stack = [['text', None]]
+
+    def open(self, tag):
+        role = BLOCK_ROLES.get(tag)
+        if tag in CELL_TAGS:
+            if self.stack[-1][0] == 'table' and self.stack[-1][1] is not None:
+                self.stack[-1][1].append(_CELL_BREAK)
+            return False
+        if role is None:
+            return False
+        # Headings, list items, rows and paragraphs absorb their nested divs/paragraphs
+        if self.stack[-1][0] != 'text' and role not in ('list', 'table'):
+            return False
+        # Seal the parent's text run so text after this child keeps reading order
+        self.stack[-1][1] = None
+        self.stack.append([role, None])
+        return True
+
+    def close(self):
+        self.stack.pop()
+        self.stack[-1][1] = None
+
+    def text(self, value):
+        if not value or value.isspace():
+            return
+        top = self.stack[-1]
+        if top[1] is None:
+            top[1] = []
+            self.blocks.append((top[0], top[1]))
+        top[1].append(value)
+
+    def results(self):
+        """Return (role, text) pairs for non-empty blocks"""
+        output = []
+        for role, parts in self.blocks:
+            if role == 'table':
+                cells, current = [], []
+                for part in parts:
+                    if part is _CELL_BREAK:
+                        if current:
+                            cells.append(' '.join(current))
+                        current = []
+                    else:
+                        current.append(part)
+                if current:
+                    cells.append(' '.join(current))
+                text = ' | '.join(clean_text(cell) for cell in cells if cell.strip())
+            else:
+                text = clean_text(' '.join(parts))
+            if text:
+                output.append((role, text))
+        return output
+
+
+def _walk_lxml(content, base_url):
+    root = lxml.html.document_fromstring(content)
+    collector = _BlockCollector()
+    opened = []
+    title_elem = root.find('.//title')
+    title = title_elem.text_content() if title_elem is not None else None
+    links = set()
+
+    # Comments and processing instructions only come as their own events; their tails are page text
+    walker = etree.iterwalk(root, events=('start', 'end', 'comment', 'pi'))
+    for event, element in walker:
+        tag = element.tag if isinstance(element.tag, str) else None
+        if event in ('comment', 'pi'):
+            collector.text(element.tail)
+        elif event == 'start':
+            if tag == 'a' and element.get('href'):
+                links.add(urljoin(base_url, element.get('href')))
+            if tag is None or tag in SKIP_TAGS:
+                opened.append(False)
+                walker.skip_subtree()
+                continue
+            opened.append(collector.open(tag))
+            collector.text(element.text)
+        else:
+            if opened.pop():
+                collector.close()
+            # The tail belongs to the enclosing block, even for skipped elements
+            collector.text(element.tail)
+
+    return title, collector.results(), links
+
+
+def _walk_soup(content, base_url):
+    soup = BeautifulSoup(content, 'html.parser')
+    collector = _BlockCollector()
+    title_elem = soup.find('title')
+    title = title_elem.get_text() if title_elem else None
+    links = set(urljoin(base_url, a['href']) for a in soup.find_all('a', href=True))
+
+    stack = [(soup, False)]
+    while stack:
+        node, closing = stack.pop()
+        if closing:
+            collector.close()
+            continue
+        if isinstance(node, NavigableString):
+            if not isinstance(node, PreformattedString):
+                collector.text(str(node))
+            continue
+        if node.name in SKIP_TAGS:
+            continue
+        if node is not soup and collector.open(node.name):
+            stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node.contents))
+
+    return title, collector.results(), links
+
+
+def extract_page(content, base_url):
+    """Walk the HTML once and return (title, [(role, text), ...], links)"""
+    if HAS_LXML:
+        try:
+            return _walk_lxml(content, base_url)
+        except (etree.ParserError, ValueError):
+            pass
+    return _walk_soup(content, base_url)
+
+
+def format_blocks(blocks):
+    """Render extracted blocks in the knowledge base text format"""
+    content_parts = []
+    for role, text in blocks:
+        if len(text) <= MIN_LENGTH[role]:
+            continue
+        if role == 'heading':
+            content_parts.append(f"HEADING: {text}")
+        elif role == 'list':
+            content_parts.append(f"• {text}")
+        else:
+            content_parts.append(text)
+
+    content = ' '.join(content_parts)
+    # Short pages: fall back to all body text
+    if len(content) < 100:
+        content = ' '.join(text for _, text in blocks)
+    return content
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from context_packer import query_terms
+from dedup import normalize
+from file_lock import file_lock
+from metrics import inc
+
+FAQ_FILE = os.getenv('FAQ_FILE', 'faq_answers.json')
+FAQ_MIN_COUNT = int(os.getenv('FAQ_MIN_COUNT', '3'))
+FAQ_MAX_QUESTIONS = int(os.getenv('FAQ_MAX_QUESTIONS', '30'))
+# Recent user messages mined for frequent questions
+FAQ_MINE_MESSAGES = int(os.getenv('FAQ_MINE_MESSAGES', '50000'))
+# The intents most parents ask about, answered even before the logs show them
+SEED_QUESTIONS = [
+    'What is the school address?',
+    'What is the fee structure?',
+    'What is the admission process?',
+    'What events are coming up at the school?',
+]
+DEVANAGARI = re.compile(r'[ऀ-ॿ]')
+RELOAD_CHECK_SECONDS = 1.0
+
+
+def faq_key(question):
+    """Content words in sorted order, so rephrasings like "school address?" and "address of school" match.
+
+    Numbers are kept however short: "fee for class 10" and "fee for class 12" need different answers.
+    """
+    terms = query_terms(question) | {word for word in normalize(question) if word.isdigit()}
+    return ' '.join(sorted(terms)) if terms else None
+
+
+def source_version(passage):
+    return hashlib.sha256(passage['content'].encode('utf-8')).hexdigest()[:16]
+
+
+def mine_questions(messages, translate=None, min_count=FAQ_MIN_COUNT, limit=FAQ_MAX_QUESTIONS, skip=None):
+    """Most frequent questions (English form) from past user messages, plus the seed intents.
+
+    translate(text) -> (english, lang) is only called for Devanagari messages; without it they are
+    skipped (the app logs the English form of Hindi questions, so mining makes no translation calls).
+    skip(question) -> True drops questions answered elsewhere (e.g. live holiday lookups).
+    """
+    counts, examples = Counter(), {}
+    for message in messages:
+        message = (message or '').strip()
+        if not message:
+            continue
+        if DEVANAGARI.search(message):
+            if translate is None:
+                continue
+            message, _ = translate(message)
+        key = faq_key(message)
+        if key is None or (skip is not None and skip(message)):
+            continue
+        counts[key] += 1
+        examples.setdefault(key, Counter())[message] += 1
+
+    questions = [examples[key].most_common(1)[0][0] for key, count in counts.most_common() if count >= min_count]
+    seen = {faq_key(question) for question in questions}
+    for question in SEED_QUESTIONS:
+        if faq_key(question) not in seen and (skip is None or not skip(question)):
+            questions.append(question)
+            seen.add(faq_key(question))
+    return questions[:limit]
+
+
+class FAQStore:
+    """Precomputed English/Hindi answers keyed by question, each tied to the versions of its sources"""
+
+    def __init__(self, path=FAQ_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.mtime = None
+        self.checked = 0
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        # Another worker may have rebuilt the file
+        now = time.time()
+        if now - self.checked < RELOAD_CHECK_SECONDS:
+            return
+        self.checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self.mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Could not load FAQ answers: {e}")
+            return
+        with self.lock:
+            self.entries = entries
+            self.mtime = mtime
+
+    def save(self):
+        with self.lock:
+            entries = dict(self.entries)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.mtime = os.path.getmtime(self.path)
+
+    def lookup(self, question, lang='en'):
+        """Return the stored answer in the given language, or None"""
+        self.reload_if_changed()
+        key = faq_key(question)
+        entry = self.entries.get(key) if key else None
+        answer = entry['answers'].get(lang) if entry else None
+        inc('davgpt_faq_lookups_total', result='hit' if answer else 'miss')
+        return answer
+
+    def invalidate_urls(self, urls):
+        """Drop answers quoting pages that changed or disappeared; the next rebuild regenerates them"""
+        urls = set(urls)
+        if not urls:
+            return 0
+        with self.lock:
+            stale = [key for key, entry in self.entries.items()
+                     if any(source['url'] in urls for source in entry['sources'])]
+            for key in stale:
+                del self.entries[key]
+        if stale:
+            self.save()
+        return len(stale)
+
+    @contextmanager
+    def exclusive(self):
+        """Held around mining and rebuild; yields False when another process is already rebuilding"""
+        with file_lock(f"{self.path}.lock", blocking=False) as acquired:
+            yield acquired
+
+    def rebuild(self, rag, questions, translate_to_hindi):
+        """Regenerate answers whose sources changed; unchanged entries are kept without any LLM call.
+
+        Call inside exclusive(): every worker refreshes on its own schedule.
+        """
+        self.checked = 0
+        self.reload_if_changed()
+        return self._rebuild(rag, questions, translate_to_hindi)
+
+    def _rebuild(self, rag, questions, translate_to_hindi):
+        entries, generated, kept = {}, 0, 0
+        for question in questions:
+            key = faq_key(question)
+            results, packed = rag.retrieve_context(question)
+            if key is None or not results:
+                continue
+            sources = [{'url': source['url'], 'version': source_version(results[source['rank']])}
+                       for source in packed.sources]
+
+            existing = self.entries.get(key)
+            if existing and existing['sources'] == sources:
+                entries[key] = existing
+                kept += 1
+                continue
+
+            answer = rag.call_llm(rag.retrieval_prompt(question, packed))
+            if not answer or len(answer) <= 20:
+                # No canonical answer without the LLM; keep serving the old one if any
+                if existing:
+                    entries[key] = existing
+                continue
+            url = next((source['url'] for source in packed.sources if source['url'] != 'manual_entry'), '')
+            english = rag.add_source_link(rag.make_links_clickable(answer), url)
+            entries[key] = {
+                'question': question,
+                'answers': {'en': english, 'hi': translate_to_hindi(english)},
+                'sources': sources,
+                'generated_at': datetime.now().isoformat()
+            }
+            generated += 1
+
+        with self.lock:
+            self.entries = entries
+        self.save()
+        print(f"📚 FAQ answers: {generated} generated, {kept} unchanged, {len(entries)} total")
+        return generated
+
+
+if __name__ == '__main__':
+    import sys
+    from app import rebuild_faqs, tenants
+    # python faq_store.py [site key]
+    rebuild_faqs(tenants.get(sys.argv[1] if len(sys.argv) > 1 else None))
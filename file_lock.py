@@ -0,0 +1,42 @@
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows (run.bat / setup.bat)
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Hold an exclusive lock on path across processes.
+
+    Yields True once held; with blocking=False, yields False straight away if another process has it.
+    """
+    with open(path, 'a+') as lock_file:
+        acquired = True
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                acquired = False
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        acquired = False
+                        break
+                    time.sleep(0.1)
+        try:
+            yield acquired
+        finally:
+            # flock is released when the file closes; msvcrt locks are not
+            if acquired and not fcntl:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,132 @@
+import heapq
+import itertools
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+
+# Checked in order; the first category whose hint appears in the URL wins
+CATEGORY_HINTS = [
+    ('admissions', ['admission', 'enrol', 'registration', 'prospectus']),
+    ('fees', ['fee', 'payment']),
+    ('notices', ['notice', 'circular', 'news', 'announcement', 'datesheet']),
+    ('events', ['event', 'calendar', 'holiday', 'celebration']),
+    ('contact', ['contact', 'address', 'location']),
+    ('academics', ['academic', 'curriculum', 'syllabus', 'result', 'exam', 'class']),
+    ('about', ['about', 'principal', 'staff', 'faculty', 'history', 'management', 'message']),
+    ('facilities', ['facilit', 'infrastructure', 'library', 'lab', 'sport', 'transport', 'bus']),
+]
+# Lower crawls first
+CATEGORY_PRIORITY = {
+    'home': 0, 'admissions': 1, 'fees': 1, 'notices': 2, 'events': 2, 'contact': 3,
+    'academics': 4, 'about': 4, 'facilities': 5, 'general': 6
+}
+SKIP_EXTENSIONS = (
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico', '.zip', '.rar',
+    '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.mp3', '.mp4', '.avi', '.css', '.js'
+)
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid')
+
+
+def normalize_url(url):
+    """Canonical form used for deduplication: no fragment, lowercase host, sorted query, no tracking params"""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                             if not key.lower().startswith(TRACKING_PARAMS)))
+    return urlunparse((scheme, netloc, parsed.path or '/', '', query, ''))
+
+
+def categorize_url(url):
+    path = urlparse(url).path.lower()
+    if path in ('', '/', '/index.html', '/index.php'):
+        return 'home'
+    for category, hints in CATEGORY_HINTS:
+        if any(hint in path for hint in hints):
+            return category
+    return 'general'
+
+
+class CrawlFrontier:
+    """Deduplicated priority queue of URLs to crawl, ordered by category and depth"""
+
+    def __init__(self, base_url, max_depth=5, max_per_depth=300):
+        self.base_netloc = urlparse(normalize_url(base_url)).netloc
+        self.max_depth = max_depth
+        self.max_per_depth = max_per_depth
+        self.seen = set()
+        self.depth_counts = {}
+        self.heap = []
+        self.counter = itertools.count()
+        self.robots = None
+
+    def accepts(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or parsed.netloc != self.base_netloc:
+            return False
+        if parsed.path.lower().endswith(SKIP_EXTENSIONS):
+            return False
+        if self.robots is not None and not self.robots.can_fetch('*', url):
+            return False
+        return True
+
+    def push(self, url, depth, category=None, seed=False):
+        """Queue a URL unless already seen, off-site, disallowed or over the depth limits.
+
+        Seeds (sitemap entries) are exempt from max_per_depth and do not use it up, so a sitemap
+        is queued in full; the crawl's page and time budgets still apply.
+        """
+        url = normalize_url(url)
+        if url in self.seen or depth > self.max_depth or not self.accepts(url):
+            return False
+        if not seed and self.depth_counts.get(depth, 0) >= self.max_per_depth:
+            return False
+
+        self.seen.add(url)
+        if not seed:
+            self.depth_counts[depth] = self.depth_counts.get(depth, 0) + 1
+        category = category or categorize_url(url)
+        priority = CATEGORY_PRIORITY.get(category, CATEGORY_PRIORITY['general'])
+        heapq.heappush(self.heap, (priority, depth, next(self.counter), url, category))
+        return True
+
+    def pop(self):
+        """Return (url, depth, category) of the highest-priority URL, or None when empty"""
+        if not self.heap:
+            return None
+        _, depth, _, url, category = heapq.heappop(self.heap)
+        return url, depth, category
+
+    def __len__(self):
+        return len(self.heap)
+
+    def load_robots(self, robots_txt):
+        """Apply robots.txt rules and return the sitemap URLs it lists"""
+        self.robots = RobotFileParser()
+        self.robots.parse(robots_txt.splitlines())
+        return self.robots.site_maps() or []
+
+    def crawl_delay(self, default):
+        if self.robots is not None:
+            delay = self.robots.crawl_delay('*')
+            if delay is not None:
+                return float(delay)
+        return default
+
+
+def parse_sitemap(xml_content):
+    """Return (page_urls, nested_sitemap_urls) from a sitemap or sitemap index document"""
+    page_urls, sitemap_urls = [], []
+    try:
+        root = ET.fromstring(xml_content)
+    except ET.ParseError:
+        return page_urls, sitemap_urls
+
+    # Sitemap indexes list further sitemaps, regular sitemaps list pages
+    target = sitemap_urls if root.tag.endswith('sitemapindex') else page_urls
+    for element in root.iter():
+        if element.tag.endswith('loc') and element.text:
+            target.append(element.text.strip())
+    return page_urls, sitemap_urls
@@ -0,0 +1,23 @@
+# Gunicorn serving profiles, picked with DAVGPT_SERVER_MODE:
+#   sync    - one request per worker process (the original run-production.sh setup)
+#   gthread - DAVGPT_THREADS requests per worker; slow Gemini/translation calls only hold a thread
+#   gevent  - DAVGPT_WORKER_CONNECTIONS cooperative requests per worker (needs `pip install gevent`)
+#             (the admin Live Profiler cannot sample greenlets and refuses to start)
+import os
+
+mode = os.getenv('DAVGPT_SERVER_MODE', 'gthread')
+
+bind = os.getenv('DAVGPT_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('DAVGPT_WORKERS', '4'))
+timeout = int(os.getenv('DAVGPT_TIMEOUT', '120'))
+
+if mode == 'gthread':
+    worker_class = 'gthread'
+    threads = int(os.getenv('DAVGPT_THREADS', '32'))
+elif mode == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.getenv('DAVGPT_WORKER_CONNECTIONS', '500'))
+elif mode == 'sync':
+    worker_class = 'sync'
+else:
+    raise ValueError(f"Unknown DAVGPT_SERVER_MODE: {mode}")
@@ -0,0 +1,151 @@
+import gzip
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlparse, parse_qs
+
+# Bodies are stored decoded, so transport headers no longer describe them
+DROPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection', 'keep-alive'}
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class ArchiveWriter:
+    """Appends scraper responses to a WARC/1.1-style archive (gzipped if the path ends in .gz)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def write(self, url, response):
+        status_line = f"HTTP/1.1 {response.status_code} {response.reason or ''}".rstrip()
+        header_lines = [f"{name}: {value}" for name, value in response.headers.items()
+                        if name.lower() not in DROPPED_HEADERS]
+        header_lines.append(f"Content-Length: {len(response.content)}")
+        http_block = ('\r\n'.join([status_line] + header_lines) + '\r\n\r\n').encode('utf-8') + response.content
+
+        warc_headers = '\r\n'.join([
+            'WARC/1.1',
+            'WARC-Type: response',
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+            f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+            f"WARC-Target-URI: {url}",
+            'Content-Type: application/http;msgtype=response',
+            f"Content-Length: {len(http_block)}",
+        ]) + '\r\n\r\n'
+
+        with self.lock, _open(self.path, 'ab') as f:
+            f.write(warc_headers.encode('utf-8'))
+            f.write(http_block)
+            f.write(b'\r\n\r\n')
+
+
+def _read_record(f):
+    """(WARC headers, block) of the record after a WARC/ line, or None if the archive ends mid-record"""
+    warc_headers = {}
+    while True:
+        header = f.readline()
+        if not header:
+            return None
+        if header == b'\r\n':
+            break
+        name, _, value = header.decode('utf-8', 'replace').partition(':')
+        warc_headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(warc_headers['content-length'])
+    except (KeyError, ValueError):
+        return None
+    block = f.read(length)
+    if len(block) < length:
+        return None
+    f.read(4)  # record separator
+    return warc_headers, block
+
+
+def read_archive(path):
+    """Return {url: (status, [(header, value)], body)}; later records for a URL win.
+
+    An archive cut off mid-record (crawl killed while recording) yields the complete records before it.
+    """
+    records = {}
+    with _open(path, 'rb') as f:
+        while True:
+            try:
+                line = f.readline()
+                if not line:
+                    break
+                if not line.startswith(b'WARC/'):
+                    continue
+                record = _read_record(f)
+            except EOFError:
+                # gzip stream without its end marker
+                record = None
+            if record is None:
+                print(f"⚠️ {path} is truncated; replaying the {len(records)} complete records before the cut")
+                break
+
+            warc_headers, block = record
+            if warc_headers.get('warc-type') != 'response':
+                continue
+            head, _, body = block.partition(b'\r\n\r\n')
+            lines = head.decode('utf-8').split('\r\n')
+            status = int(lines[0].split(' ', 2)[1])
+            headers = [tuple(part.strip() for part in line.split(':', 1)) for line in lines[1:] if ':' in line]
+            records[warc_headers['warc-target-uri']] = (status, headers, body)
+    return records
+
+
+class ReplayServer:
+    """Local stand-in server answering /fetch?url=... from an archive"""
+
+    def __init__(self, path, host='127.0.0.1', port=0):
+        records = read_archive(path)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = parse_qs(urlparse(self.path).query).get('url', [''])[0]
+                record = records.get(url)
+                if record is None:
+                    self.send_error(404, 'Not in archive')
+                    return
+                status, headers, body = record
+                etag = dict((name.lower(), value) for name, value in headers).get('etag')
+                if etag and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.record_count = len(records)
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, url):
+        return f"{self.base_url}/fetch?url={quote(url, safe='')}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,223 @@
+import re
+
+from context_packer import split_spans
+
+# Devanagari vowel signs are not \w, so word boundaries treat the whole block as word characters
+_WORD_CHARS = r'\wऀ-ॿ'
+DEVANAGARI = re.compile(r'[ऀ-ॿ]')
+
+HUMAN_KEYWORDS = [
+    'human', 'real person', 'talk to someone', 'speak to someone', 'talk to a person', 'speak to a person',
+    'talk to staff', 'speak to staff', 'call me', 'call back', 'callback', 'meet the principal', 'meet someone',
+    'व्यक्ति', 'इंसान', 'किसी से बात', 'स्टाफ से बात', 'कॉल करें'
+]
+HOLIDAY_KEYWORDS = [
+    'holiday', 'holidays', 'festival', 'festivals', 'vacation', 'vacations', 'day off', 'days off',
+    'छुट्टी', 'छुट्टियां', 'छुट्टियाँ', 'अवकाश', 'त्योहार'
+]
+CONTACT_KEYWORDS = [
+    'contact', 'phone', 'phone number', 'mobile', 'email', 'e-mail', 'telephone', 'helpline',
+    'संपर्क', 'फोन', 'फ़ोन', 'मोबाइल', 'ईमेल'
+]
+# Only phrases meaning school or office hours: "what time is the annual day?" or "परीक्षा का समय" (exam
+# time) must reach the knowledge base
+TIMING_KEYWORDS = [
+    'school timing', 'school timings', 'school time', 'school times', 'school hours', 'office hours',
+    'office timing', 'office timings', 'opening time', 'closing time', 'स्कूल का समय', 'स्कूल समय',
+    'विद्यालय का समय'
+]
+# Not fast paths: these only mark a question as one to answer from the knowledge base
+SCHOOL_KEYWORDS = [
+    'dav', 'school', 'admission', 'admissions', 'fee', 'fees', 'event', 'events', 'facility', 'facilities',
+    'teacher', 'teachers', 'student', 'students', 'class', 'koyla', 'nagar', 'address', 'location', 'number',
+    'time', 'cost', 'where', 'when', 'how much', 'principal', 'staff', 'activities',
+    'स्कूल', 'विद्यालय', 'प्रवेश', 'दाखिला', 'फीस', 'शुल्क', 'पता', 'शिक्षक', 'कक्षा'
+]
+# Crawler categories (see frontier.CATEGORY_HINTS) worth searching first when a question is about a topic
+TOPIC_CATEGORIES = {
+    'events': ('events', 'notices'),
+    'notices': ('notices', 'events'),
+    'admissions': ('admissions',),
+    'fees': ('fees', 'admissions'),
+    'contact': ('contact', 'home'),
+}
+TOPIC_KEYWORDS = {
+    'events': HOLIDAY_KEYWORDS + ['event', 'events', 'celebration', 'annual day', 'function', 'कार्यक्रम', 'समारोह'],
+    'notices': ['notice', 'notices', 'circular', 'circulars', 'announcement', 'datesheet', 'date sheet', 'सूचना'],
+    'admissions': ['admission', 'admissions', 'enrol', 'enroll', 'enrolment', 'registration', 'prospectus',
+                   'प्रवेश', 'दाखिला'],
+    'fees': ['fee', 'fees', 'fee structure', 'payment', 'फीस', 'शुल्क'],
+    'contact': CONTACT_KEYWORDS + ['address', 'location', 'पता'],
+}
+MONTHS = {
+    # "may" alone is usually the verb ("may I know..."), so it only counts as a month in these phrases
+    'in may': 5, 'of may': 5, 'for may': 5, 'during may': 5, 'may month': 5,
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'june': 6,
+    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'jun': 6, 'jul': 7, 'aug': 8,
+    'sep': 9, 'sept': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+    'जनवरी': 1, 'फरवरी': 2, 'फ़रवरी': 2, 'मार्च': 3, 'अप्रैल': 4, 'मई': 5, 'जून': 6, 'जुलाई': 7,
+    'अगस्त': 8, 'सितंबर': 9, 'सितम्बर': 9, 'अक्टूबर': 10, 'अक्तूबर': 10, 'नवंबर': 11, 'नवम्बर': 11,
+    'दिसंबर': 12, 'दिसम्बर': 12
+}
+# When a message matches several intents the first one here wins
+PRIORITY = ['human', 'holidays', 'contact', 'timings']
+
+
+class Intent:
+    """Result of routing one message: the fast-path kind (or None), a month, and whether it is about the school"""
+
+    def __init__(self, kind=None, month=None, school=False, keywords=(), categories=(), topic=None):
+        self.kind = kind
+        self.month = month
+        self.school = school
+        self.keywords = keywords
+        # Knowledge base categories to search first (see SimpleRAG.search_batch)
+        self.categories = categories
+        # First TOPIC_KEYWORDS topic mentioned (events, notices, admissions, fees, contact)
+        self.topic = topic
+
+    @property
+    def label(self):
+        """One name for analytics: the fast-path kind, else the topic, else school or general"""
+        if self.kind or self.topic:
+            return self.kind or self.topic
+        return 'school' if self.school else 'general'
+
+    def __repr__(self):
+        return (f"Intent(kind={self.kind!r}, month={self.month!r}, school={self.school}, "
+                f"categories={self.categories!r})")
+
+
+class IntentRouter:
+    """Every keyword compiled into one word-bounded regex, so a message is classified in a single pass"""
+
+    def __init__(self):
+        self.labels = {}
+        for label, keywords in (('human', HUMAN_KEYWORDS), ('holidays', HOLIDAY_KEYWORDS),
+                                ('contact', CONTACT_KEYWORDS), ('timings', TIMING_KEYWORDS),
+                                ('school', SCHOOL_KEYWORDS)):
+            for keyword in keywords:
+                self.labels.setdefault(keyword, []).append((label, None))
+        for name, number in MONTHS.items():
+            self.labels.setdefault(name, []).append(('month', number))
+        for topic, keywords in TOPIC_KEYWORDS.items():
+            for keyword in keywords:
+                self.labels.setdefault(keyword, []).append(('topic', topic))
+
+        # Longest first, so "talk to someone" wins over any shorter keyword inside it
+        alternatives = '|'.join(re.escape(keyword) for keyword in sorted(self.labels, key=len, reverse=True))
+        self.pattern = re.compile(rf'(?<![{_WORD_CHARS}])(?:{alternatives})(?![{_WORD_CHARS}])', re.IGNORECASE)
+
+    def classify(self, text):
+        found, month, keywords, categories, topic = set(), None, [], set(), None
+        for match in self.pattern.finditer(text):
+            keyword = match.group(0).lower()
+            keywords.append(keyword)
+            for label, value in self.labels.get(keyword, ()):
+                if label == 'month':
+                    month = month or value
+                elif label == 'topic':
+                    categories.update(TOPIC_CATEGORIES[value])
+                    topic = topic or value
+                else:
+                    found.add(label)
+
+        kind = next((label for label in PRIORITY if label in found), None)
+        school = bool(found) or bool(categories)
+        return Intent(kind, month if kind == 'holidays' else None, school, tuple(keywords),
+                      tuple(sorted(categories)), topic)
+
+
+def is_hindi(text):
+    return bool(DEVANAGARI.search(text))
+
+
+class FastPaths:
+    """Deterministic answers for routed intents; never call Gemini or the translator"""
+
+    MONTH_NAMES = {
+        'en': ['', 'January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December'],
+        'hi': ['', 'जनवरी', 'फरवरी', 'मार्च', 'अप्रैल', 'मई', 'जून',
+               'जुलाई', 'अगस्त', 'सितंबर', 'अक्टूबर', 'नवंबर', 'दिसंबर']
+    }
+    # Canonical searches, so Hindi messages need no translation to find the right pages
+    SEARCHES = {'contact': 'contact phone email', 'timings': 'school timings hours'}
+    PATTERNS = {
+        'contact': re.compile(r'(?:\+?91[\s-]?)?\(?\d{2,5}\)?[\s-]?\d{3,4}[\s-]?\d{3,5}|[\w.+-]+@[\w-]+\.[\w.]+'),
+        'timings': re.compile(r'\b\d{1,2}(?:[:.]\d{2})?\s*(?:a\.?m\b\.?|p\.?m\b\.?)', re.IGNORECASE)
+    }
+    # Filled in with the site's school name (Site.name / Site.name_hi)
+    HEADINGS = {
+        'contact': {'en': '**{en} Contact Information:**', 'hi': '**{hi} संपर्क जानकारी:**'},
+        'timings': {'en': '**{en} School Timings:**', 'hi': '**{hi} स्कूल का समय:**'}
+    }
+    MAX_SPANS = 3
+
+    def __init__(self, rag):
+        self.rag = rag
+
+    def answer(self, intent, lang='en'):
+        """Return the answer text, or None when the intent has no fast path or nothing was found"""
+        if intent.kind == 'human':
+            return self.human(lang)
+        if intent.kind == 'holidays':
+            return self.holidays(intent.month, lang)
+        if intent.kind in self.SEARCHES:
+            return self.facts(intent.kind, lang)
+        return None
+
+    def human(self, lang):
+        if lang == 'hi':
+            return "मैं आपको स्कूल के स्टाफ से जोड़ सकता हूं। कृपया अपना नाम और संपर्क नंबर बताएं।"
+        return "I can connect you with our school staff. Please provide your name and contact number."
+
+    def holidays(self, month, lang):
+        holidays = self.rag.fetch_holidays_from_db(month)
+        month_name = self.MONTH_NAMES[lang][month] if month else None
+
+        if not holidays:
+            if lang == 'hi':
+                where = f"{month_name} में" if month_name else "हमारे कैलेंडर में"
+                return f"{where} कोई छुट्टी नहीं मिली। स्कूल के कार्यक्रमों और छुट्टियों की जानकारी के लिए बाद में देखें।"
+            if month_name:
+                return f"No holidays found for {month_name}. Please check back later for updates on school events and holidays."
+            return "No holidays found in our calendar. Please check back later for updates on school events and holidays."
+
+        if lang == 'hi':
+            response = f"**{month_name} की छुट्टियां:**\n\n" if month_name else "**आगामी छुट्टियां:**\n\n"
+        else:
+            response = f"**Holidays in {month_name}:**\n\n" if month_name else "**Upcoming Holidays:**\n\n"
+        for holiday in holidays:
+            response += f"🎉 **{holiday['title']}** - {holiday['date']}\n"
+            if holiday['description']:
+                response += f"   {holiday['description']}\n"
+            response += "\n"
+        return response
+
+    def facts(self, kind, lang):
+        """Quote the knowledge base sentences that contain phone numbers/emails or clock times"""
+        pattern = self.PATTERNS[kind]
+        spans, url = [], ''
+        for item in self.rag.topic_search(self.SEARCHES[kind], 5):
+            for span in split_spans(item['content']):
+                matches = [m.group(0) for m in pattern.finditer(span)]
+                if kind == 'contact':
+                    # Years and dates look like short digit runs; phone numbers have ten or so digits
+                    matches = [m for m in matches if '@' in m or sum(c.isdigit() for c in m) >= 10]
+                span = span.lstrip('• ')[:300]
+                if matches and span not in spans:
+                    spans.append(span)
+                    url = url or (item.get('url') if item.get('url') != 'manual_entry' else '')
+            if len(spans) >= self.MAX_SPANS:
+                break
+
+        if not spans:
+            return None
+        heading = self.HEADINGS[kind][lang].format(en=self.rag.site.name, hi=self.rag.site.name_hi)
+        response = heading + '\n\n' + '\n'.join(f"• {span}" for span in spans[:self.MAX_SPANS])
+        return self.rag.add_source_link(self.rag.make_links_clickable(response), url)
+
+
+router = IntentRouter()
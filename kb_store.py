@@ -0,0 +1,115 @@
+import json
+import os
+import uuid
+from datetime import datetime
+
+from file_lock import file_lock
+
+KB_DIR = 'knowledge_base'
+LEGACY_KB_FILE = 'knowledge_base.json'
+MANIFEST = 'manifest.json'
+# Held while a version number is taken and published; every worker refreshes into the same directory
+PUBLISH_LOCK = 'publish.lock'
+# Older segments are kept around briefly for readers that opened them before a publish
+KEEP_VERSIONS = 2
+
+
+def _write_json_atomic(path, data):
+    # Unique per writer, so two processes never share a temp file
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_manifest(kb_dir=KB_DIR):
+    try:
+        with open(os.path.join(kb_dir, MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def iter_records(kb_dir=KB_DIR, legacy_file=LEGACY_KB_FILE):
+    """Yield knowledge base records one at a time from the published segments"""
+    manifest = read_manifest(kb_dir)
+    if manifest is None:
+        # Not migrated yet: fall back to the single JSON file
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                yield from json.load(f)
+        except FileNotFoundError:
+            pass
+        return
+
+    for segment in manifest['segments']:
+        with open(os.path.join(kb_dir, segment), 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class KnowledgeBaseWriter:
+    """Streams records to a JSONL segment and publishes it atomically with a versioned manifest"""
+
+    def __init__(self, kb_dir=KB_DIR):
+        self.kb_dir = kb_dir
+        self.file = None
+        self.count = 0
+        # Numbered when published, under the lock, so concurrent writers get distinct versions
+        self.version = None
+        self.segment = None
+        self.tmp_path = os.path.join(kb_dir, f"segment-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl.tmp")
+
+    def open(self):
+        os.makedirs(self.kb_dir, exist_ok=True)
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+        return self
+
+    def write(self, record):
+        # Flushed per record so a crash leaves every finished page on disk
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.count += 1
+
+    def publish(self):
+        """Make the segment visible: fsync, rename, then swap the manifest in one step"""
+        os.fsync(self.file.fileno())
+        self.file.close()
+        with file_lock(os.path.join(self.kb_dir, PUBLISH_LOCK)):
+            manifest = read_manifest(self.kb_dir)
+            self.version = (manifest['version'] if manifest else 0) + 1
+            self.segment = f"segment-{self.version:06d}.jsonl"
+            os.replace(self.tmp_path, os.path.join(self.kb_dir, self.segment))
+            _write_json_atomic(os.path.join(self.kb_dir, MANIFEST), {
+                'version': self.version,
+                'segments': [self.segment],
+                'count': self.count,
+                'published_at': datetime.now().isoformat()
+            })
+            self._remove_old_segments()
+        return self.version
+
+    def abort(self):
+        """Discard the unpublished segment; readers keep seeing the previous version"""
+        if self.file and not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def _remove_old_segments(self):
+        for name in os.listdir(self.kb_dir):
+            if not name.startswith('segment-') or not name.endswith('.jsonl'):
+                continue
+            version = int(name[len('segment-'):-len('.jsonl')])
+            if version <= self.version - KEEP_VERSIONS:
+                os.remove(os.path.join(self.kb_dir, name))
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import inc, set_gauge
+
+# gemini (default), ollama, or stub (canned answers for offline development)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com')
+OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:1b')
+# Whole-call deadline, covering the hedge and any retry
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '20'))
+# Start a second attempt if the first has not answered after this long (0 turns hedging off)
+LLM_HEDGE_AFTER = float(os.getenv('LLM_HEDGE_AFTER', '6'))
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '2'))
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '32'))
+# Consecutive failed calls that open the breaker, and how long it stays open before a trial call
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', '30'))
+
+
+class LLMError(Exception):
+    pass
+
+
+def pooled_session(pool_size=LLM_POOL_SIZE):
+    """A requests session whose keep-alive pool fits every concurrent call of a worker"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class GeminiBackend:
+    """Gemini over its REST API (no gRPC, so it also works under gevent)"""
+
+    name = 'gemini'
+
+    def __init__(self, api_key, model=GEMINI_MODEL, api_base=GEMINI_API_BASE):
+        self.url = f"{api_base.rstrip('/')}/v1beta/models/{model}:generateContent"
+        self.api_key = api_key
+        self.session = pooled_session()
+
+    def generate(self, prompt, timeout):
+        response = self.session.post(self.url, headers={'x-goog-api-key': self.api_key},
+                                     json={'contents': [{'parts': [{'text': prompt}]}]}, timeout=timeout)
+        if response.status_code != 200:
+            raise LLMError(f"Gemini returned {response.status_code}: {response.text[:200]}")
+        candidates = response.json().get('candidates') or []
+        parts = candidates[0].get('content', {}).get('parts', []) if candidates else []
+        return ''.join(part.get('text', '') for part in parts).strip() or None
+
+
+class OllamaBackend:
+    """A local Ollama server's /api/generate"""
+
+    name = 'ollama'
+
+    def __init__(self, model=OLLAMA_MODEL, host=OLLAMA_HOST):
+        self.url = f"{host.rstrip('/')}/api/generate"
+        self.model = model
+        self.session = pooled_session()
+
+    def generate(self, prompt, timeout):
+        response = self.session.post(self.url, json={'model': self.model, 'prompt': prompt, 'stream': False},
+                                     timeout=timeout)
+        if response.status_code != 200:
+            raise LLMError(f"Ollama returned {response.status_code}: {response.text[:200]}")
+        return response.json().get('response', '').strip() or None
+
+
+class StubBackend:
+    """Canned answers, for running the app without any LLM"""
+
+    name = 'stub'
+
+    def generate(self, prompt, timeout):
+        return (f"This is a stub answer (LLM_BACKEND=stub) to a {len(prompt.split())}-word prompt. "
+                "Set LLM_BACKEND to gemini or ollama for real answers.")
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> one trial call after the reset time -> closed again"""
+
+    def __init__(self, name, failures=LLM_BREAKER_FAILURES, reset_after=LLM_BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self.lock = threading.Lock()
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial_running and time.monotonic() - self.opened_at >= self.reset_after:
+                self.trial_running = True
+                return True
+        inc('davgpt_llm_breaker_total', backend=self.name, event='rejected')
+        return False
+
+    def record(self, ok):
+        with self.lock:
+            self.trial_running = False
+            if ok:
+                if self.opened_at is not None:
+                    print(f"✅ {self.name} circuit closed")
+                    inc('davgpt_llm_breaker_total', backend=self.name, event='closed')
+                self.consecutive = 0
+                self.opened_at = None
+            else:
+                self.consecutive += 1
+                if self.opened_at is not None or self.consecutive >= self.failures:
+                    if self.opened_at is None:
+                        print(f"🔌 {self.name} circuit opened after {self.consecutive} failures")
+                        inc('davgpt_llm_breaker_total', backend=self.name, event='opened')
+                    # A failed trial keeps it open for another reset period
+                    self.opened_at = time.monotonic()
+            set_gauge('davgpt_llm_breaker_open', 0 if self.opened_at is None else 1, backend=self.name)
+
+
+class LLMClient:
+    """Deadline, hedged retries and circuit breaking around one backend; generate() returns text or None"""
+
+    def __init__(self, backend, timeout=LLM_TIMEOUT, hedge_after=LLM_HEDGE_AFTER, max_attempts=LLM_MAX_ATTEMPTS):
+        self.backend = backend
+        self.name = backend.name
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.max_attempts = max(1, max_attempts)
+        self.breaker = CircuitBreaker(backend.name)
+        self.executor = ThreadPoolExecutor(max_workers=LLM_POOL_SIZE, thread_name_prefix=f"llm-{backend.name}")
+
+    def _attempt(self, prompt, deadline):
+        return self.backend.generate(prompt, max(0.1, deadline - time.monotonic()))
+
+    def generate(self, prompt):
+        if not self.breaker.allow():
+            # Degraded provider: fail in microseconds so the caller answers from retrieval
+            return None
+
+        deadline = time.monotonic() + self.timeout
+        pending, attempts = set(), 0
+        result = None
+        while result is None:
+            remaining = deadline - time.monotonic()
+            if attempts < self.max_attempts and remaining > 0 and (not pending or self.hedge_after):
+                if pending:
+                    inc('davgpt_llm_attempts_total', backend=self.name, outcome='hedged')
+                pending.add(self.executor.submit(self._attempt, prompt, deadline))
+                attempts += 1
+            if not pending:
+                break
+            # Wait for an answer, or until it is time to hedge
+            hedge_wait = self.hedge_after if self.hedge_after and attempts < self.max_attempts else remaining
+            done, pending = wait(pending, timeout=max(0, min(hedge_wait, deadline - time.monotonic())),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                    inc('davgpt_llm_attempts_total', backend=self.name, outcome='ok')
+                    if result is not None:
+                        break
+                except Exception as e:
+                    print(f"{self.name} error: {e}")
+                    inc('davgpt_llm_attempts_total', backend=self.name, outcome='error')
+            if result is None and time.monotonic() >= deadline:
+                inc('davgpt_llm_attempts_total', backend=self.name, outcome='deadline')
+                break
+
+        # Slower duplicate attempts finish in the background and are ignored
+        self.breaker.record(result is not None)
+        return result
+
+
+def create_backend(name=LLM_BACKEND):
+    """The configured backend, or None when it is not configured (e.g. no Gemini API key)"""
+    if name == 'gemini':
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            print("⚠️ GEMINI_API_KEY not found in environment")
+            return None
+        return GeminiBackend(api_key, api_base=os.getenv('GEMINI_API_BASE') or GEMINI_API_BASE)
+    if name == 'ollama':
+        return OllamaBackend()
+    if name == 'stub':
+        return StubBackend()
+    raise ValueError(f"Unknown LLM_BACKEND: {name}")
+
+
+def create_client(name=LLM_BACKEND):
+    backend = create_backend(name)
+    return LLMClient(backend) if backend is not None else None
@@ -0,0 +1,161 @@
+"""Local stand-ins for Gemini and the translator so load tests never hit paid or external APIs.
+
+    python loadtest/fake_services.py --gemini-latency 1.5 --gemini-error-rate 0.02
+
+then start the app with
+    GEMINI_API_KEY=fake GEMINI_API_BASE=http://127.0.0.1:8701 TRANSLATE_API_BASE=http://127.0.0.1:8702
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEVANAGARI = re.compile(r'[ऀ-ॿ]')
+
+
+class Knobs:
+    """Latency is drawn uniformly from latency +/- jitter; error_rate is the share of 500 responses"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def wait(self):
+        time.sleep(max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    knobs = Knobs()
+    counts = None
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = self.read_json()
+        self.knobs.wait()
+        failed = self.knobs.should_fail()
+        self.counts['requests'] += 1
+        if failed:
+            self.counts['errors'] += 1
+            self.send_json(500, {'error': {'code': 500, 'message': 'Injected failure', 'status': 'INTERNAL'}})
+            return
+        self.respond(payload)
+
+
+class GeminiHandler(_Handler):
+    """Answers POST /v1beta/models/<model>:generateContent in the REST API's response shape"""
+
+    def respond(self, payload):
+        if ':generateContent' not in self.path:
+            self.send_json(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+            return
+        prompt = ' '.join(part.get('text', '') for content in payload.get('contents', [])
+                          for part in content.get('parts', []))
+        words = len(prompt.split())
+        text = (f"This is a simulated answer from the load-test Gemini stand-in. The prompt had {words} words. "
+                "DAV Koyla Nagar school information would be summarised here for the parent.")
+        self.send_json(200, {
+            'candidates': [{
+                'content': {'parts': [{'text': text}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0
+            }],
+            'usageMetadata': {'promptTokenCount': words, 'candidatesTokenCount': len(text.split())}
+        })
+
+
+class TranslatorHandler(_Handler):
+    """LibreTranslate-style /detect and /translate"""
+
+    def respond(self, payload):
+        text = payload.get('q', '')
+        if self.path.startswith('/detect'):
+            language = 'hi' if DEVANAGARI.search(text) else 'en'
+            self.send_json(200, [{'language': language, 'confidence': 90.0}])
+        elif self.path.startswith('/translate'):
+            self.send_json(200, {'translatedText': f"[{payload.get('target', 'en')}] {text}"})
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+
+class FakeService:
+    def __init__(self, handler, knobs, host='127.0.0.1', port=0):
+        self.counts = {'requests': 0, 'errors': 0}
+        handler_class = type(handler.__name__, (handler,), {'knobs': knobs, 'counts': self.counts})
+        self.server = ThreadingHTTPServer((host, port), handler_class)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_fakes(gemini_knobs, translate_knobs, gemini_port=0, translate_port=0):
+    """Start both fakes; returns (gemini, translator) services"""
+    gemini = FakeService(GeminiHandler, gemini_knobs, port=gemini_port).start()
+    translator = FakeService(TranslatorHandler, translate_knobs, port=translate_port).start()
+    return gemini, translator
+
+
+def add_knob_arguments(parser):
+    parser.add_argument('--gemini-latency', type=float, default=1.0, help='Mean Gemini latency in seconds')
+    parser.add_argument('--gemini-jitter', type=float, default=0.5)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--translate-latency', type=float, default=0.15)
+    parser.add_argument('--translate-jitter', type=float, default=0.05)
+    parser.add_argument('--translate-error-rate', type=float, default=0.0)
+
+
+def knobs_from_args(args):
+    return (Knobs(args.gemini_latency, args.gemini_jitter, args.gemini_error_rate),
+            Knobs(args.translate_latency, args.translate_jitter, args.translate_error_rate))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run fake Gemini and translator servers')
+    parser.add_argument('--gemini-port', type=int, default=8701)
+    parser.add_argument('--translate-port', type=int, default=8702)
+    add_knob_arguments(parser)
+    args = parser.parse_args()
+
+    gemini, translator = start_fakes(*knobs_from_args(args), args.gemini_port, args.translate_port)
+    print(f"🤖 Fake Gemini on {gemini.base_url}")
+    print(f"🌐 Fake translator on {translator.base_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        gemini.stop()
+        translator.stop()
@@ -0,0 +1,322 @@
+"""Drive /chat, /upload_file and admin pages at increasing concurrency against Gunicorn configurations.
+
+Gemini and the translator are replaced by the local fakes in fake_services.py, and the app runs
+in a scratch directory with a copy of the knowledge base, so nothing external or in the repo is touched.
+
+    python loadtest/run_loadtest.py --concurrency 1,4,8,16,32 --duration 20 \\
+        --config "sync-4=--workers 4 --timeout 120" \\
+        --config "gthread-4x8=--workers 4 --threads 8 --timeout 120"
+
+    # Compare the serving profiles in gunicorn.conf.py
+    python loadtest/run_loadtest.py --mode sync --mode gthread --mode gevent --concurrency 8,32,128
+"""
+import argparse
+import json
+import os
+import random
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+from fake_services import add_knob_arguments, knobs_from_args, start_fakes
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Same settings as run-production.sh
+DEFAULT_CONFIG = 'sync-4=--workers 4 --timeout 120'
+GUNICORN_CONF = os.path.join(REPO_DIR, 'gunicorn.conf.py')
+DATA_FILES = ('knowledge_base.json', 'manual_data.json')
+DATA_DIRS = ('knowledge_base',)
+
+QUESTIONS = [
+    'What is the admission process?',
+    'What are the school timings?',
+    'What is the fee structure for class 5?',
+    'Where is DAV Koyla Nagar located?',
+    'Tell me about the school facilities',
+    'Who is the principal?',
+    'Are there any holidays in December?',
+    'How can I contact the school office?',
+    'प्रवेश प्रक्रिया क्या है?',
+    'स्कूल का समय क्या है?',
+]
+ADMIN_PATHS = ['/admin/dashboard', '/admin/profiler', '/metrics']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def prepare_workdir():
+    """Scratch copy of the knowledge base so uploads and logs never touch the repo's files"""
+    workdir = tempfile.mkdtemp(prefix='davgpt-loadtest-')
+    for name in DATA_FILES:
+        if os.path.exists(os.path.join(REPO_DIR, name)):
+            shutil.copy(os.path.join(REPO_DIR, name), workdir)
+    for name in DATA_DIRS:
+        if os.path.isdir(os.path.join(REPO_DIR, name)):
+            shutil.copytree(os.path.join(REPO_DIR, name), os.path.join(workdir, name))
+    return workdir
+
+
+class AppServer:
+    def __init__(self, gunicorn_args, gemini_url, translate_url, env_overrides=None):
+        self.port = free_port()
+        self.workdir = prepare_workdir()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.command = [
+            sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{self.port}",
+            '--chdir', self.workdir, '--pythonpath', REPO_DIR
+        ] + shlex.split(gunicorn_args) + ['wsgi:app']
+        self.env = dict(os.environ,
+                        GEMINI_API_KEY='loadtest',
+                        GEMINI_API_BASE=gemini_url,
+                        TRANSLATE_API_BASE=translate_url,
+                        DATABASE_URL=f"sqlite:///{os.path.join(self.workdir, 'davgpt.db')}",
+                        METRICS_DIR=os.path.join(self.workdir, 'metrics'),
+                        METRICS_FLUSH_SECONDS='1',
+                        PROFILER_CONTROL=os.path.join(self.workdir, 'profiler_control.json'),
+                        PROFILER_DIR=os.path.join(self.workdir, 'profiles'))
+        # Every simulated user shares 127.0.0.1, so lift the chat rate limits unless set explicitly
+        for name in ('CHAT_SESSION_PER_MINUTE', 'CHAT_SESSION_BURST', 'CHAT_IP_PER_MINUTE', 'CHAT_IP_BURST'):
+            self.env.setdefault(name, '1000000')
+        self.env.update(env_overrides or {})
+        self.process = None
+        self.log = None
+
+    def start(self, timeout=90):
+        self.log = open(os.path.join(self.workdir, 'server.log'), 'w')
+        self.process = subprocess.Popen(self.command, cwd=self.workdir, env=self.env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited early, see {self.log.name}")
+            try:
+                requests.get(self.base_url + '/', timeout=2)
+                return self
+            except requests.RequestException:
+                time.sleep(0.5)
+        raise RuntimeError(f"Server not ready after {timeout}s, see {self.log.name}")
+
+    def stop(self, keep=False):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.log:
+            self.log.close()
+        if not keep:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class Client:
+    """One simulated user: its own cookie jar, picking requests according to the mix"""
+
+    def __init__(self, base_url, mix, timeout, admin_user, admin_password):
+        self.base_url = base_url
+        self.mix = mix
+        self.timeout = timeout
+        self.admin_user = admin_user
+        self.admin_password = admin_password
+        self.session = requests.Session()
+        self.admin_session = None
+
+    def pick(self):
+        roll = random.uniform(0, sum(self.mix.values()))
+        for kind, weight in self.mix.items():
+            roll -= weight
+            if roll <= 0:
+                return kind
+        return 'chat'
+
+    def chat(self):
+        response = self.session.post(self.base_url + '/chat', json={'message': random.choice(QUESTIONS)},
+                                     timeout=self.timeout)
+        return response.status_code == 200 and 'response' in response.json()
+
+    def upload(self):
+        # Unique text each time so the content-hash dedup does not short-circuit the work
+        body = (f"Load test notice {uuid.uuid4()}. " + ' '.join(random.choice(QUESTIONS) for _ in range(40))).encode('utf-8')
+        response = self.session.post(self.base_url + '/upload_file',
+                                     files={'file': (f"loadtest-{uuid.uuid4().hex[:8]}.txt", body, 'text/plain')},
+                                     timeout=self.timeout)
+        return response.status_code in (200, 202) and response.json().get('status') in ('queued', 'done')
+
+    def admin(self):
+        if self.admin_session is None:
+            self.admin_session = requests.Session()
+            self.admin_session.post(self.base_url + '/admin/login', timeout=self.timeout,
+                                    data={'username': self.admin_user, 'password': self.admin_password})
+        response = self.admin_session.get(self.base_url + random.choice(ADMIN_PATHS), timeout=self.timeout,
+                                          allow_redirects=False)
+        return response.status_code == 200
+
+    def run(self, stop_at, results):
+        while time.time() < stop_at:
+            kind = self.pick()
+            started = time.perf_counter()
+            try:
+                ok = getattr(self, kind)()
+            except (requests.RequestException, ValueError):
+                ok = False
+            results.append((kind, time.perf_counter() - started, ok))
+
+
+def read_counters(base_url):
+    """Fallbacks (answers served without Gemini or translation, still 200s) and coalesced LLM calls"""
+    counters = {'fallbacks': 0, 'llm_leaders': 0, 'llm_followers': 0}
+    try:
+        text = requests.get(base_url + '/metrics', timeout=10).text
+    except requests.RequestException:
+        return counters
+    for line in text.splitlines():
+        value = line.rsplit(' ', 1)[-1]
+        if line.startswith('davgpt_fallbacks_total'):
+            counters['fallbacks'] += float(value)
+        elif line.startswith('davgpt_singleflight_total{group="llm",role="leader"}'):
+            counters['llm_leaders'] += float(value)
+        elif line.startswith('davgpt_singleflight_total{group="llm",role="follower"}'):
+            counters['llm_followers'] += float(value)
+    return counters
+
+
+def run_level(base_url, concurrency, duration, mix, timeout, admin_user, admin_password):
+    results = []
+    before = read_counters(base_url)
+    stop_at = time.time() + duration
+    clients = [Client(base_url, mix, timeout, admin_user, admin_password) for _ in range(concurrency)]
+    threads = [threading.Thread(target=client.run, args=(stop_at, results)) for client in clients]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    summary = summarize(results, elapsed)
+    time.sleep(1.5)  # let every worker flush its metrics snapshot
+    after = read_counters(base_url)
+    summary['fallbacks'] = int(after['fallbacks'] - before['fallbacks'])
+    leaders = after['llm_leaders'] - before['llm_leaders']
+    followers = after['llm_followers'] - before['llm_followers']
+    # Share of LLM requests answered by another request's in-flight call
+    summary['coalesced'] = round(followers / (leaders + followers), 3) if leaders + followers else 0
+    return summary
+
+
+def summarize(results, elapsed):
+    def stats(rows):
+        latencies = [latency for _, latency, _ in rows]
+        errors = sum(1 for _, _, ok in rows if not ok)
+        return {
+            'requests': len(rows),
+            'throughput': round(len(rows) / elapsed, 2) if elapsed else 0,
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'error_rate': round(errors / len(rows), 4) if rows else 0
+        }
+
+    summary = stats(results)
+    summary['endpoints'] = {kind: stats([row for row in results if row[0] == kind])
+                            for kind in sorted(set(row[0] for row in results))}
+    return summary
+
+
+def print_report(report):
+    print()
+    print(f"{'config':<16} {'conc':>5} {'reqs':>7} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'errors':>8} {'fallbk':>7} {'coal':>6}   chat p95 / upload p95 / admin p95")
+    for row in report:
+        endpoints = row['endpoints']
+        per_endpoint = ' / '.join(f"{endpoints[kind]['p95']:.3f}" if kind in endpoints else '-'
+                                  for kind in ('chat', 'upload', 'admin'))
+        print(f"{row['config']:<16} {row['concurrency']:>5} {row['requests']:>7} {row['throughput']:>8.2f} "
+              f"{row['p50']:>8.3f} {row['p95']:>8.3f} {row['p99']:>8.3f} {row['error_rate'] * 100:>7.1f}% {row['fallbacks']:>7} {row['coalesced'] * 100:>5.1f}%   {per_endpoint}")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in ('chat', 'upload', 'admin'):
+            raise argparse.ArgumentTypeError(f"Unknown request kind: {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test DAVGPT under different Gunicorn configurations')
+    parser.add_argument('--config', action='append', metavar='NAME=GUNICORN_ARGS',
+                        help=f"Server configuration to test (repeatable, default: '{DEFAULT_CONFIG}')")
+    parser.add_argument('--mode', action='append', choices=['sync', 'gthread', 'gevent'],
+                        help='Serving profile from gunicorn.conf.py to test (repeatable)')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32', help='Comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per concurrency level')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('chat=85,upload=5,admin=10'),
+                        help='Request mix weights (admin pages: dashboard, profiler, metrics)')
+    parser.add_argument('--timeout', type=float, default=130, help='Client timeout, above the 120s worker timeout')
+    parser.add_argument('--admin-user', default='admin')
+    parser.add_argument('--admin-password', default='dav2024')
+    parser.add_argument('--output', help='Also write the results as JSON')
+    parser.add_argument('--keep-workdir', action='store_true', help='Keep server scratch dirs and logs')
+    add_knob_arguments(parser)
+    args = parser.parse_args()
+
+    gemini, translator = start_fakes(*knobs_from_args(args))
+    print(f"🤖 Fake Gemini {gemini.base_url} ({args.gemini_latency}s ±{args.gemini_jitter}, {args.gemini_error_rate:.0%} errors)")
+    print(f"🌐 Fake translator {translator.base_url} ({args.translate_latency}s ±{args.translate_jitter}, {args.translate_error_rate:.0%} errors)")
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    report = []
+    configs = [(config.partition('=')[0], config.partition('=')[2], {}) for config in args.config or []]
+    configs += [(mode, f"-c {shlex.quote(GUNICORN_CONF)}", {'DAVGPT_SERVER_MODE': mode}) for mode in args.mode or []]
+    if not configs:
+        configs = [(DEFAULT_CONFIG.partition('=')[0], DEFAULT_CONFIG.partition('=')[2], {})]
+    
+    for name, gunicorn_args, env_overrides in configs:
+        server = AppServer(gunicorn_args, gemini.base_url, translator.base_url, env_overrides)
+        print(f"🚀 {name}: gunicorn {gunicorn_args}")
+        try:
+            server.start()
+            for concurrency in levels:
+                summary = run_level(server.base_url, concurrency, args.duration, args.mix, args.timeout,
+                                    args.admin_user, args.admin_password)
+                summary.update(config=name, concurrency=concurrency)
+                report.append(summary)
+                print(f"   {concurrency:>3} clients: {summary['throughput']:.2f} req/s, p95 {summary['p95']:.3f}s, "
+                      f"{summary['error_rate']:.1%} errors")
+        except RuntimeError as e:
+            print(f"❌ {name}: {e}")
+        finally:
+            server.stop(keep=args.keep_workdir)
+
+    gemini.stop()
+    translator.stop()
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
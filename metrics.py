@@ -0,0 +1,258 @@
+import contextvars
+import functools
+import glob
+import json
+import os
+import threading
+import time
+
+METRICS_DIR = os.getenv('METRICS_DIR', 'metrics')
+# How often each worker writes its snapshot for /metrics to aggregate
+FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+# Snapshots not refreshed for this long belong to workers that have exited
+STALE_SECONDS = float(os.getenv('METRICS_STALE_SECONDS', '300'))
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    'davgpt_stage_seconds': 'Time spent in each request stage',
+    'davgpt_stage_errors_total': 'Exceptions raised or swallowed per stage',
+    'davgpt_fallbacks_total': 'Answers served without the primary path, by reason',
+    'davgpt_responses_total': 'Chat answers by the path that produced them',
+    'davgpt_scraper_pages_total': 'Scraped pages by outcome (not_modified and unchanged are cache hits)',
+    'davgpt_gate_in_flight': 'Calls currently holding a concurrency slot',
+    'davgpt_gate_queue_depth': 'Calls waiting for a concurrency slot',
+    'davgpt_gate_shed_total': 'Calls turned away by a concurrency gate, by reason',
+    'davgpt_rate_limited_total': 'Chat requests rejected by a rate limiter',
+    'davgpt_context_tokens_total': 'Prompt context tokens: packed into prompts, or saved versus sending every retrieved passage',
+    'davgpt_context_packs_total': 'Prompts built by the context packer',
+    'davgpt_singleflight_total': 'Coalesced upstream calls: leaders made the call, followers shared its result',
+    'davgpt_answer_cache_total': 'Answer cache lookups after a failed or shed LLM call, by result',
+    'davgpt_faq_lookups_total': 'Precomputed FAQ answer lookups, by result',
+    'davgpt_llm_attempts_total': 'LLM backend attempts by outcome (ok, error, hedged, deadline)',
+    'davgpt_llm_breaker_total': 'LLM circuit breaker events (opened, closed, rejected)',
+    'davgpt_llm_breaker_open': '1 while the LLM circuit breaker is open',
+    'davgpt_batch_messages_total': 'Messages answered by batch chat',
+    'davgpt_tenant_loads_total': 'Site knowledge bases loaded on demand or evicted (least recently used)',
+    'davgpt_tenants_loaded': 'Site knowledge bases currently loaded in the worker',
+    'davgpt_tenant_memory_bytes': 'Estimated memory held by the loaded site knowledge bases',
+    'davgpt_analytics_rows_total': 'Conversations folded into the analytics rollups',
+}
+
+_trace = contextvars.ContextVar('davgpt_trace', default=None)
+# Facts about the chat answer being built (path, intent, retrieval score), stored with the conversation
+_details = contextvars.ContextVar('davgpt_details', default=None)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Registry:
+    """Per-process counters, gauges and histograms, periodically flushed to METRICS_DIR"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.flusher = None
+        self._reset()
+
+    def _reset(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def _check_process(self):
+        # A forked worker must not report the parent's numbers as its own
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.pid = os.getpid()
+                    self._reset()
+                    self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                    self.flusher.start()
+
+    def inc(self, name, value=1, **labels):
+        self._check_process()
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self._check_process()
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        self._check_process()
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self.gauges.items()],
+                'histograms': [[name, labels, dict(value, buckets=list(value['buckets']))]
+                               for (name, labels), value in self.histograms.items()],
+            }
+
+    def flush(self):
+        """Write this worker's snapshot atomically so readers never see a partial file"""
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"worker-{os.getpid()}.json")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Could not write metrics: {e}")
+
+
+registry = Registry()
+inc = registry.inc
+set_gauge = registry.set
+observe = registry.observe
+
+
+def record_stage(stage, seconds, error=False):
+    observe('davgpt_stage_seconds', seconds, stage=stage)
+    if error:
+        inc('davgpt_stage_errors_total', stage=stage)
+    spans = _trace.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+def timed(stage):
+    """Decorator recording the call's latency (and any exception) under the given stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                record_stage(stage, time.perf_counter() - started, error=True)
+                raise
+            record_stage(stage, time.perf_counter() - started)
+            return result
+        return wrapper
+    return decorator
+
+
+def note(text):
+    """Add a free-form detail (e.g. token counts) to the current request's trace line"""
+    spans = _trace.get()
+    if spans is not None:
+        spans.append(text)
+
+
+def collect_details():
+    """Start collecting detail() calls for the current request; returns the dict they fill"""
+    details = {}
+    _details.set(details)
+    return details
+
+
+def detail(**fields):
+    """Record facts about the current chat answer for the conversation log (see analytics.py)"""
+    details = _details.get()
+    if details is not None:
+        details.update(fields)
+
+
+def count_response(path):
+    """Count a chat answer by the path that produced it, and note the path for the conversation log"""
+    inc('davgpt_responses_total', path=path)
+    detail(path=path)
+
+
+def start_trace():
+    """Collect stage timings for the current request; returns a token for end_trace"""
+    return _trace.set([])
+
+
+def end_trace(token, label, total):
+    """Print one line breaking the request's time down by stage"""
+    spans = _trace.get() or []
+    _trace.reset(token)
+    breakdown = ' '.join(span if isinstance(span, str) else f"{span[0]}={span[1] * 1000:.0f}ms" for span in spans)
+    print(f"⏱️ {label} {total * 1000:.0f}ms: {breakdown}")
+
+
+def _merge_snapshots():
+    counters, gauges, histograms = {}, {}, {}
+    now = time.time()
+    for path in glob.glob(os.path.join(METRICS_DIR, 'worker-*.json')):
+        try:
+            if now - os.path.getmtime(path) > STALE_SECONDS:
+                continue
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        for name, labels, value in snapshot['counters']:
+            key = _key(name, dict(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in snapshot['gauges']:
+            key = _key(name, dict(labels))
+            gauges[key] = gauges.get(key, 0) + value
+        for name, labels, value in snapshot['histograms']:
+            key = _key(name, dict(labels))
+            merged = histograms.setdefault(key, {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0})
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], value['buckets'])]
+            merged['sum'] += value['sum']
+            merged['count'] += value['count']
+    return counters, gauges, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in pairs]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def render_prometheus():
+    """Aggregate every live worker's snapshot into Prometheus text exposition format"""
+    registry.flush()
+    counters, gauges, histograms = _merge_snapshots()
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name, 'counter')
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), value in sorted(gauges.items()):
+        describe(name, 'gauge')
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), value in sorted(histograms.items()):
+        describe(name, 'histogram')
+        for bound, count in zip(BUCKETS, value['buckets']):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {value['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+    return '\n'.join(lines) + '\n'
@@ -1,15 +1,76 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from datetime import datetime
 
 db = SQLAlchemy()
 
+def upgrade_schema():
+    """Add columns and indexes that db.create_all() skips on tables that already exist"""
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
 class Conversation(db.Model):
+    """Every chat exchange; browsed with keyset pagination (see conversation_log.py)"""
     id = db.Column(db.Integer, primary_key=True)
     user_message = db.Column(db.Text, nullable=False)
     bot_response = db.Column(db.Text, nullable=False)
-    language = db.Column(db.String(10), default='en')
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    session_id = db.Column(db.String(100))
+    language = db.Column(db.String(10), default='en', index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    session_id = db.Column(db.String(100), index=True)
+    site = db.Column(db.String(64))  # tenants.py site key; None for conversations from before multi-site
+    # English form of a Hindi question, as translated when answering; FAQ mining reads it instead of translating
+    english_message = db.Column(db.Text)
+    # How the answer was produced, for analytics.py: response path (faq, retrieval_llm, ...), intent label,
+    # top retrieval score and end-to-end latency. None for conversations logged before analytics
+    path = db.Column(db.String(20))
+    intent = db.Column(db.String(20))
+    score = db.Column(db.Integer)
+    latency_ms = db.Column(db.Integer)
+
+class ConversationRollup(db.Model):
+    """Hourly and daily totals over the conversation table, maintained incrementally by analytics.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(5), nullable=False)  # hour, day
+    bucket = db.Column(db.DateTime, nullable=False)  # start of the hour/day (UTC)
+    site = db.Column(db.String(64), nullable=False)
+    conversations = db.Column(db.Integer, default=0)
+    cache_hits = db.Column(db.Integer, default=0)
+    fallbacks = db.Column(db.Integer, default=0)
+    unanswered = db.Column(db.Integer, default=0)
+    latency_count = db.Column(db.Integer, default=0)
+    latency_ms_total = db.Column(db.BigInteger, default=0)
+    latency_histogram = db.Column(db.Text)  # JSON counts per analytics.LATENCY_BOUNDS_MS bucket
+    languages = db.Column(db.Text)  # JSON {"en": 120, "hi": 30}
+    intents = db.Column(db.Text)  # JSON {"fees": 12, "holidays": 4, ...}
+    __table_args__ = (db.UniqueConstraint('period', 'bucket', 'site', name='uq_rollup_period_bucket_site'),)
+
+class UnansweredQuery(db.Model):
+    """Questions the knowledge base answered poorly, grouped by content words and clustered by word overlap"""
+    id = db.Column(db.Integer, primary_key=True)
+    site = db.Column(db.String(64), nullable=False)
+    key = db.Column(db.String(255), nullable=False)  # faq_store.faq_key of the question
+    cluster_id = db.Column(db.Integer, index=True)  # id of the cluster's first question
+    example = db.Column(db.Text)
+    count = db.Column(db.Integer, default=0)
+    first_seen = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)
+    __table_args__ = (db.UniqueConstraint('site', 'key', name='uq_unanswered_site_key'),)
+
+class AnalyticsWatermark(db.Model):
+    """Last conversation id folded into the rollups"""
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime)
 
 class UploadedFile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -19,6 +80,16 @@ class UploadedFile(db.Model):
     content = db.Column(db.Text, nullable=False)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     session_id = db.Column(db.String(100))
+    file_hash = db.Column(db.String(64), index=True)  # sha256 of the raw bytes
+    text_hash = db.Column(db.String(64), index=True)  # sha256 of the normalized extracted text
+    site = db.Column(db.String(64))  # tenants.py site key; None for files uploaded before multi-site
+
+class UploadLink(db.Model):
+    """Sessions that uploaded an already-known file"""
+    id = db.Column(db.Integer, primary_key=True)
+    uploaded_file_id = db.Column(db.Integer, db.ForeignKey('uploaded_file.id'), nullable=False)
+    session_id = db.Column(db.String(100))
+    linked_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Lead(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -47,3 +118,17 @@ class Event(db.Model):
     created_by = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_public_holiday = db.Column(db.Boolean, default=False)
+    site = db.Column(db.String(64), index=True)  # tenants.py site key; None for events from before multi-site
+
+class UploadJob(db.Model):
+    id = db.Column(db.String(36), primary_key=True)
+    original_name = db.Column(db.String(255), nullable=False)
+    file_type = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), default='queued')  # queued, processing, done, error
+    message = db.Column(db.Text)
+    content_preview = db.Column(db.Text)
+    uploaded_file_id = db.Column(db.Integer, db.ForeignKey('uploaded_file.id'))
+    session_id = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    site = db.Column(db.String(64))  # site the file is indexed into
@@ -0,0 +1,229 @@
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+# Shared by all workers: the admin toggles profiling in one, every worker follows
+CONTROL_FILE = os.getenv('PROFILER_CONTROL', 'profiler_control.json')
+PROFILE_DIR = os.getenv('PROFILER_DIR', 'profiles')
+INTERVAL = float(os.getenv('PROFILER_INTERVAL', '0.01'))
+MAX_SECONDS = int(os.getenv('PROFILER_MAX_SECONDS', '600'))
+# Workers re-read the control file at most this often
+CONTROL_CHECK_SECONDS = 1.0
+FLUSH_SECONDS = 1.0
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold(frame):
+    """Root-first ';'-joined stack, the format flamegraph.pl and speedscope read"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def gevent_patched():
+    """True under gevent workers: requests are greenlets, invisible to sys._current_frames"""
+    if 'gevent' not in sys.modules:
+        return False
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving profiled /chat requests while an admin session is active"""
+
+    def __init__(self, control_file=CONTROL_FILE, profile_dir=PROFILE_DIR, interval=INTERVAL):
+        self.control_file = control_file
+        self.profile_dir = profile_dir
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.threads = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self.session = None
+        self.sampler = None
+        self.control = None
+        self.control_checked = 0
+
+    @property
+    def unsupported(self):
+        # Checked per call: gunicorn may import the app before gevent patches threading
+        return gevent_patched()
+
+    def read_control(self):
+        try:
+            with open(self.control_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def active_control(self):
+        """Return the running session's settings, or None when profiling is off"""
+        now = time.time()
+        if now - self.control_checked >= CONTROL_CHECK_SECONDS:
+            self.control = self.read_control()
+            self.control_checked = now
+        if self.control is None or now >= self.control['until']:
+            return None
+        return self.control
+
+    @contextmanager
+    def profile_request(self):
+        """Wrap a request; its thread is sampled if a session is active and the request is selected"""
+        control = self.active_control()
+        if control is None or self.unsupported or random.random() * 100 >= control['percent']:
+            yield
+            return
+
+        thread_id = threading.get_ident()
+        with self.lock:
+            if self.session != control['session']:
+                # New session: forget stacks from the previous one
+                self.session = control['session']
+                self.stacks = Counter()
+                self.samples = 0
+            self.threads.add(thread_id)
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample_loop, daemon=True)
+                self.sampler.start()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.threads.discard(thread_id)
+
+    def _sample_loop(self):
+        last_flush = time.time()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id in self.threads:
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self.stacks[_fold(frame)] += 1
+                        self.samples += 1
+            del frames
+
+            if time.time() - last_flush >= FLUSH_SECONDS:
+                last_flush = time.time()
+                self.flush()
+            if self.active_control() is None:
+                with self.lock:
+                    self.sampler = None
+                self.flush()
+                return
+
+    def flush(self):
+        """Write this worker's stacks for the current session so any worker can report them"""
+        with self.lock:
+            if self.session is None:
+                return
+            data = {'session': self.session, 'samples': self.samples, 'stacks': dict(self.stacks)}
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            _write_json_atomic(os.path.join(self.profile_dir, f"worker-{os.getpid()}.json"), data)
+        except Exception as e:
+            print(f"⚠️ Could not write profile: {e}")
+
+    def start(self, seconds, percent=100):
+        """Begin a new session for every worker; returns its settings"""
+        if self.unsupported:
+            print("⚠️ Profiler not started: it needs sync or gthread workers, not gevent")
+            raise RuntimeError('The profiler needs sync or gthread workers; it cannot sample gevent greenlets')
+        seconds = max(1, min(int(seconds), MAX_SECONDS))
+        percent = max(0.0, min(float(percent), 100.0))
+        os.makedirs(self.profile_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(self.profile_dir, 'worker-*.json')):
+            os.remove(path)
+        control = {
+            'session': str(uuid.uuid4()),
+            'started_at': time.time(),
+            'until': time.time() + seconds,
+            'percent': percent
+        }
+        _write_json_atomic(self.control_file, control)
+        self.control_checked = 0
+        print(f"🔬 Profiling {percent:g}% of chat requests for {seconds}s")
+        return control
+
+    def stop(self):
+        control = self.read_control()
+        if control is not None:
+            control['until'] = min(control['until'], time.time())
+            _write_json_atomic(self.control_file, control)
+        self.control_checked = 0
+
+    def merged_stacks(self):
+        """Sum the stacks every worker recorded for the latest session"""
+        control = self.read_control()
+        stacks, samples = Counter(), 0
+        if control is None:
+            return stacks, samples
+        for path in glob.glob(os.path.join(self.profile_dir, 'worker-*.json')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if data['session'] == control['session']:
+                stacks.update(data['stacks'])
+                samples += data['samples']
+        return stacks, samples
+
+    def folded(self):
+        stacks, _ = self.merged_stacks()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def top_functions(self, limit=25):
+        """Functions by inclusive samples, with self samples (time spent in the function itself)"""
+        stacks, samples = self.merged_stacks()
+        total, own = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [{
+            'function': frame,
+            'total': count,
+            'self': own[frame],
+            'total_percent': round(100.0 * count / samples, 1) if samples else 0,
+            'self_percent': round(100.0 * own[frame] / samples, 1) if samples else 0
+        } for frame, count in total.most_common(limit)]
+
+    def status(self):
+        control = self.read_control()
+        _, samples = self.merged_stacks()
+        active = control is not None and time.time() < control['until']
+        return {
+            'active': active,
+            'percent': control['percent'] if control else None,
+            'remaining_seconds': max(0, int(control['until'] - time.time())) if active else 0,
+            'samples': samples,
+            'interval_ms': self.interval * 1000
+        }
+
+
+profiler = SamplingProfiler()
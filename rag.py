@@ -1,8 +1,10 @@
 import json
 import chromadb
 from sentence_transformers import SentenceTransformer
-import ollama
 import os
+from kb_store import iter_records
+from context_packer import pack_context
+from llm_backends import LLMClient, OllamaBackend
 
 class EnhancedRAG:
     def __init__(self):
@@ -10,19 +12,17 @@ class EnhancedRAG:
         self.collection = self.client.get_or_create_collection("dav_knowledge")
         self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
         self.llm_model = "llama3.2:1b"  # Free lightweight model
+        self.llm = LLMClient(OllamaBackend(model=self.llm_model))
         self.load_knowledge_base()
         self.load_manual_data()
     
     def load_knowledge_base(self):
-        try:
-            with open('knowledge_base.json', 'r', encoding='utf-8') as f:
-                knowledge_base = json.load(f)
-            
-            if knowledge_base and self.collection.count() == 0:
-                self._add_documents_to_collection(knowledge_base, "scraped")
-                print(f"Loaded {len(knowledge_base)} scraped documents into ChromaDB")
-        except FileNotFoundError:
+        knowledge_base = list(iter_records())
+        if not knowledge_base:
             print("Knowledge base not found. Run scraper first.")
+        elif self.collection.count() == 0:
+            self._add_documents_to_collection(knowledge_base, "scraped")
+            print(f"Loaded {len(knowledge_base)} scraped documents into ChromaDB")
     
     def load_manual_data(self):
         """Load manually added data"""
@@ -104,13 +104,10 @@ class EnhancedRAG:
         if not results:
             return "I don't have information about that. Please ask about DAV Koyla Nagar school admissions, timings, fees, events, or contact our staff for more details."
         
-        # Prepare context for LLM with source information
-        context_parts = []
-        for result in results:
-            source_info = f"[{result['source'].title()} - {result['category']}]"
-            context_parts.append(f"{source_info} {result['content'][:300]}")
-        
-        context = "\n".join(context_parts)
+        # Most relevant non-overlapping spans within the token budget, labelled by source
+        packed = pack_context(query, results)
+        context = packed.text
+        print(f"📦 Context {packed.tokens_used} tokens from {len(packed.sources)} sources, saved {packed.tokens_saved}")
         
         # Enhanced prompt with source awareness
         prompt = f"""You are DAVGPT, an AI assistant for DAV Koyla Nagar school. Answer the user's question based only on the provided context. Be helpful, concise, and include relevant links when available.
@@ -129,24 +126,23 @@ Instructions:
 
 Answer:"""
         
-        try:
-            response = ollama.generate(model=self.llm_model, prompt=prompt)
-            
-            # Add relevant links to response
-            links = [r['url'] for r in results if r['url'] != 'manual_entry']
-            if links:
-                response_text = response['response']
-                unique_links = list(set(links[:2]))  # Max 2 unique links
-                link_text = "\n\nFor more details: " + " | ".join(unique_links)
-                return response_text + link_text
-            
-            return response['response']
-        except Exception as e:
+        # Deadline and circuit breaker in the client: a down Ollama fails fast to the fallback
+        response_text = self.llm.generate(prompt)
+        if response_text is None:
             # Fallback to simple response if Ollama fails
             fallback = f"Based on our records: {results[0]['content'][:200]}..."
             if results[0]['url'] != 'manual_entry':
                 fallback += f" For more details, visit {results[0]['url']}"
             return fallback
+        
+        # Add relevant links to response
+        links = [r['url'] for r in results if r['url'] != 'manual_entry']
+        if links:
+            unique_links = list(set(links[:2]))  # Max 2 unique links
+            link_text = "\n\nFor more details: " + " | ".join(unique_links)
+            return response_text + link_text
+        
+        return response_text
     
     def refresh_knowledge_base(self):
         """Clear and reload knowledge base"""
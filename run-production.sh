@@ -5,6 +5,6 @@ echo "🚀 Starting DAVGPT in production mode..."
 # Activate virtual environment
 source venv/bin/activate
 
-# Run with gunicorn
-echo "🌐 Starting with Gunicorn on port 5000"
-gunicorn --bind 0.0.0.0:5000 --workers 4 --timeout 120 wsgi:app
+# Run with gunicorn (DAVGPT_SERVER_MODE=sync|gthread|gevent, see gunicorn.conf.py)
+echo "🌐 Starting with Gunicorn on port 5000 (${DAVGPT_SERVER_MODE:-gthread} workers)"
+gunicorn -c gunicorn.conf.py wsgi:app
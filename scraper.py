@@ -1,109 +1,228 @@
 import requests
-from bs4 import BeautifulSoup
+from extractor import extract_page, format_blocks, clean_text
+from dedup import NearDuplicateIndex
+from frontier import CrawlFrontier, parse_sitemap
+from http_archive import ArchiveWriter, ReplayServer
+from kb_store import KnowledgeBaseWriter, iter_records, read_manifest, KB_DIR, LEGACY_KB_FILE
+from metrics import timed, inc
 import json
 import time
 from datetime import datetime
-import re
 import urllib3
 import os
-from urllib.parse import urljoin, urlparse
+import hashlib
+import uuid
+from urllib.parse import urlparse
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class DAVScraper:
-    def __init__(self):
-        self.base_url = os.getenv('WEBSITE_URL', 'http://davkoylanagar.com/')
+    def __init__(self, archive_mode=None, archive_path=None, base_url=None, data_dir='.', school='DAV Koyla Nagar'):
+        self.base_url = base_url or os.getenv('WEBSITE_URL', 'http://davkoylanagar.com/')
+        # Title for pages that have none
+        self.school = school
+        # Each site's crawl state and knowledge base live in its own directory (see tenants.py)
+        self.data_dir = data_dir
+        self.kb_dir = os.path.join(data_dir, KB_DIR)
+        self.legacy_file = os.path.join(data_dir, LEGACY_KB_FILE)
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        self.state_file = os.path.join(data_dir, 'crawl_state.json')
+        self.session = requests.Session()
+        # 'record' saves raw responses to the archive, 'replay' crawls from it offline
+        self.archive_mode = archive_mode or os.getenv('SCRAPER_ARCHIVE_MODE')
+        self.archive_path = archive_path or os.getenv('SCRAPER_ARCHIVE', os.path.join(data_dir, 'crawl_archive.warc.gz'))
+        self.archive_writer = None
+        self.replay_server = None
+        self.time_budget = float(os.getenv('CRAWL_TIME_BUDGET', '600'))
+        self.max_pages = int(os.getenv('CRAWL_MAX_PAGES', '1000'))
+        self.max_depth = int(os.getenv('CRAWL_MAX_DEPTH', '5'))
+        self.max_per_depth = int(os.getenv('CRAWL_MAX_PER_DEPTH', '300'))
+        # Only used when the site has no sitemap
+        self.common_pages = [
+            'about', 'about-us', 'admission', 'admissions', 'fees', 'fee-structure',
+            'contact', 'contact-us', 'facilities', 'academics', 'events', 'news',
+            'notices', 'gallery', 'staff', 'faculty', 'principal', 'timings',
+            'curriculum', 'infrastructure', 'activities', 'sports', 'library'
+        ]
         self.scraped_urls = set()
-        self.all_data = []
+        self.saved_urls = set()
+        self.writer = None
+        self.dedup_index = NearDuplicateIndex()
+        self.crawl_state = {}
+        self.previous_pages = {}
+        self.changes = {'added': [], 'changed': [], 'removed': []}
+        # Manifest version the change set is relative to, and the version this crawl published
+        self.base_version = None
+        self.published_version = None
     
-    def clean_text(self, text):
-        text = re.sub(r'\s+', ' ', text.strip())
-        text = re.sub(r'[^\w\s.,!?()-]', '', text)
-        return text
-    
-    def extract_links(self, soup, base_url):
-        """Extract all internal links from the page"""
-        links = set()
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            full_url = urljoin(base_url, href)
-            
-            # Only include internal links
-            if urlparse(full_url).netloc == urlparse(base_url).netloc:
-                links.add(full_url)
+    def load_crawl_state(self):
+        """Load ETag/Last-Modified/content hash per URL from the last crawl"""
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self.crawl_state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.crawl_state = {}
+        
+        manifest = read_manifest(self.kb_dir)
+        self.base_version = manifest['version'] if manifest else None
+        self.previous_pages = {item['url']: item for item in self.get_scraped_data()}
+    
+    def save_crawl_state(self):
+        # Unique per writer: every worker's refresh thread writes this file
+        tmp_path = f"{self.state_file}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.crawl_state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+    
+    @timed('scrape_fetch')
+    def fetch(self, url, headers=None):
+        if self.replay_server:
+            return self.session.get(self.replay_server.url_for(url), headers=headers or self.headers, timeout=15)
         
-        return links
+        response = self.session.get(url, headers=headers or self.headers, timeout=15, verify=False)
+        if self.archive_writer and response.status_code != 304:
+            self.archive_writer.write(url, response)
+        return response
+    
+    def start_archive(self):
+        if self.archive_mode == 'record':
+            self.archive_writer = ArchiveWriter(self.archive_path)
+            print(f"📼 Recording responses to {self.archive_path}")
+        elif self.archive_mode == 'replay':
+            self.replay_server = ReplayServer(self.archive_path).start()
+            print(f"📼 Replaying {self.replay_server.record_count} archived responses from {self.archive_path}")
+    
+    def stop_archive(self):
+        if self.replay_server:
+            self.replay_server.stop()
+        self.archive_writer = None
+        self.replay_server = None
+    
+    def seed_from_robots_and_sitemaps(self, frontier, max_sitemaps=20):
+        """Apply robots.txt and queue every page listed in the site's sitemaps"""
+        root = self.base_url.rstrip('/')
+        sitemap_queue = [f"{root}/sitemap.xml"]
+        
+        try:
+            response = self.fetch(f"{root}/robots.txt")
+            if response.status_code == 200:
+                sitemap_queue.extend(frontier.load_robots(response.text))
+        except Exception as e:
+            print(f"⚠️ Could not read robots.txt: {e}")
+        
+        seeded = 0
+        fetched = set()
+        while sitemap_queue and len(fetched) < max_sitemaps:
+            sitemap_url = sitemap_queue.pop(0)
+            if sitemap_url in fetched:
+                continue
+            fetched.add(sitemap_url)
+            try:
+                response = self.fetch(sitemap_url)
+                if response.status_code != 200:
+                    continue
+                page_urls, nested = parse_sitemap(response.content)
+                sitemap_queue.extend(nested)
+                for page_url in page_urls:
+                    if frontier.push(page_url, 1, seed=True):
+                        seeded += 1
+            except Exception as e:
+                print(f"⚠️ Could not read sitemap {sitemap_url}: {e}")
+        
+        if seeded:
+            print(f"🗺️ Seeded {seeded} URLs from sitemaps")
+        return seeded
+    
+    def conditional_headers(self, url):
+        """Build request headers with If-None-Match/If-Modified-Since when we have a cached copy"""
+        headers = dict(self.headers)
+        state = self.crawl_state.get(url)
+        # Recording needs full bodies, so never ask for a 304
+        if state and url in self.previous_pages and self.archive_mode != 'record':
+            if state.get('etag'):
+                headers['If-None-Match'] = state['etag']
+            if state.get('last_modified'):
+                headers['If-Modified-Since'] = state['last_modified']
+        return headers
+    
+    def reuse_previous_page(self, url):
+        """Carry over the stored record for a page that has not changed"""
+        page_data = self.previous_pages[url]
+        self.save_page(page_data)
+        return page_data, set(page_data.get('internal_links', []))
+    
+    def save_page(self, page_data):
+        """Stream a page to the knowledge base segment unless it near-duplicates one already saved"""
+        # Collapse near-duplicate pages (shared templates, mirrored URLs)
+        if self.dedup_index.add_if_new(page_data['url'], page_data['content']) is not None:
+            return False
+        
+        self.writer.write(page_data)
+        self.saved_urls.add(page_data['url'])
+        
+        previous = self.previous_pages.get(page_data['url'])
+        if previous is None:
+            self.changes['added'].append(page_data)
+        elif previous['content'] != page_data['content'] or previous.get('title') != page_data.get('title'):
+            self.changes['changed'].append(page_data)
+        return True
+    
+    def clean_text(self, text):
+        return clean_text(text)
+    
+    def extract_links(self, links, base_url):
+        """Keep only internal links from the page"""
+        base_netloc = urlparse(base_url).netloc
+        return {link for link in links if urlparse(link).netloc == base_netloc}
     
     def scrape_page_comprehensive(self, url, category="general"):
         """Comprehensive page scraping with deep content extraction"""
         if url in self.scraped_urls:
-            return None
+            return None, set()
             
         try:
             print(f"🕷️ Scraping: {url}")
             self.scraped_urls.add(url)
             
-            response = requests.get(url, headers=self.headers, timeout=15, verify=False)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove unwanted elements
-            for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'noscript', 'iframe']):
-                element.decompose()
-            
-            # Extract title
-            title_elem = soup.find('title')
-            title = self.clean_text(title_elem.get_text()) if title_elem else "DAV Koyla Nagar"
+            response = self.fetch(url, self.conditional_headers(url))
             
-            # Extract all meaningful content
-            content_parts = []
+            if response.status_code in (404, 410):
+                # Gone from the site: the only way a page is dropped by a crawl that stops early
+                if url in self.previous_pages:
+                    print(f"🗑️ Gone ({response.status_code}): {url}")
+                inc('davgpt_scraper_pages_total', result='gone')
+                return None, set()
             
-            # Get headings (important content)
-            for heading in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                text = heading.get_text(strip=True)
-                if text and len(text) > 3:
-                    content_parts.append(f"HEADING: {self.clean_text(text)}")
+            if response.status_code == 304 and url in self.previous_pages:
+                print(f"⏭️ Not modified: {url}")
+                inc('davgpt_scraper_pages_total', result='not_modified')
+                return self.reuse_previous_page(url)
             
-            # Get paragraphs
-            for p in soup.find_all('p'):
-                text = p.get_text(strip=True)
-                if text and len(text) > 20:
-                    content_parts.append(self.clean_text(text))
-            
-            # Get list items
-            for li in soup.find_all('li'):
-                text = li.get_text(strip=True)
-                if text and len(text) > 10:
-                    content_parts.append(f"• {self.clean_text(text)}")
-            
-            # Get table data
-            for table in soup.find_all('table'):
-                for row in table.find_all('tr'):
-                    cells = [cell.get_text(strip=True) for cell in row.find_all(['td', 'th'])]
-                    if any(cell for cell in cells):
-                        content_parts.append(" | ".join(cells))
+            response.raise_for_status()
             
-            # Get div content (fallback)
-            for div in soup.find_all('div'):
-                text = div.get_text(strip=True)
-                if text and len(text) > 30 and len(text) < 500:
-                    content_parts.append(self.clean_text(text))
+            content_hash = hashlib.sha256(response.content).hexdigest()
+            previous_state = self.crawl_state.get(url, {})
+            self.crawl_state[url] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_hash': content_hash,
+                'checked_at': datetime.now().isoformat()
+            }
             
-            # Join all content
-            content = ' '.join(content_parts)
+            if previous_state.get('content_hash') == content_hash and url in self.previous_pages:
+                print(f"⏭️ Unchanged content: {url}")
+                inc('davgpt_scraper_pages_total', result='unchanged')
+                return self.reuse_previous_page(url)
             
-            # If still no content, get body text
-            if not content or len(content) < 100:
-                body = soup.find('body')
-                if body:
-                    content = self.clean_text(body.get_text(separator=' ', strip=True))
+            # Single pass over the document: each text node is emitted once with its role
+            raw_title, blocks, links = extract_page(response.content, url)
+            title = self.clean_text(raw_title) if raw_title else self.school
+            content = format_blocks(blocks)
             
             # Extract internal links for further scraping
-            internal_links = self.extract_links(soup, url)
+            internal_links = self.extract_links(links, url)
             
             if content and len(content) > 50:
                 page_data = {
@@ -115,74 +234,129 @@ class DAVScraper:
                     'internal_links': list(internal_links)
                 }
                 
-                self.all_data.append(page_data)
+                self.save_page(page_data)
+                inc('davgpt_scraper_pages_total', result='extracted')
                 return page_data, internal_links
             
+            inc('davgpt_scraper_pages_total', result='empty')
+            
         except Exception as e:
             print(f"❌ Error scraping {url}: {e}")
+            inc('davgpt_scraper_pages_total', result='error')
+            # Keep the last good copy rather than reporting the page as removed
+            if url in self.previous_pages:
+                return self.reuse_previous_page(url)
         
         return None, set()
     
+    @timed('scrape')
     def scrape_all_comprehensive(self):
         """Comprehensive scraping of entire website"""
         print(f"🚀 Starting comprehensive scrape of {self.base_url}")
         
-        # Start with main page
-        main_data, main_links = self.scrape_page_comprehensive(self.base_url, 'home')
+        # Reset per-run state so repeated refreshes on the same instance crawl again
+        self.scraped_urls = set()
+        self.saved_urls = set()
+        self.dedup_index = NearDuplicateIndex()
+        self.changes = {'added': [], 'changed': [], 'removed': []}
+        self.published_version = None
+        self.load_crawl_state()
+        self.start_archive()
+        self.writer = KnowledgeBaseWriter(self.kb_dir).open()
+        try:
+            return self.crawl()
+        except BaseException:
+            self.writer.abort()
+            raise
+        finally:
+            self.stop_archive()
+    
+    def crawl(self):
+        """Crawl the frontier within the time budget, streaming pages out, then publish"""
+        frontier = CrawlFrontier(self.base_url, max_depth=self.max_depth, max_per_depth=self.max_per_depth)
+        sitemap_count = self.seed_from_robots_and_sitemaps(frontier)
+        frontier.push(self.base_url, 0, 'home')
         
-        # Queue of URLs to scrape
-        urls_to_scrape = list(main_links) if main_links else []
+        if not sitemap_count:
+            # No sitemap: fall back to guessing common page paths
+            for page in self.common_pages:
+                frontier.push(f"{self.base_url.rstrip('/')}/{page}", 1)
+                frontier.push(f"{self.base_url.rstrip('/')}/{page}.html", 1)
         
-        # Common page patterns to try
-        common_pages = [
-            'about', 'about-us', 'admission', 'admissions', 'fees', 'fee-structure',
-            'contact', 'contact-us', 'facilities', 'academics', 'events', 'news',
-            'notices', 'gallery', 'staff', 'faculty', 'principal', 'timings',
-            'curriculum', 'infrastructure', 'activities', 'sports', 'library'
-        ]
+        delay = 0 if self.replay_server else frontier.crawl_delay(0.5)
+        deadline = time.time() + self.time_budget
+        scraped_count = 0
         
-        for page in common_pages:
-            urls_to_scrape.append(f"{self.base_url.rstrip('/')}/{page}")
-            urls_to_scrape.append(f"{self.base_url.rstrip('/')}/{page}.html")
+        while len(frontier) and scraped_count < self.max_pages:
+            if time.time() > deadline:
+                print(f"⏱️ Crawl time budget reached with {len(frontier)} URLs still queued")
+                break
+            
+            url, depth, category = frontier.pop()
+            data, new_links = self.scrape_page_comprehensive(url, category)
+            if data:
+                scraped_count += 1
+                for new_link in new_links:
+                    frontier.push(new_link, depth + 1)
+            
+            time.sleep(delay)  # Be respectful
         
-        # Scrape all discovered URLs
-        scraped_count = 0
-        for url in urls_to_scrape[:50]:  # Limit to prevent infinite scraping
-            if url not in self.scraped_urls:
-                data, new_links = self.scrape_page_comprehensive(url)
-                if data:
-                    scraped_count += 1
-                    # Add newly discovered links
-                    for new_link in new_links:
-                        if new_link not in urls_to_scrape and len(urls_to_scrape) < 100:
-                            urls_to_scrape.append(new_link)
-                
-                time.sleep(0.5)  # Be respectful
+        if not self.saved_urls:
+            # Site unreachable: keep serving the last published version
+            print("⚠️ No pages scraped, keeping the previous knowledge base")
+            self.writer.abort()
+            return False
         
-        # Remove duplicates and save
-        unique_data = []
-        seen_content = set()
+        carried = set()
+        if len(frontier):
+            # Stopped on the time or page budget: pages not reached this run are kept as they were
+            carried = {url for url in self.previous_pages if url not in self.scraped_urls}
+            for url in carried:
+                self.save_page(self.previous_pages[url])
+            print(f"📦 Kept {len(carried)} previously scraped pages not reached this run")
         
-        for item in self.all_data:
-            content_hash = hash(item['content'][:200])
-            if content_hash not in seen_content:
-                seen_content.add(content_hash)
-                unique_data.append(item)
+        self.changes['removed'] = [url for url in self.previous_pages if url not in self.saved_urls]
+        version = self.published_version = self.writer.publish()
         
-        # Save to file
-        with open('knowledge_base.json', 'w', encoding='utf-8') as f:
-            json.dump(unique_data, f, indent=2, ensure_ascii=False)
+        # Forget state for pages that are gone so they are re-fetched in full if they return
+        self.crawl_state = {url: state for url, state in self.crawl_state.items()
+                            if url in self.scraped_urls or url in carried}
+        self.save_crawl_state()
         
-        print(f"✅ Scraped {scraped_count} pages, saved {len(unique_data)} unique entries")
-        return len(unique_data) > 0
+        print(f"✅ Scraped {scraped_count} pages, published {self.writer.count} unique entries as v{version} "
+              f"(+{len(self.changes['added'])} ~{len(self.changes['changed'])} -{len(self.changes['removed'])})")
+        return self.writer.count > 0
     
     def scrape_all(self):
         """Main scraping method"""
         return self.scrape_all_comprehensive()
     
     def get_scraped_data(self):
-        try:
-            with open('knowledge_base.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return []
+        return list(iter_records(self.kb_dir, self.legacy_file))
+
+
+if __name__ == '__main__':
+    import argparse
+    from dotenv import load_dotenv
+    
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Scrape the school website into the knowledge base')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--record', metavar='ARCHIVE', help='save raw responses to ARCHIVE while crawling')
+    mode.add_argument('--replay', metavar='ARCHIVE', help='crawl offline from ARCHIVE instead of the live site')
+    parser.add_argument('--site', help='site key from sites.json (default: the default site)')
+    args = parser.parse_args()
+    
+    from tenants import load_sites
+    sites, default = load_sites()
+    site = sites[args.site or default]
+    if args.record:
+        scraper = DAVScraper('record', args.record, site.website_url, site.data_dir, site.name)
+    elif args.replay:
+        scraper = DAVScraper('replay', args.replay, site.website_url, site.data_dir, site.name)
+    else:
+        scraper = DAVScraper(base_url=site.website_url, data_dir=site.data_dir, school=site.name)
+    
+    started = time.time()
+    scraper.scrape_all()
+    print(f"⏱️ Crawl took {time.time() - started:.1f}s")
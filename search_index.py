@@ -0,0 +1,172 @@
+import re
+import sys
+import threading
+from array import array
+
+# scraped: crawled pages; manual: admin-entered entries; upload: chunks of uploaded files
+SOURCES = ('scraped', 'manual', 'upload')
+
+
+_capitals = re.compile(r'[A-Z]+')
+
+
+class Document:
+    """Compact in-memory knowledge base entry; reads like the dict it came from (doc['content'], doc.get('url')).
+
+    Crawl bookkeeping (scraped_at, internal_links) is dropped and the short repeated strings (URLs,
+    titles, categories, file names) are interned. Search matches against the lowercased text, so
+    only that is kept, plus the spans of A-Z capitals needed to rebuild the original when an
+    answer quotes it.
+    """
+
+    __slots__ = ('id', 'title', 'url', 'category', 'source', 'upload_id', 'lower', 'title_lower',
+                 'category_lower', '_text', '_capitals', 'extra')
+    FIELDS = frozenset(('id', 'title', 'content', 'url', 'category', 'source', 'upload_id'))
+    # Crawl bookkeeping nothing reads after publishing; any other key (timestamp, filename, added_by)
+    # is kept so manual entries save back to manual_data.json unchanged
+    DROPPED = frozenset(('scraped_at', 'internal_links'))
+
+    def __init__(self, record, source):
+        self.id = record.get('id')
+        self.title = sys.intern(record.get('title') or '')
+        self.url = sys.intern(record.get('url') or '')
+        # As typed, so saving manual_data.json does not rewrite it; searches and shards use category_lower
+        self.category = sys.intern(record.get('category') or 'general')
+        self.category_lower = sys.intern(self.category.lower())
+        self.source = source
+        self.upload_id = record.get('upload_id')
+        self.title_lower = sys.intern(self.title.lower())
+        extra = {key: sys.intern(value) if isinstance(value, str) else value for key, value in record.items()
+                 if key not in self.FIELDS and key not in self.DROPPED}
+        self.extra = extra or None
+
+        content = record['content']
+        self.lower = content.lower()
+        self._text, self._capitals = None, None
+        if self.lower == content:
+            self.lower = content
+        else:
+            self._capitals = array('I', [position for match in _capitals.finditer(content)
+                                         for position in match.span()])
+            if self.content != content:
+                # Capitals outside A-Z (some change length when lowercased): keep the original
+                self._text, self._capitals = content, None
+
+    @property
+    def content(self):
+        if self._text is not None or self._capitals is None:
+            return self._text if self._text is not None else self.lower
+        lower, capitals, pieces, last = self.lower, self._capitals, [], 0
+        for i in range(0, len(capitals), 2):
+            start, end = capitals[i], capitals[i + 1]
+            pieces.append(lower[last:start])
+            pieces.append(lower[start:end].upper())
+            last = end
+        pieces.append(lower[last:])
+        return ''.join(pieces)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __getattr__(self, key):
+        # Templates read extras as attributes (item.timestamp)
+        extra = object.__getattribute__(self, 'extra') if key != 'extra' else None
+        if extra and key in extra:
+            return extra[key]
+        raise AttributeError(key)
+
+    def update(self, changes):
+        merged = self.to_dict()
+        merged.update(changes)
+        self.__init__(merged, self.source)
+
+    def to_dict(self):
+        record = {'id': self.id, 'title': self.title, 'content': self.content, 'category': self.category,
+                  'url': self.url}
+        if self.upload_id is not None:
+            record['upload_id'] = self.upload_id
+        record.update(self.extra or {})
+        return record
+
+    def footprint(self):
+        """Approximate bytes this entry holds, for the per-site memory cap (see tenants.py)"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.lower)
+        if self._text is not None:
+            size += sys.getsizeof(self._text)
+        if self._capitals is not None:
+            size += self._capitals.itemsize * len(self._capitals)
+        if self.extra:
+            size += sys.getsizeof(self.extra)
+        return size
+
+    def __repr__(self):
+        return f"Document({self.source}/{self.category}: {self.url or self.title!r})"
+
+
+def manual_document(entry):
+    """Document for a manual entry or upload chunk"""
+    return Document(entry, 'upload' if entry.get('upload_id') is not None else 'manual')
+
+
+class ShardedIndex:
+    """Documents partitioned by (source, category), so filtered searches skip whole shards.
+
+    Category filters apply to scraped pages, whose categories come from the crawler (home, admissions,
+    fees, notices, events, ...). Manual and uploaded entries are selected by source only, since their
+    categories are free text typed by admins.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.shards = {}
+        self.stale = True
+
+    def invalidate(self):
+        """Call after the knowledge base or manual data changed; the next search rebuilds the shards"""
+        self.stale = True
+
+    def rebuild(self, knowledge_base, manual_data):
+        """Shard the Documents themselves; nothing is copied"""
+        shards = {}
+        for documents in (knowledge_base, manual_data):
+            for document in documents:
+                shards.setdefault((document.source, document.category_lower), []).append(document)
+        self.shards = shards
+        self.stale = False
+
+    def add(self, document):
+        """Index one new manual Document without a rebuild"""
+        with self.lock:
+            if not self.stale:
+                self.shards.setdefault((document.source, document.category_lower), []).append(document)
+
+    def documents(self, knowledge_base, manual_data, categories=None, sources=None):
+        """The shards (lists of Documents) matching the filters; iterate them rather than concatenating"""
+        with self.lock:
+            if self.stale:
+                self.rebuild(knowledge_base, manual_data)
+            shards = list(self.shards.items())
+
+        categories = {category.lower() for category in categories} if categories else None
+        selected = []
+        for (source, category), shard in shards:
+            if sources and source not in sources:
+                continue
+            if categories is not None and source == 'scraped' and category not in categories:
+                continue
+            selected.append(shard)
+        return selected
+
+    def shard_sizes(self):
+        return {f"{source}/{category}": len(shard) for (source, category), shard in self.shards.items()}
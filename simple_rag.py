@@ -2,107 +2,290 @@ import json
 import os
 import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
-import google.generativeai as genai
+from dedup import NearDuplicateIndex, simhash, normalize
+from kb_store import iter_records, read_manifest, KB_DIR, LEGACY_KB_FILE
+from metrics import timed, inc, note, count_response, detail
+from admission import llm_gate
+from singleflight import SingleFlight
+from context_packer import pack_context, CONTEXT_TOKEN_BUDGET
+from faq_store import FAQStore, FAQ_FILE
+from intents import router, FastPaths
+from llm_backends import create_client
+from search_index import ShardedIndex, Document, manual_document
+from tenants import Site, DEFAULT_SITE
+
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '500'))
+# Seconds between checks for a knowledge base published by another worker (or /admin/refresh)
+KB_RELOAD_SECONDS = int(os.getenv('KB_RELOAD_SECONDS', '60'))
+AUTO_REFRESH_SECONDS = 7200
+# Passages retrieved for the context packer to choose spans from
+CONTEXT_CANDIDATES = int(os.getenv('CONTEXT_CANDIDATES', '5'))
+# Taken from a near-duplicate manual entry or upload chunk into the entry it collapses into
+MERGED_FIELDS = ('content', 'timestamp')
+
+# One LLM client (connection pool, circuit breaker) per worker, shared by every site
+_llm_client = None
+_llm_ready = False
+_llm_lock = threading.Lock()
 
 class SimpleRAG:
-    def __init__(self):
+    def __init__(self, site=None):
+        # Which school this knowledge base answers for; its files live in site.data_dir
+        self.site = site or Site(DEFAULT_SITE)
+        self.school = self.site.name
+        self.kb_dir = os.path.join(self.site.data_dir, KB_DIR)
+        self.legacy_file = os.path.join(self.site.data_dir, LEGACY_KB_FILE)
+        self.manual_file = os.path.join(self.site.data_dir, 'manual_data.json')
+        os.makedirs(self.site.data_dir, exist_ok=True)
         self.knowledge_base = []
+        # Manifest version the in-memory knowledge base was loaded from (None: legacy file or none)
+        self.loaded_version = None
         self.manual_data = []
-        self.gemini_model = None
+        self.manual_index = NearDuplicateIndex()
+        # Lowercased documents sharded by source and category for filtered search
+        self.index = ShardedIndex()
+        self.llm = None
+        # Set by the app: (month, year) -> list of holiday dicts
+        self.holiday_lookup = None
+        # Recent LLM answers, served when the LLM is overloaded or failing
+        self.answer_cache = OrderedDict()
+        self.answer_cache_lock = threading.Lock()
+        # Identical questions asked at the same moment share one LLM call
+        self.llm_flights = SingleFlight('llm')
+        # Canonical answers for frequent questions, generated offline after each refresh
+        self.faq_store = FAQStore(os.path.join(self.site.data_dir, FAQ_FILE))
+        # Holidays, contact and timings questions are answered without the LLM
+        self.fast_paths = FastPaths(self)
+        # Set by the app: called with no arguments after each auto-refresh
+        self.after_refresh = None
+        # Set by stop(): ends the auto-refresh loop when the site is unloaded
+        self.stopped = threading.Event()
         self.load_data()
-        self.setup_gemini()
+        self.setup_llm()
         self.start_auto_refresh()
     
-    def setup_gemini(self):
-        """Setup Google Gemini LLM"""
-        try:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                print("⚠️ GEMINI_API_KEY not found in environment")
-                self.gemini_model = None
-                return
-                
-            genai.configure(api_key=api_key)
-            self.gemini_model = genai.GenerativeModel('gemini-1.5-flash')
-            print("🤖 Gemini LLM loaded successfully!")
-        except Exception as e:
-            print(f"⚠️ Gemini not available: {e}")
-            self.gemini_model = None
+    def setup_llm(self):
+        """Setup the LLM backend chosen by LLM_BACKEND (Gemini by default)"""
+        global _llm_client, _llm_ready
+        with _llm_lock:
+            if not _llm_ready:
+                _llm_ready = True
+                try:
+                    _llm_client = create_client()
+                    if _llm_client:
+                        print(f"🤖 LLM backend loaded: {_llm_client.name}")
+                except Exception as e:
+                    print(f"⚠️ LLM not available: {e}")
+        self.llm = _llm_client
     
-    def load_data(self):
-        try:
-            with open('knowledge_base.json', 'r', encoding='utf-8') as f:
-                self.knowledge_base = json.load(f)
-        except FileNotFoundError:
-            self.knowledge_base = []
+    def load_data(self, manual=True):
+        """Load the published knowledge base, and manual data unless manual=False (kept as in memory)"""
+        manifest = self.published()
+        self.loaded_version = manifest['version'] if manifest else None
+        # Stream-parse the published JSONL segments record by record into compact serving copies
+        self.knowledge_base = [Document(record, 'scraped') for record in iter_records(self.kb_dir, self.legacy_file)]
         
-        try:
-            with open('manual_data.json', 'r', encoding='utf-8') as f:
-                self.manual_data = json.load(f)
-        except FileNotFoundError:
-            self.manual_data = []
+        if manual:
+            try:
+                with open(self.manual_file, 'r', encoding='utf-8') as f:
+                    self.manual_data = [manual_document(entry) for entry in json.load(f)]
+            except FileNotFoundError:
+                self.manual_data = []
+            self.collapse_manual()
+        
+        self.collapse_scraped()
+        self.index.invalidate()
+    
+    def collapse_manual(self):
+        """Drop near-duplicate manual entries before indexing"""
+        self.manual_index = NearDuplicateIndex()
+        # Rebuilt in place so find_manual_duplicate only sees entries kept so far
+        all_manual, self.manual_data = self.manual_data, []
+        for entry in all_manual:
+            fingerprint = simhash(entry['content'])
+            if self.find_manual_duplicate(entry, fingerprint) is None:
+                self.manual_index.add(entry.get('id', len(self.manual_data)), fingerprint)
+                self.manual_data.append(entry)
+        if len(all_manual) > len(self.manual_data):
+            print(f"🧹 Collapsed {len(all_manual) - len(self.manual_data)} near-duplicate manual entries")
+    
+    def collapse_scraped(self):
+        """Drop scraped pages that near-duplicate a manual entry or each other; manual and uploaded data win"""
+        scraped_index = NearDuplicateIndex()
+        for key, fingerprint in self.manual_index.fingerprints.items():
+            scraped_index.add(key, fingerprint)
+        unique_scraped = [item for item in self.knowledge_base
+                          if scraped_index.add_if_new(item.get('url'), item['content']) is None]
+        
+        if len(self.knowledge_base) > len(unique_scraped):
+            print(f"🧹 Collapsed {len(self.knowledge_base) - len(unique_scraped)} near-duplicate scraped pages")
+        self.knowledge_base = unique_scraped
     
     def start_auto_refresh(self):
-        """Auto-refresh every 2 hours"""
+        """Auto-refresh every 2 hours; in between, pick up versions other workers publish"""
         def refresh_loop():
-            while True:
-                time.sleep(7200)  # 2 hours
+            next_crawl = time.time() + AUTO_REFRESH_SECONDS
+            while not self.stopped.wait(KB_RELOAD_SECONDS):
                 try:
-                    from scraper import DAVScraper
-                    scraper = DAVScraper()
+                    if time.time() < next_crawl:
+                        self.reload_if_published()
+                        continue
+                    next_crawl = time.time() + AUTO_REFRESH_SECONDS
+                    scraper = self.new_scraper()
                     scraper.scrape_all()
-                    self.load_data()
+                    self.refresh_knowledge_base(scraper)
                     print(f"🔄 Auto-refreshed at {datetime.now()}")
+                    if self.after_refresh is not None:
+                        self.after_refresh()
                 except Exception as e:
                     print(f"Auto-refresh error: {e}")
         
         thread = threading.Thread(target=refresh_loop, daemon=True)
         thread.start()
     
-    def search(self, query, top_k=3):
+    def stop(self):
+        """Stop auto-refreshing; called when the site is unloaded"""
+        self.stopped.set()
+    
+    def new_scraper(self):
+        """A crawler for this site's website, writing into its data directory"""
+        from scraper import DAVScraper
+        return DAVScraper(base_url=self.site.website_url, data_dir=self.site.data_dir, school=self.site.name)
+    
+    def published(self):
+        """The knowledge base manifest, or None before the first crawl of this site"""
+        return read_manifest(self.kb_dir)
+    
+    def memory_bytes(self):
+        return sum(document.footprint() for documents in (self.knowledge_base, self.manual_data)
+                   for document in documents)
+    
+    @timed('search')
+    def search(self, query, top_k=3, categories=None, sources=None):
+        """Rank documents in the shards matching the filters (see ShardedIndex.documents)"""
+        return self.rank_documents(query, self.shards(categories, sources), top_k)
+    
+    @timed('search')
+    def topic_search(self, query, top_k=3, categories=None, sources=None):
+        """search() that narrows to the question's topic shards first (see search_batch)"""
+        return self.search_batch([query], top_k, categories, sources)[0]
+    
+    @timed('search_batch')
+    def search_batch(self, queries, top_k=3, categories=None, sources=None):
+        """Search many queries at once; repeated queries and each shard selection are computed once.
+        
+        Without explicit categories, a query about a topic (events, fees, ...) searches that topic's
+        shards first and everything only if they have no match.
+        """
+        shard_sets = {}
+        def shards(scope):
+            if scope not in shard_sets:
+                shard_sets[scope] = self.shards(scope, sources)
+            return shard_sets[scope]
+        
+        explicit = tuple(sorted(categories)) if categories else None
+        ranked = {}
+        for query in queries:
+            if query in ranked:
+                continue
+            topic = None if explicit else router.classify(query).categories
+            scored = self.score_documents(query, shards(topic)) if topic else []
+            # Manual and upload shards are in every topic's selection, so only a scraped page in the
+            # topic's categories shows the topic shards matched (legacy crawls file pages as home/general)
+            if not any(document.source == 'scraped' for document, _ in scored):
+                scored = self.score_documents(query, shards(explicit))
+            detail(score=scored[0][1] if scored else 0)
+            ranked[query] = [document for document, _ in scored[:top_k]]
+        return [ranked[query] for query in queries]
+    
+    def shards(self, categories=None, sources=None):
+        return self.index.documents(self.knowledge_base, self.manual_data, categories, sources)
+    
+    def rank_documents(self, query, shards, top_k):
+        scored = self.score_documents(query, shards)
+        # A request's last ranking is the one its answer used; low scores mark questions the KB misses
+        detail(score=scored[0][1] if scored else 0)
+        return [document for document, _ in scored[:top_k]]
+    
+    def score_documents(self, query, shards):
+        """(document, score) for every matching document, best first"""
         query_lower = query.lower()
         query_words = [w for w in query_lower.split() if len(w) > 2]
         
-        all_data = self.knowledge_base + self.manual_data
         results = []
         
-        for item in all_data:
-            content_lower = item['content'].lower()
-            title_lower = item.get('title', '').lower()
-            
-            score = 0
-            
-            if query_lower in content_lower or query_lower in title_lower:
-                score += 15
-            
-            for word in query_words:
-                if word in content_lower:
-                    score += 3
-                if word in title_lower:
-                    score += 5
-            
-            category = item.get('category', 'general').lower()
-            if any(word in category for word in query_words):
-                score += 2
-            
-            if score > 0:
-                results.append((item, score))
+        for shard in shards:
+            for document in shard:
+                content_lower = document.lower
+                title_lower = document.title_lower
+                
+                score = 0
+                
+                if query_lower in content_lower or query_lower in title_lower:
+                    score += 15
+                
+                for word in query_words:
+                    if word in content_lower:
+                        score += 3
+                    if word in title_lower:
+                        score += 5
+                
+                if any(word in document.category_lower for word in query_words):
+                    score += 2
+                
+                if score > 0:
+                    results.append((document, score))
         
         results.sort(key=lambda x: x[1], reverse=True)
-        return [item[0] for item in results[:top_k]]
+        return results
     
-    def call_gemini(self, prompt):
-        """Call Google Gemini LLM"""
-        if not self.gemini_model:
+    @timed('llm')
+    def call_llm(self, prompt, coalesce_key=None):
+        """Call the LLM backend, sharing the call with concurrent identical requests"""
+        if not self.llm:
             return None
         
-        try:
-            response = self.gemini_model.generate_content(prompt)
-            return response.text.strip() if response.text else None
-        except Exception as e:
-            print(f"Gemini error: {e}")
-            return None
+        return self.llm_flights.do(coalesce_key or prompt, lambda: self._generate(prompt))
+    
+    def _generate(self, prompt):
+        with llm_gate.slot() as admitted:
+            if not admitted:
+                # Overloaded: answer from cache or retrieval instead of queueing until timeout
+                return None
+            # Deadline, hedging and the circuit breaker live in the client; None means no answer
+            response = self.llm.generate(prompt)
+            if response is None:
+                inc('davgpt_stage_errors_total', stage='llm')
+            return response
+    
+    def build_context(self, query, results):
+        """Pack the ranked passages into the prompt token budget and record the tokens saved"""
+        packed = pack_context(query, results)
+        inc('davgpt_context_packs_total')
+        inc('davgpt_context_tokens_total', packed.tokens_used, kind='packed')
+        inc('davgpt_context_tokens_total', packed.tokens_saved, kind='saved')
+        note(f"context={packed.tokens_used}/{CONTEXT_TOKEN_BUDGET}tok saved={packed.tokens_saved}tok")
+        return packed
+    
+    def cache_key(self, query):
+        """Case, spacing and punctuation do not change the question"""
+        return ' '.join(normalize(query))
+    
+    def remember_answer(self, query, answer):
+        with self.answer_cache_lock:
+            key = self.cache_key(query)
+            self.answer_cache.pop(key, None)
+            self.answer_cache[key] = answer
+            while len(self.answer_cache) > ANSWER_CACHE_SIZE:
+                self.answer_cache.popitem(last=False)
+    
+    def cached_answer(self, query):
+        with self.answer_cache_lock:
+            answer = self.answer_cache.get(self.cache_key(query))
+        inc('davgpt_answer_cache_total', result='hit' if answer else 'miss')
+        return answer
     
     def make_links_clickable(self, text):
         """Convert URLs to clickable links"""
@@ -111,163 +294,250 @@ class SimpleRAG:
         return re.sub(url_pattern, r'<a href="\1" target="_blank" style="color: #004aad; text-decoration: underline;">\1</a>', text)
     
     def check_holiday_query(self, query):
-        """Check if query is asking about holidays"""
-        holiday_keywords = ['holiday', 'holidays', 'festival', 'celebration', 'off', 'leave', 'vacation']
-        month_keywords = {
-            'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
-            'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
-            'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'jun': 6, 'jul': 7, 'aug': 8, 
-            'sep': 9, 'sept': 9, 'oct': 10, 'nov': 11, 'dec': 12
-        }
-        
-        query_lower = query.lower()
-        
-        # Check if asking about holidays
-        if any(keyword in query_lower for keyword in holiday_keywords):
-            # Extract month if mentioned
-            month = None
-            for month_name, month_num in month_keywords.items():
-                if month_name in query_lower:
-                    month = month_num
-                    break
-            
-            return True, month
-        
-        return False, None
+        """Check if query is asking about holidays; returns (is_holiday_query, month or None)"""
+        intent = router.classify(query)
+        return intent.kind == 'holidays', intent.month
     
+    @timed('holidays')
     def fetch_holidays_from_db(self, month=None, year=None):
-        """Fetch holidays from database"""
+        """Fetch holidays from the event calendar"""
+        if self.holiday_lookup is None:
+            return []
+        
         try:
-            import requests
-            from datetime import datetime
-            
-            if not year:
-                year = datetime.now().year
-            
-            response = requests.post('http://localhost:5000/get_holidays', 
-                                   json={'month': month, 'year': year}, 
-                                   timeout=5)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data['status'] == 'success':
-                    return data['holidays']
-            
+            return self.holiday_lookup(month, year)
         except Exception as e:
             print(f"Error fetching holidays: {e}")
+            inc('davgpt_stage_errors_total', stage='holidays')
         
         return []
-    def generate_response(self, query):
-        # Check if asking about holidays
-        is_holiday_query, month = self.check_holiday_query(query)
+    
+    def is_school_query(self, query):
+        """School-related or ambiguous (could relate to school) queries are answered from the knowledge base"""
+        return router.classify(query).school
+    
+    def retrieve_context(self, query):
+        """Search results and the packed prompt context built from them"""
+        results = self.topic_search(query, CONTEXT_CANDIDATES)
+        return results, self.build_context(query, results) if results else None
+    
+    def retrieval_prompt(self, query, packed):
+        return f"""You are DAVGPT, an AI assistant for {self.school} school. The user asked: "{query}"
+
+If the question is ambiguous (like "address", "timing", "fees", etc.), assume they're asking about {self.school} school specifically.
+
+School Information (numbered sources):
+{packed.text}
+
+Provide a helpful answer focusing on {self.school} school:"""
+    
+    def add_source_link(self, response, url):
+        if url and url != 'manual_entry':
+            response += f'\n\n🔗 **More details:** <a href="{url}" target="_blank" style="color: #004aad; text-decoration: underline;">{url}</a>'
+        return response
+    
+    def generate_response(self, query, results=None, categories=None, sources=None):
+        """Answer an English query; pass results when they were already retrieved (batch chat).
         
-        if is_holiday_query:
-            holidays = self.fetch_holidays_from_db(month)
-            
-            if holidays:
-                if month:
-                    month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June',
-                                 'July', 'August', 'September', 'October', 'November', 'December']
-                    month_name = month_names[month] if month <= 12 else 'the specified month'
-                    response = f"**Holidays in {month_name}:**\n\n"
-                else:
-                    response = "**Upcoming Holidays:**\n\n"
-                
-                for holiday in holidays:
-                    response += f"🎉 **{holiday['title']}** - {holiday['date']}\n"
-                    if holiday['description']:
-                        response += f"   {holiday['description']}\n"
-                    response += "\n"
-                
+        categories/sources restrict the knowledge base searched (e.g. an embed widget scoped to fees).
+        """
+        scoped = bool(categories or sources)
+        # Holidays, contact and timings go to deterministic fast paths
+        intent = router.classify(query)
+        if intent.kind in ('holidays', 'contact', 'timings'):
+            response = self.fast_paths.answer(intent)
+            if response:
+                count_response(intent.kind)
                 return response
-            else:
-                if month:
-                    month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June',
-                                 'July', 'August', 'September', 'October', 'November', 'December']
-                    month_name = month_names[month] if month <= 12 else 'that month'
-                    return f"No holidays found for {month_name}. Please check back later for updates on school events and holidays."
-                else:
-                    return "No holidays found in our calendar. Please check back later for updates on school events and holidays."
+        
+        # Frequent questions have a precomputed answer: no search, no LLM call
+        faq_answer = None if scoped else self.faq_store.lookup(query)
+        if faq_answer:
+            count_response('faq')
+            return faq_answer
         
         # Continue with regular RAG processing
         # Always search for school-related content first
-        results = self.search(query)
-        
-        # Check if query is school-related or ambiguous (could relate to school)
-        school_keywords = ['dav', 'school', 'admission', 'fee', 'timing', 'event', 'contact', 'facility', 'teacher', 'student', 'class', 'koyla', 'nagar']
-        ambiguous_keywords = ['address', 'location', 'phone', 'number', 'timing', 'time', 'fee', 'cost', 'contact', 'where', 'when', 'how much', 'principal', 'staff', 'facilities', 'events', 'activities']
+        if results is None:
+            results = self.topic_search(query, CONTEXT_CANDIDATES, categories, sources)
         
-        is_school_related = any(keyword in query.lower() for keyword in school_keywords)
-        is_ambiguous = any(keyword in query.lower() for keyword in ambiguous_keywords)
-        
-        if results and (is_school_related or is_ambiguous):
+        if results and intent.school:
             # School-related or ambiguous query - prioritize school information
             best_result = results[0]
             content = best_result['content']
-            url = best_result.get('url', '')
+            packed = self.build_context(query, results)
+            # Link the source the packed context quotes first
+            url = next((source['url'] for source in packed.sources if source['url'] != 'manual_entry'),
+                       best_result.get('url', ''))
             
-            gemini_prompt = f"""You are DAVGPT, an AI assistant for DAV Koyla Nagar school. The user asked: "{query}"
-
-If the question is ambiguous (like "address", "timing", "fees", etc.), assume they're asking about DAV Koyla Nagar school specifically.
-
-School Information: {content[:800]}
-
-Provide a helpful answer focusing on DAV Koyla Nagar school:"""
+            llm_prompt = self.retrieval_prompt(query, packed)
             
-            gemini_response = self.call_gemini(gemini_prompt)
+            llm_response = self.call_llm(llm_prompt, ('retrieval', self.cache_key(query), packed.text))
+            # Cached answers were built from the whole knowledge base, not a scoped subset
+            cached = None if scoped or (llm_response and len(llm_response) > 20) else self.cached_answer(query)
             
-            if gemini_response and len(gemini_response) > 20:
-                response = gemini_response
+            if llm_response and len(llm_response) > 20:
+                count_response('retrieval_llm')
+                response = llm_response
+            elif cached:
+                count_response('cached')
+                inc('davgpt_fallbacks_total', reason='llm_unavailable')
+                return cached
             else:
                 # Fallback with school context
+                count_response('retrieval_only')
+                inc('davgpt_fallbacks_total', reason='llm_unavailable')
                 query_lower = query.lower()
                 if any(word in query_lower for word in ['address', 'location', 'where']):
-                    response = f"**DAV Koyla Nagar School Address:**\n\n{content[:400]}"
+                    response = f"**{self.school} School Address:**\n\n{content[:400]}"
                 elif any(word in query_lower for word in ['phone', 'contact', 'number']):
-                    response = f"**DAV Koyla Nagar Contact Information:**\n\n{content[:400]}"
+                    response = f"**{self.school} Contact Information:**\n\n{content[:400]}"
                 elif any(word in query_lower for word in ['timing', 'time', 'hours']):
-                    response = f"**DAV Koyla Nagar School Timings:**\n\n{content[:400]}"
+                    response = f"**{self.school} School Timings:**\n\n{content[:400]}"
                 elif any(word in query_lower for word in ['fee', 'cost', 'payment']):
-                    response = f"**DAV Koyla Nagar Fee Structure:**\n\n{content[:400]}"
+                    response = f"**{self.school} Fee Structure:**\n\n{content[:400]}"
                 else:
-                    response = f"**About DAV Koyla Nagar School:**\n\n{content[:400]}"
+                    response = f"**About {self.school} School:**\n\n{content[:400]}"
             
             # Make links clickable and add source
-            response = self.make_links_clickable(response)
-            if url and url != 'manual_entry':
-                response += f'\n\n🔗 **More details:** <a href="{url}" target="_blank" style="color: #004aad; text-decoration: underline;">{url}</a>'
+            response = self.add_source_link(self.make_links_clickable(response), url)
             
+            if llm_response and len(llm_response) > 20 and not scoped:
+                self.remember_answer(query, response)
             return response
         
         # General query - still mention school context when possible
-        gemini_prompt = f"""You are DAVGPT, an AI assistant for DAV Koyla Nagar school. Answer the user's question naturally. When appropriate, you can relate the answer to education or school context.
+        llm_prompt = f"""You are DAVGPT, an AI assistant for {self.school} school. Answer the user's question naturally. When appropriate, you can relate the answer to education or school context.
 
 User Question: {query}
 
-Provide a helpful answer (mention DAV Koyla Nagar school context if relevant):"""
+Provide a helpful answer (mention {self.school} school context if relevant):"""
+        
+        llm_response = self.call_llm(llm_prompt, ('general', self.cache_key(query)))
         
-        gemini_response = self.call_gemini(gemini_prompt)
+        if llm_response and len(llm_response) > 20:
+            count_response('general_llm')
+            self.remember_answer(query, llm_response)
+            return llm_response
         
-        if gemini_response and len(gemini_response) > 20:
-            return gemini_response
+        cached = self.cached_answer(query)
+        if cached:
+            count_response('cached')
+            inc('davgpt_fallbacks_total', reason='llm_unavailable')
+            return cached
         
         # Fallback response
-        return f"""I can help you with that! As DAVGPT for DAV Koyla Nagar school, I can discuss various topics.
+        count_response('canned')
+        inc('davgpt_fallbacks_total', reason='llm_unavailable')
+        return f"""I can help you with that! As DAVGPT for {self.school} school, I can discuss various topics.
 
 For school-specific information, I have details about:
 🏫 **Address & Location** • 📞 **Contact Numbers** • ⏰ **School Timings** 
 🎓 **Admissions** • 💰 **Fees** • 🎉 **Events** • 🏗️ **Facilities**
 
-Feel free to ask me anything - I'll prioritize DAV Koyla Nagar school information when relevant!"""
+Feel free to ask me anything - I'll prioritize {self.school} school information when relevant!"""
+    
+    def add_manual_entry(self, entry, save=True):
+        """Add an entry, collapsing it into a near-duplicate one if present.
+        
+        Returns the id of the existing entry that was updated, or None if added as new.
+        Pass save=False when adding many entries and call save_manual_data once at the end.
+        """
+        fingerprint = simhash(entry['content'])
+        duplicate = self.find_manual_duplicate(entry, fingerprint)
+        if duplicate is not None:
+            # Newer wording replaces the older near-identical entry in place; its title, category and
+            # source file stay, so removing the newer upload later does not leave it mislabelled
+            duplicate_id = duplicate['id']
+            self.manual_index.remove(duplicate_id)
+            self.manual_index.add(duplicate_id, fingerprint)
+            duplicate.update({key: entry[key] for key in MERGED_FIELDS if key in entry})
+            self.index.invalidate()
+            if save:
+                self.save_manual_data()
+            return duplicate_id
+        
+        document = manual_document(entry)
+        self.manual_index.add(document.id, fingerprint)
+        self.manual_data.append(document)
+        self.index.add(document)
+        if save:
+            self.save_manual_data()
+        return None
     
-    def add_manual_entry(self, entry):
-        self.manual_data.append(entry)
+    def find_manual_duplicate(self, entry, fingerprint):
+        """Return the manual entry that entry near-duplicates, ignoring chunks of the same upload"""
+        duplicate_id = self.manual_index.find(fingerprint)
+        if duplicate_id is None:
+            return None
+        for existing in self.manual_data:
+            if existing.get('id') == duplicate_id:
+                # Similar sections of one document (e.g. fee tables per class) are all kept
+                if entry.get('upload_id') is not None and existing.get('upload_id') == entry.get('upload_id'):
+                    return None
+                return existing
+        return None
+    
+    def remove_upload(self, upload_id):
+        """Drop every chunk that was added for an uploaded file"""
+        kept = []
+        for entry in self.manual_data:
+            if entry.get('upload_id') == upload_id:
+                self.manual_index.remove(entry['id'])
+            else:
+                kept.append(entry)
+        self.manual_data = kept
+        self.index.invalidate()
         self.save_manual_data()
     
     def save_manual_data(self):
-        with open('manual_data.json', 'w', encoding='utf-8') as f:
-            json.dump(self.manual_data, f, indent=2, ensure_ascii=False)
+        with open(self.manual_file, 'w', encoding='utf-8') as f:
+            json.dump([document.to_dict() for document in self.manual_data], f, indent=2, ensure_ascii=False)
     
-    def refresh_knowledge_base(self):
-        self.load_data()
+    def apply_changes(self, changes):
+        """Apply a scraper change set (added/changed/removed pages) without reloading everything"""
+        stale_urls = set(changes.get('removed', []))
+        stale_urls.update(page['url'] for page in changes.get('changed', []))
+        
+        if stale_urls:
+            self.knowledge_base = [item for item in self.knowledge_base if item.get('url') not in stale_urls]
+        
+        self.knowledge_base.extend(Document(page, 'scraped') for page in changes.get('changed', []))
+        self.knowledge_base.extend(Document(page, 'scraped') for page in changes.get('added', []))
+        self.index.invalidate()
+        if any(changes.get(key) for key in ('added', 'changed', 'removed')):
+            self.clear_answer_cache()
+            self.faq_store.invalidate_urls(stale_urls)
+        return True
+    
+    def clear_answer_cache(self):
+        """Cached answers may quote pages that just changed"""
+        with self.answer_cache_lock:
+            self.answer_cache.clear()
+    
+    def refresh_knowledge_base(self, scraper=None):
+        """Bring this worker up to date after a crawl (or, without one, reload everything).
+        
+        The scraper's change set is relative to the version it read from disk; it is only applied when
+        that is also the version held here. Otherwise another worker published in between, so reload.
+        """
+        if scraper is None:
+            self.load_data()
+            self.clear_answer_cache()
+            return True
+        if scraper.base_version == self.loaded_version and scraper.published_version is not None:
+            self.apply_changes(scraper.changes)
+            self.loaded_version = scraper.published_version
+            return True
+        return self.reload_if_published()
+    
+    def reload_if_published(self):
+        """Load the published knowledge base if its version moved past the one held here"""
+        manifest = self.published()
+        if manifest is None or manifest['version'] == self.loaded_version:
+            return False
+        # Manual data is kept: uploads may be adding chunks to it right now
+        self.load_data(manual=False)
+        self.clear_answer_cache()
+        print(f"🔄 Loaded knowledge base v{self.loaded_version} of {self.site.key}")
         return True
@@ -0,0 +1,46 @@
+import threading
+
+from metrics import inc
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution; every caller gets its result"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            inc('davgpt_singleflight_total', group=self.name, role='follower')
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        inc('davgpt_singleflight_total', group=self.name, role='leader')
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # Later callers start a fresh call rather than reusing this result
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
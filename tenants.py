@@ -0,0 +1,159 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import inc, set_gauge
+
+# One entry per DAV branch the bot serves; without this file there is a single site in the current directory
+SITES_FILE = os.getenv('SITES_FILE', 'sites.json')
+# Knowledge bases kept loaded per worker; least recently used sites are unloaded beyond this
+TENANT_MEMORY_MB = float(os.getenv('TENANT_MEMORY_MB', '512'))
+DEFAULT_SITE = 'default'
+
+# Site key of the request (or background job) being handled; None means the default site
+current_site = contextvars.ContextVar('davgpt_site', default=None)
+
+
+class Site:
+    """A school website and the directory holding its crawl state, knowledge base and manual data"""
+
+    def __init__(self, key, website_url=None, data_dir='.', hosts=(), embed_keys=(),
+                 name='DAV Koyla Nagar', name_hi='डीएवी कोयला नगर'):
+        self.key = key
+        # None: the WEBSITE_URL setting
+        self.website_url = website_url
+        self.data_dir = data_dir
+        self.hosts = [host.lower() for host in hosts]
+        self.embed_keys = list(embed_keys)
+        self.name = name
+        self.name_hi = name_hi
+
+    def __repr__(self):
+        return f"Site({self.key!r}, {self.website_url or 'WEBSITE_URL'}, data_dir={self.data_dir!r})"
+
+
+def load_sites(path=SITES_FILE):
+    """(sites by key, default key) from sites.json:
+
+        {"default": "koyla-nagar",
+         "sites": {"koyla-nagar": {"website_url": "http://davkoylanagar.com/", "data_dir": ".",
+                                   "hosts": ["chat.davkoylanagar.com"], "embed_keys": ["kn-widget"]},
+                   "dhanbad": {"website_url": "...", "name": "DAV Dhanbad", "hosts": [...]}}}
+
+    data_dir defaults to sites/<key>.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return {DEFAULT_SITE: Site(DEFAULT_SITE)}, DEFAULT_SITE
+
+    sites = {}
+    for key, entry in config.get('sites', {}).items():
+        entry = dict(entry)
+        entry.setdefault('data_dir', os.path.join('sites', key))
+        sites[key] = Site(key, **entry)
+    if not sites:
+        raise ValueError(f"{path} lists no sites")
+    default = config.get('default') or next(iter(sites))
+    if default not in sites:
+        raise ValueError(f"{path}: default site {default!r} is not listed")
+    return sites, default
+
+
+class TenantRegistry:
+    """Per-site knowledge bases, loaded on first use and unloaded least-recently-used under a memory cap.
+
+    open_site(site) builds the site's SimpleRAG; it must have memory_bytes() and stop().
+    """
+
+    def __init__(self, sites, default, open_site, memory_mb=TENANT_MEMORY_MB):
+        self.sites = sites
+        self.default = default
+        self.open_site = open_site
+        self.memory_cap = memory_mb * 1024 * 1024
+        self.by_host = {host: site.key for site in sites.values() for host in site.hosts}
+        self.by_embed_key = {embed_key: site.key for site in sites.values() for embed_key in site.embed_keys}
+        self.lock = threading.Lock()
+        self.loaded = OrderedDict()
+        # One lock per site, so a slow load does not hold up requests for other sites
+        self.loading = {}
+
+    def resolve(self, host=None, embed_key=None):
+        """Site key for a request: its embed key if known, else its host, else the default site"""
+        if embed_key in self.by_embed_key:
+            return self.by_embed_key[embed_key]
+        host = (host or '').split(':')[0].lower()
+        return self.by_host.get(host, self.default)
+
+    def is_embed_key(self, embed_key):
+        return embed_key in self.by_embed_key
+
+    def get(self, key=None):
+        """The loaded knowledge base of a site (by default the current request's), loading it if needed"""
+        key = key or current_site.get() or self.default
+        if key not in self.sites:
+            key = self.default
+
+        with self.lock:
+            if key in self.loaded:
+                self.loaded.move_to_end(key)
+                return self.loaded[key]
+            loading = self.loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self.lock:
+                if key in self.loaded:
+                    self.loaded.move_to_end(key)
+                    return self.loaded[key]
+
+            started = time.perf_counter()
+            site_rag = self.open_site(self.sites[key])
+            inc('davgpt_tenant_loads_total', site=key, event='loaded')
+
+            with self.lock:
+                self.loaded[key] = site_rag
+                evicted = self.evict(keep=key)
+                set_gauge('davgpt_tenants_loaded', len(self.loaded))
+
+        for old_key, old_rag in evicted:
+            old_rag.stop()
+            inc('davgpt_tenant_loads_total', site=old_key, event='evicted')
+            print(f"♻️ Unloaded site {old_key} (least recently used)")
+        print(f"🏫 Loaded site {key} in {time.perf_counter() - started:.1f}s")
+        return site_rag
+
+    def evict(self, keep):
+        """Drop least recently used sites until the rest fit the memory cap; call with the lock held"""
+        sizes = {key: site_rag.memory_bytes() for key, site_rag in self.loaded.items()}
+        total = sum(sizes.values())
+        evicted = []
+        for key in list(self.loaded):
+            if total <= self.memory_cap:
+                break
+            # The site just asked for stays, even when it alone is over the cap
+            if key == keep:
+                continue
+            evicted.append((key, self.loaded.pop(key)))
+            total -= sizes[key]
+        set_gauge('davgpt_tenant_memory_bytes', total)
+        return evicted
+
+    def loaded_sites(self):
+        with self.lock:
+            return list(self.loaded)
+
+    def site(self, key=None):
+        key = key or current_site.get() or self.default
+        return self.sites.get(key) or self.sites[self.default]
+
+
+if __name__ == '__main__':
+    sites, default = load_sites()
+    for site in sites.values():
+        marker = ' (default)' if site.key == default else ''
+        print(f"{site.key}{marker}: {site.website_url or 'WEBSITE_URL'} -> {site.data_dir}, "
+              f"hosts={site.hosts}, embed_keys={len(site.embed_keys)}")
@@ -0,0 +1,17 @@
+import time
+from datetime import datetime
+
+from conversation_log import to_utc
+
+
+def test_legacy_local_timestamps_become_naive_utc(monkeypatch):
+    monkeypatch.setenv('TZ', 'Asia/Kolkata')
+    time.tzset()
+    try:
+        assert to_utc('2026-10-19T15:30:00') == datetime(2026, 10, 19, 10, 0)
+        assert to_utc('2026-10-19T15:30:00+05:30') == datetime(2026, 10, 19, 10, 0)
+        assert to_utc('2026-10-19T10:00:00+00:00').tzinfo is None
+        assert to_utc(None) is None and to_utc('not a date') is None
+    finally:
+        monkeypatch.delenv('TZ')
+        time.tzset()
@@ -0,0 +1,20 @@
+from intents import IntentRouter
+
+router = IntentRouter()
+
+
+def test_school_hours_use_the_timings_fast_path():
+    for question in ('What are the school timings?', 'school hours on Saturday', 'office hours',
+                     'स्कूल का समय क्या है'):
+        assert router.classify(question).kind == 'timings', question
+
+
+def test_event_and_exam_times_are_not_school_timings():
+    for question in ('What time is the annual day function?', 'exam timings for class 10',
+                     'What time does the sports day start?'):
+        intent = router.classify(question)
+        assert intent.kind is None, question
+        # Still answered from the knowledge base
+        assert intent.school, question
+    # Hindi questions are routed again in English after translation
+    assert router.classify('परीक्षा का समय').kind is None
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+import pytest
+
+from profiler import SamplingProfiler
+
+
+def test_profiler_runs_on_threads(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path / 'control.json'), str(tmp_path / 'profiles'))
+    control = profiler.start(5, 50)
+    assert profiler.status()['active'] and control['percent'] == 50
+
+
+def test_profiler_refuses_gevent_workers(tmp_path):
+    pytest.importorskip('gevent')
+    script = (
+        "from gevent import monkey; monkey.patch_all()\n"
+        "from profiler import SamplingProfiler\n"
+        f"profiler = SamplingProfiler({str(tmp_path / 'control.json')!r}, {str(tmp_path / 'profiles')!r})\n"
+        "try:\n"
+        "    profiler.start(5)\n"
+        "except RuntimeError:\n"
+        "    print('refused')\n"
+    )
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=60)
+    assert 'refused' in result.stdout
+    assert not (tmp_path / 'control.json').exists()
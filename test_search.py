@@ -0,0 +1,31 @@
+import json
+
+from simple_rag import SimpleRAG
+from tenants import Site
+
+PAGES = [
+    {'url': 'http://davkoylanagar.com/', 'title': 'DAV Koyla Nagar', 'category': 'home',
+     'content': 'Welcome to DAV Koyla Nagar. The annual day event is celebrated every December with cultural programmes.'},
+    {'url': 'http://davkoylanagar.com/fees.html', 'title': 'Fee Structure', 'category': 'general',
+     'content': 'The fee structure for classes 1 to 12: tuition fee Rs 1500 per month, admission fee Rs 5000.'},
+]
+UPLOAD = [{'id': '1-0', 'title': 'Uploaded File: a.txt', 'category': 'uploaded_file', 'url': 'uploaded_file',
+           'filename': 'a.txt', 'upload_id': 1,
+           'content': 'What is the plan for the week? Structure your study time and keep your notebook tidy.'}]
+
+
+def make_rag(tmp_path):
+    # Legacy knowledge base (pages filed as home/general) plus an unrelated upload
+    (tmp_path / 'knowledge_base.json').write_text(json.dumps(PAGES))
+    (tmp_path / 'manual_data.json').write_text(json.dumps(UPLOAD))
+    rag = SimpleRAG(Site('test', data_dir=str(tmp_path)))
+    rag.stop()
+    return rag
+
+
+def test_topic_search_falls_back_when_only_uploads_match(tmp_path):
+    rag = make_rag(tmp_path)
+    fees, annual_day = rag.search_batch(['What is the fee structure?', 'When is the annual day event?'])
+    assert fees[0]['url'] == 'http://davkoylanagar.com/fees.html'
+    assert annual_day[0]['url'] == 'http://davkoylanagar.com/'
+    assert rag.topic_search('What is the fee structure?') == rag.search('What is the fee structure?')
@@ -0,0 +1,62 @@
+import os
+import queue
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import requests
+
+# Point at a LibreTranslate-compatible server (self-hosted, or the load-test fake) instead of googletrans
+TRANSLATE_API_BASE = os.getenv('TRANSLATE_API_BASE')
+TRANSLATE_TIMEOUT = float(os.getenv('TRANSLATE_TIMEOUT', '10'))
+
+
+class LibreTranslateClient:
+    """Client for a LibreTranslate-style API (/detect, /translate) with the googletrans interface"""
+
+    def __init__(self, base_url, timeout=TRANSLATE_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def detect(self, text):
+        response = self.session.post(f"{self.base_url}/detect", json={'q': text}, timeout=self.timeout)
+        response.raise_for_status()
+        best = max(response.json(), key=lambda item: item.get('confidence', 0))
+        return SimpleNamespace(lang=best['language'], confidence=best.get('confidence'))
+
+    def translate(self, text, src='auto', dest='en'):
+        response = self.session.post(f"{self.base_url}/translate", json={
+            'q': text,
+            'source': src,
+            'target': dest,
+            'format': 'text'
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        return SimpleNamespace(text=response.json()['translatedText'], src=src, dest=dest)
+
+
+def create_translator():
+    """googletrans by default; a LibreTranslate-style server when TRANSLATE_API_BASE is set"""
+    if TRANSLATE_API_BASE:
+        return LibreTranslateClient(TRANSLATE_API_BASE)
+    from googletrans import Translator
+    return Translator()
+
+
+class TranslatorPool:
+    """Hands each concurrent request its own translator; translator clients are not safe to share"""
+
+    def __init__(self, factory=create_translator):
+        self.factory = factory
+        self.idle = queue.LifoQueue()
+
+    @contextmanager
+    def borrow(self):
+        try:
+            translator = self.idle.get_nowait()
+        except queue.Empty:
+            translator = self.factory()
+        try:
+            yield translator
+        finally:
+            self.idle.put(translator)
@@ -0,0 +1,137 @@
+import json
+import os
+import subprocess
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# PDFs with fewer pages than this are extracted in the job thread; IPC would cost more than it saves
+PARALLEL_MIN_PAGES = int(os.getenv('UPLOAD_PARALLEL_MIN_PAGES', '32'))
+# Pages per extraction subprocess; with UPLOAD_PROCESSES batches in flight this bounds pages held in memory
+PAGE_BATCH = int(os.getenv('UPLOAD_PAGE_BATCH', '25'))
+MAX_PAGES = int(os.getenv('UPLOAD_MAX_PAGES', '500'))
+MAX_CHARS = int(os.getenv('UPLOAD_MAX_CHARS', '2000000'))
+CHUNK_CHARS = int(os.getenv('UPLOAD_CHUNK_CHARS', '1500'))
+
+
+def extract_pdf_pages(filepath, start, end):
+    """Extract text of pages [start, end)"""
+    import PyPDF2
+    with open(filepath, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[i].extract_text() or '' for i in range(start, end)]
+
+
+def iter_chunks(pieces, chunk_chars=CHUNK_CHARS):
+    """Group a stream of pages/paragraphs into chunks of roughly chunk_chars characters"""
+    buffer, size = [], 0
+    for piece in pieces:
+        piece = piece.strip()
+        # Oversized pieces (huge pages, single-line TXT files) are split on their own
+        while len(piece) > chunk_chars:
+            cut = piece.rfind(' ', 0, chunk_chars)
+            cut = cut if cut > chunk_chars // 2 else chunk_chars
+            if buffer:
+                yield '\n'.join(buffer)
+                buffer, size = [], 0
+            yield piece[:cut].strip()
+            piece = piece[cut:].strip()
+        if not piece:
+            continue
+        if size + len(piece) > chunk_chars and buffer:
+            yield '\n'.join(buffer)
+            buffer, size = [], 0
+        buffer.append(piece)
+        size += len(piece) + 1
+    if buffer:
+        yield '\n'.join(buffer)
+
+
+class UploadJobRunner:
+    """Runs document uploads in the background and extracts PDF pages on a process pool"""
+
+    def __init__(self, app, max_jobs=2, max_processes=None):
+        self.app = app
+        self.max_processes = max_processes or int(os.getenv('UPLOAD_PROCESSES', os.cpu_count() or 2))
+        self.jobs = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='upload-job')
+        # Each thread drives one extraction subprocess, bounding the number of processes
+        self.pages = ThreadPoolExecutor(max_workers=self.max_processes, thread_name_prefix='upload-pages')
+
+    def _extract_range_in_subprocess(self, filepath, start, end):
+        # A fresh interpreter instead of multiprocessing: fork is unsafe in a threaded server and
+        # spawn would re-import the app's __main__ module in every worker
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), filepath, str(start), str(end)],
+                                capture_output=True, check=True)
+        return json.loads(result.stdout)
+
+    def submit(self, job_id, handler, *args):
+        """Queue handler(job, *args) to run with an app context; its return value is the job message"""
+        self.jobs.submit(self._run, job_id, handler, *args)
+
+    def _run(self, job_id, handler, *args):
+        from models import db, UploadJob
+
+        with self.app.app_context():
+            job = db.session.get(UploadJob, job_id)
+            job.status = 'processing'
+            db.session.commit()
+            try:
+                job.message = handler(job, *args)
+                job.status = 'done'
+            except Exception as e:
+                traceback.print_exc()
+                db.session.rollback()
+                job = db.session.get(UploadJob, job_id)
+                job.status = 'error'
+                job.message = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+    def iter_pdf_pages(self, filepath, max_pages, stats):
+        """Yield page texts in order, keeping at most UPLOAD_PROCESSES batches in flight"""
+        import PyPDF2
+        with open(filepath, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            page_count = len(reader.pages)
+            stats['truncated'] = page_count > max_pages
+            page_count = min(page_count, max_pages)
+
+            if page_count < PARALLEL_MIN_PAGES:
+                for page in reader.pages[:page_count]:
+                    stats['pages'] += 1
+                    yield page.extract_text() or ''
+                return
+
+        ranges = iter((start, min(start + PAGE_BATCH, page_count)) for start in range(0, page_count, PAGE_BATCH))
+        in_flight = []
+        for start, end in ranges:
+            in_flight.append(self.pages.submit(self._extract_range_in_subprocess, filepath, start, end))
+            if len(in_flight) >= self.max_processes:
+                break
+        while in_flight:
+            pages = in_flight.pop(0).result()
+            next_range = next(ranges, None)
+            if next_range:
+                in_flight.append(self.pages.submit(self._extract_range_in_subprocess, filepath, *next_range))
+            for text in pages:
+                stats['pages'] += 1
+                yield text
+
+    def iter_document_text(self, filepath, file_ext, stats, max_pages=MAX_PAGES):
+        """Yield a document one page (PDF), paragraph (DOCX) or line (TXT) at a time"""
+        if file_ext == '.pdf':
+            yield from self.iter_pdf_pages(filepath, max_pages, stats)
+
+        elif file_ext == '.docx':
+            from docx import Document
+            for paragraph in Document(filepath).paragraphs:
+                yield paragraph.text
+
+        elif file_ext == '.txt':
+            with open(filepath, 'r', encoding='utf-8', errors='replace') as file:
+                yield from file
+
+if __name__ == '__main__':
+    # Page-range worker: upload_jobs.py <pdf> <start> <end> prints the pages as a JSON list
+    json.dump(extract_pdf_pages(sys.argv[1], int(sys.argv[2]), int(sys.argv[3])), sys.stdout)